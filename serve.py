@@ -1,53 +1,495 @@
+import hmac
+import os
+import threading
 import uuid
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, List, Optional, Tuple
+from fastapi import FastAPI, Request, Form, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from src.graph.graph import build_workflow
+from src.serving.startup import StartupProfiler
 
-workflow = build_workflow()
-chain_app = workflow.compile()
+startup_profiler = StartupProfiler()
 
-# In-memory chat history (for demo; use persistent storage in production)
-chat_histories = {}
+with startup_profiler.phase("imports"):
+    from src.graph.backends import get_client, load_backends
+    from src.graph.checkpoint import (delete_thread, history_input, interrupt_value, open_checkpointer,
+                                      pending_clarification, thread_config)
+    from src.graph.config import ConfigError, GraphProfile, load_config
+    from src.graph.graph import build_workflow
+    from src.graph.deadline import new_deadline
+    from src.graph.history import ChatHistory, Sender
+    from src.graph.recording import Recorder, recording_backends
+    from src.serving.admission import AdmissionController, AdmissionRejected
+    from src.serving.memory import MEMORY_TOP, MemoryProfiler, session_memory
+    from src.serving.refresh import HOT_QUESTIONS_FILE, HotQuestions, RefreshScheduler, load_seed_questions
+    from src.serving.result_cache import ResultCache
+    from src.serving.sessions import SessionStore
+    from src.serving.streaming import stream_in_thread
 
-app = FastAPI(title="LangGraph Chat Bot API", version="1.0")
+# Backend registry for this deployment; GRAPH_BACKENDS=package.module:factory swaps it without code edits
+backends = load_backends()
+
+# Graph profiles from config.yaml (GRAPH_CONFIG), validated once at startup; a request picks one by name
+graph_config = load_config()
+
+# Record mode (RECORD_TRACES=traces.jsonl.gz): every request and the external calls it makes are written out
+# for offline replay with `python -m src.graph.replay`
+recorder = Recorder.from_env()
+
+# Compiled graph per profile, built at application startup (or on first use) rather than at import time
+chain_apps: Optional[dict] = None
+# Backend registry per profile: the profile picks the models and retriever limits of the shared clients
+profile_backends: dict = {}
+_chain_app_lock = threading.Lock()
+
+
+def backends_for(profile: GraphProfile):
+    """
+    Returns the backend registry of a profile, recording its calls in record mode.
+    """
+    registry = profile_backends.get(profile.name)
+    if registry is None:
+        registry = backends.with_profile(profile)
+        if recorder.enabled:
+            registry = recording_backends(registry)
+        registry = profile_backends.setdefault(profile.name, registry)
+    return registry
+
+
+def get_chain_app(profile: Optional[str] = None):
+    """
+    Returns the compiled graph of a profile (the default profile when None), compiling all of them on first use.
+    :raises ConfigError: When there is no profile with that name
+    """
+    global chain_apps
+    name = graph_config.profile(profile).name
+    if chain_apps is None:
+        with _chain_app_lock:
+            if chain_apps is None:
+                with startup_profiler.phase("compile_graph"):
+                    # With a checkpointer (CHECKPOINT_DB) a run paused for clarification resumes on the next message
+                    checkpointer = open_checkpointer()
+                    chain_apps = {
+                        key: build_workflow(backends_for(config), resumable=checkpointer is not None,
+                                            profile=config).compile(checkpointer=checkpointer)
+                        for key, config in graph_config.profiles.items()
+                    }
+    return chain_apps[name]
+
+
+# Sessions are dropped from chat_histories inside the request handlers, i.e. on the event loop, so their
+# checkpoints are deleted in batches on one background thread rather than with SQLite writes on the loop
+_forgotten_sessions: List[str] = []
+_forgotten_lock = threading.Lock()
+_checkpoint_cleanup = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-cleanup")
+
+
+def forget_session(session_id: str):
+    """
+    Queues the deletion of the checkpoints a session evicted from chat_histories left behind in the graph of every
+    profile, e.g. of a run paused for a clarification that never came, so the checkpoint database stays as bounded
+    as the store.
+    """
+    if chain_apps is None:
+        return
+    with _forgotten_lock:
+        _forgotten_sessions.append(session_id)
+        # Otherwise a queued batch has not started yet and picks this session up too
+        schedule = len(_forgotten_sessions) == 1
+    if schedule:
+        _checkpoint_cleanup.submit(_delete_forgotten_checkpoints)
+
+
+def _delete_forgotten_checkpoints():
+    with _forgotten_lock:
+        session_ids = list(_forgotten_sessions)
+        _forgotten_sessions.clear()
+    for session_id in session_ids:
+        for profile, graph in chain_apps.items():
+            delete_thread(graph, session_id, profile)
+
+
+def flush_forgotten_sessions():
+    """
+    Waits until the checkpoints of every session forgotten so far are deleted.
+    """
+    _checkpoint_cleanup.submit(lambda: None).result()
+
+
+# In-memory chat history (for demo; use persistent storage in production), bounded by SESSION_MAX and
+# SESSION_IDLE_TTL_SECONDS
+chat_histories = SessionStore(on_evict=forget_session)
+
+# Opt-in tracemalloc profiling (MEMORY_PROFILE=1), reported on /debug/memory
+memory_profiler = MemoryProfiler()
+
+# Bounds the number of graph runs in flight and keeps one message per session at a time
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "32")),
+    session_policy=os.getenv("CHAT_SESSION_POLICY", "wait"),
+)
+
+# Exact answer cache for a repeated question in the same context, e.g. refreshes and client retries
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "600")),
+    history_turns=int(os.getenv("RESULT_CACHE_HISTORY_TURNS", "4")),
+)
+
+# Ask counts of the questions that open a session; the most asked ones are kept fresh in the answer cache by the
+# refresh scheduler started with the application (HOT_QUESTIONS_TOP_N, REFRESH_AHEAD_SECONDS)
+hot_questions = HotQuestions()
+refresher: Optional[RefreshScheduler] = None
+
+# Token for the /admin endpoints (sent as X-Admin-Token); they are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Overall budget for one /chat request; nodes skip optional steps as it runs out
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "45"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global refresher
+    await run_in_threadpool(get_chain_app)
+    if os.getenv("WARM_UP_CLIENTS", "1").lower() in ("1", "true", "yes"):
+        with startup_profiler.phase("warm_up_clients"):
+            for name in graph_config.profiles:
+                await run_in_threadpool(backends_for(graph_config.profile(name)).warm_up)
+    startup_profiler.log()
+    memory_profiler.start()
+    # Questions listed in HOT_QUESTIONS_FILE are answered right after startup and kept fresh like hot ones
+    hot_questions.seed(load_seed_questions(HOT_QUESTIONS_FILE, graph_config.default_profile, graph_config.profiles))
+    refresher = RefreshScheduler(hot_questions, result_cache, refresh_answer, admission.has_capacity)
+    refresher.start()
+    yield
+    await refresher.stop()
+    memory_profiler.stop()
+    recorder.close()
+    backends.router.save()
+
+
+app = FastAPI(title="LangGraph Chat Bot API", version="1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+
+@app.exception_handler(ConfigError)
+async def unknown_profile_handler(request: Request, exc: ConfigError):
+    return ORJSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return ORJSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/", response_class=HTMLResponse)
 async def get_chat(request: Request, session_id: str = None):
     if not session_id:
         session_id = str(uuid.uuid4())
-        chat_histories[session_id] = []
-    history = chat_histories.get(session_id, [])
-    return templates.TemplateResponse("index.html", {"request": request, "session_id": session_id, "history": history})
-
-@app.post("/chat", response_class=JSONResponse)
-async def post_chat_api(user_message: str = Form(...), session_id: str = Form(...)):
-    # Process the user's message through your LangGraph chain
-    state = {
-        "chat_history": chat_histories.get(session_id, []),
+        chat_histories[session_id] = ChatHistory()
+    history = chat_histories.get(session_id, ChatHistory())
+    return templates.TemplateResponse(request, "index.html", {"session_id": session_id, "history": history})
+
+def initial_state(graph, history: ChatHistory, user_message: str, session_id: str) -> dict:
+    """
+    Builds the graph input for one user message.
+    """
+    return {
+        "chat_history": history_input(graph, history),
         "original_question": user_message,
         "clarified_question": None,
+        "query_variants": [],
         "wikipedia_docs": [],
         "web_docs": [],
         "reranked_docs": [],
         "final_answer": None,
+        "wikipedia_sufficient": None,
         "needs_clarification": False,
+        "clarification_answer": None,
+        "first_source": None,
+        "routed_at": None,
         "session_id": session_id,
+        "deadline": new_deadline(REQUEST_DEADLINE_SECONDS),
+    }
+
+
+def graph_input(history: ChatHistory, user_message: str, session_id: str, profile: str) -> Tuple[str, Any]:
+    """
+    Builds the graph input for one user message: a reply that resumes the session's paused run when it is
+    waiting on a clarification, otherwise a fresh state.
+    Every state key is set for a fresh run, since checkpointed channels would otherwise carry over from the
+    session's previous question.
+    :param profile: Requested profile
+    :return: The profile to run under and the input. A paused run is resumed under the profile that paused it,
+             whichever profile the reply asked for, so its thread is not left behind in the other graph.
+    """
+    get_chain_app(profile)
+    for name in [profile] + [name for name in chain_apps if name != profile]:
+        graph = chain_apps[name]
+        if pending_clarification(graph, session_id, name) is not None:
+            from langgraph.types import Command
+            return name, Command(resume=user_message,
+                                 update={"chat_history": history_input(graph, history),
+                                         "deadline": new_deadline(REQUEST_DEADLINE_SECONDS)})
+    return profile, initial_state(chain_apps[profile], history, user_message, session_id)
+
+
+def trace_inputs(state, history: ChatHistory, user_message: str, profile: str) -> dict:
+    """
+    Returns what replay needs to rebuild the graph input of a request.
+    """
+    return {
+        "user_message": user_message,
+        "chat_history": history.to_list(),
+        "deadline_seconds": REQUEST_DEADLINE_SECONDS,
+        "resume": not isinstance(state, dict),
+        "profile": profile,
     }
-    result = chain_app.invoke(state)
-    # Update chat history
-    history = chat_histories.setdefault(session_id, [])
-    history.append({"sender": "User", "message": user_message})
-    bot_message = result.get("final_answer", "No answer generated.")
-    history.append({"sender": "Bot", "message": bot_message})
-    return JSONResponse(content={"bot_message": bot_message, "chat_history": history, "session_id": session_id})
+
+
+def cache_key(state, history: ChatHistory, user_message: str, profile: str) -> Optional[str]:
+    """
+    Returns the result cache key for a fresh run, or None when the result must not come from the cache.
+    """
+    # A reply that resumes a paused clarification depends on the paused run, not only on the message
+    if not result_cache.enabled or not isinstance(state, dict):
+        return None
+    # Profiles answer with different models and evidence, so each keeps its own answers
+    return result_cache.key(user_message, history, namespace=profile)
+
+
+def track_question(key: Optional[str], history: ChatHistory, user_message: str, profile: str):
+    """
+    Counts a session's first question for the refresh scheduler; later questions depend on their conversation,
+    so their answers are not shared between sessions.
+    """
+    if key and not len(history):
+        hot_questions.record(user_message, profile)
+
+
+async def refresh_answer(question: str, profile: str) -> bool:
+    """
+    Answers a hot question as the first message of a new session and caches the answer, for the refresh scheduler.
+    :return: Whether the answer was cached
+    """
+    session_id = f"refresh-{uuid.uuid4()}"
+    history = ChatHistory()
+    graph = get_chain_app(profile)
+    async with admission.admit(session_id):
+        result = await run_in_threadpool(graph.invoke, initial_state(graph, history, question, session_id),
+                                         thread_config(session_id, profile))
+    # The run is not a real session, so its checkpoints are not kept
+    await run_in_threadpool(delete_thread, graph, session_id, profile)
+    return result_cache.put(result_cache.key(question, history, namespace=profile), question, result)
+
+
+def release_checkpoints(graph, session_id: str, profile: str, result: dict):
+    """
+    Deletes the checkpoints of a run that finished or failed. Only a run paused for a clarification needs its
+    checkpoints to resume, so the checkpoint database holds the paused sessions rather than every session ever served.
+    :param result: Output of the run; empty when it raised or its stream was aborted
+    """
+    if interrupt_value(result) is None:
+        delete_thread(graph, session_id, profile)
+
+
+def record_turn(history: ChatHistory, user_message: str, result: dict) -> dict:
+    """
+    Appends the user message and the bot answer to the history.
+    :return: The bot message and the new turns, ready to send to the client
+    """
+    first_new = len(history)
+    history.append(Sender.USER, user_message)
+    # A run paused for clarification answers with the clarification question
+    paused = interrupt_value(result)
+    if paused is not None:
+        bot_message = paused["clarification"]
+    else:
+        bot_message = result.get("final_answer") or "No answer generated."
+    history.append(Sender.BOT, bot_message)
+    # Only the turns added by this request are returned, so the payload stays constant per turn;
+    # older turns are available from /history
+    return {"bot_message": bot_message, "new_turns": history.to_list(first_new), "turn_count": len(history),
+            "awaiting_clarification": paused is not None}
+
+
+@app.post("/chat")
+async def post_chat_api(user_message: str = Form(...), session_id: str = Form(...), full_history: bool = Form(False),
+                        profile: Optional[str] = Form(None)):
+    # Unknown profiles are rejected (400) before the request takes an admission slot
+    profile = graph_config.profile(profile).name
+    async with admission.admit(session_id):
+        # Process the user's message through your LangGraph chain; the state is built inside
+        # the slot so a queued message sees the previous turn's history
+        history = chat_histories.setdefault(session_id, ChatHistory())
+        profile, state = await run_in_threadpool(graph_input, history, user_message, session_id, profile)
+        graph = get_chain_app(profile)
+        key = cache_key(state, history, user_message, profile)
+        track_question(key, history, user_message, profile)
+        with recorder.trace(session_id, trace_inputs(state, history, user_message, profile)) as trace:
+            result = result_cache.get(key) if key else None
+            cached = result is not None
+            if not cached:
+                result = {}
+                try:
+                    # The graph is synchronous; run it off the event loop so other requests keep flowing
+                    result = await run_in_threadpool(graph.invoke, state, thread_config(session_id, profile))
+                finally:
+                    await run_in_threadpool(release_checkpoints, graph, session_id, profile, result)
+                if key:
+                    result_cache.put(key, user_message, result)
+            trace.finish(result, cached)
+        content = dict(record_turn(history, user_message, result), session_id=session_id, cached=cached,
+                       profile=profile)
+    if full_history:
+        content["chat_history"] = history.to_list()
+    return ORJSONResponse(content=content)
+
+async def stream_run(websocket: WebSocket, graph, state, session_id: str, profile: str) -> dict:
+    """
+    Runs the graph, forwarding node completions and answer tokens to the WebSocket.
+    :return: The accumulated node updates, including "__interrupt__" when the run paused
+    """
+    result = {}
+    # aclosing: when a send fails (the client left), the graph is stopped and waited for before the admission
+    # slot is released
+    async with aclosing(stream_in_thread(graph.stream, state, thread_config(session_id, profile),
+                                         stream_mode=["updates", "messages"])) as stream:
+        async for mode, chunk in stream:
+            if mode == "updates":
+                for node, update in chunk.items():
+                    if node == "__interrupt__":
+                        result[node] = update
+                        continue
+                    await websocket.send_json({"type": "progress", "node": node})
+                    if isinstance(update, dict):
+                        result.update(update)
+            else:
+                message, metadata = chunk
+                if metadata.get("langgraph_node") == "generate_answer" and message.content:
+                    await websocket.send_json({"type": "token", "content": message.content})
+    return result
+
+
+@app.websocket("/ws/{session_id}")
+async def chat_websocket(websocket: WebSocket, session_id: str):
+    """
+    Persistent chat connection for one session. The client sends {"message": "...", "profile": "..."} frames
+    (profile optional) and receives "progress" (node finished), "token" (answer chunk), "answer" and "error" frames.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            # Looked up per message: the session may have been evicted (or cleared) while the connection sat idle
+            history = chat_histories.setdefault(session_id, ChatHistory())
+            user_message = (payload.get("message") or "").strip() if isinstance(payload, dict) else ""
+            if not user_message:
+                await websocket.send_json({"type": "error", "detail": "Empty message"})
+                continue
+            try:
+                profile = graph_config.profile(payload.get("profile")).name
+            except ConfigError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            try:
+                async with admission.admit(session_id):
+                    profile, state = await run_in_threadpool(graph_input, history, user_message, session_id,
+                                                             profile)
+                    graph = get_chain_app(profile)
+                    key = cache_key(state, history, user_message, profile)
+                    track_question(key, history, user_message, profile)
+                    with recorder.trace(session_id, trace_inputs(state, history, user_message, profile)) as trace:
+                        result = result_cache.get(key) if key else None
+                        cached = result is not None
+                        if not cached:
+                            result = {}
+                            try:
+                                result = await stream_run(websocket, graph, state, session_id, profile)
+                            finally:
+                                # Also when the client left mid-stream: the aborted run's checkpoints are dropped
+                                await run_in_threadpool(release_checkpoints, graph, session_id, profile, result)
+                            if key:
+                                result_cache.put(key, user_message, result)
+                        trace.finish(result, cached)
+                    content = dict(record_turn(history, user_message, result), cached=cached, profile=profile)
+            except AdmissionRejected as e:
+                await websocket.send_json({"type": "error", "detail": str(e), "reason": e.reason,
+                                           "retry_after": e.retry_after})
+                continue
+            await websocket.send_json(dict(content, type="answer", session_id=session_id))
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/history")
+async def get_history(session_id: str, before: Optional[int] = Query(None, ge=0), limit: int = Query(20, ge=1, le=200)):
+    history = chat_histories.get(session_id, ChatHistory())
+    turns, next_before = history.page(before, limit)
+    return ORJSONResponse(content={
+        "session_id": session_id,
+        "turns": turns,
+        "next_before": next_before,
+        "turn_count": len(history),
+    })
+
+def require_admin(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.delete("/admin/cache")
+async def purge_result_cache(question: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Purges the answer cache, or only the entries for one question. Requires the X-Admin-Token header.
+    """
+    require_admin(x_admin_token)
+    return ORJSONResponse(content={"purged": result_cache.purge(question)})
+
+@app.get("/debug/memory")
+async def get_memory(snapshot: bool = False, top: int = Query(MEMORY_TOP, ge=1, le=100),
+                     x_admin_token: Optional[str] = Header(None)):
+    """
+    Reports process memory, the top allocation sites when MEMORY_PROFILE is on, and the memory held per chat
+    session. Requires the X-Admin-Token header.
+    :param snapshot: Take a fresh tracemalloc snapshot instead of reporting the latest periodic one
+    """
+    require_admin(x_admin_token)
+    if snapshot:
+        await run_in_threadpool(memory_profiler.snapshot)
+    report = await run_in_threadpool(memory_profiler.report, top)
+    # Measuring walks every history, so it runs off the event loop too
+    report["sessions"] = dict(await run_in_threadpool(session_memory, chat_histories.items(), top),
+                              store=chat_histories.metrics())
+    report["result_cache_entries"] = result_cache.metrics()["entries"]
+    return ORJSONResponse(content=report)
+
+@app.get("/metrics")
+async def get_metrics():
+    return ORJSONResponse(content={
+        "admission": admission.metrics(),
+        "coalescing": {name: registry.metrics() for name, registry in profile_backends.items()},
+        "clarity": backends.clarity.metrics(),
+        "entities": backends.entities.metrics(),
+        "routing": backends.router.metrics(),
+        "result_cache": result_cache.metrics(),
+        "refresh": refresher.metrics() if refresher is not None else None,
+        "sessions": chat_histories.metrics(),
+        "http": get_client("http_client").metrics(),
+        "startup": startup_profiler.report(),
+    })
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,233 @@
+"""
+This module contains the Backends registry, which holds the external backends (LLMs per role,
+retrievers, reranker, logger) the graph nodes use. build_workflow binds a registry into every
+node, so deployments and benchmark runs can swap backends without monkeypatching.
+"""
+import importlib
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from logger.logger import CustomLogger
+from src.graph.clarity import ClarityClassifier
+from src.graph.entities import EntityIndex
+from src.graph.http_pool import client_from_env, route_requests
+from src.graph.rate_limit import (
+    DEFAULT_RETRY_POLICY,
+    OPENAI_LIMITER,
+    TAVILY_LIMITER,
+    WIKIPEDIA_LIMITER,
+    RateLimitedClient,
+    estimate_tokens,
+)
+from src.graph.routing import SourceRouter
+from src.graph.singleflight import SingleFlight
+
+
+def _build_llm(model: str = "gpt-4-turbo"):
+    # langchain_openai pulls in the whole openai SDK; import it only when the LLM is first needed
+    from langchain_openai import ChatOpenAI
+    # Retries are left to DEFAULT_RETRY_POLICY, whose backoff respects the request deadline; the SDK's own retries
+    # would multiply its attempts
+    return RateLimitedClient(ChatOpenAI(model=model, max_retries=0), OPENAI_LIMITER, DEFAULT_RETRY_POLICY,
+                             estimate_tokens)
+
+
+def _build_wikipedia(top_k_results: int = 2):
+    from langchain_community.utilities import WikipediaAPIWrapper
+    # The wikipedia package calls requests.get itself; route it over the shared keep-alive pool
+    route_requests("wikipedia.wikipedia", get_client("http_client"))
+    return RateLimitedClient(WikipediaAPIWrapper(top_k_results=top_k_results), WIKIPEDIA_LIMITER,
+                             DEFAULT_RETRY_POLICY)
+
+
+def _build_web_search(k: int = 5):
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    # The Tavily wrapper calls requests.post itself; route it over the shared keep-alive pool
+    route_requests("langchain_community.utilities.tavily_search", get_client("http_client"))
+    # TavilySearchResults ignores k; max_results is the parameter it sends
+    return RateLimitedClient(TavilySearchResults(max_results=k), TAVILY_LIMITER, DEFAULT_RETRY_POLICY)
+
+
+# Shared production clients, built on first use behind client-side rate limiting and retries;
+# the retrieval tools share one pooled keep-alive HTTP client. Clients built with different options (e.g. the
+# model of a graph profile) are shared per set of options; the rate limiters are shared by all of them
+_CLIENT_FACTORIES = {
+    "http_client": client_from_env,
+    "llm": _build_llm,
+    "wikipedia": _build_wikipedia,
+    "web_search": _build_web_search,
+    "clarity": ClarityClassifier,
+    "entities": EntityIndex.from_env,
+    "router": SourceRouter.from_env,
+}
+_clients = {}
+_clients_lock = threading.RLock()
+
+
+def get_client(name: str, **options):
+    """
+    Returns the shared client with the given name, constructing it on first use.
+    :param name: One of "http_client", "llm", "wikipedia", "web_search", "clarity", "entities" or "router"
+    :param options: Factory arguments, e.g. model="gpt-4o-mini" for "llm"
+    :return: The shared client
+    """
+    key = (name, tuple(sorted(options.items()))) if options else name
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _CLIENT_FACTORIES[name](**options)
+    return client
+
+
+class Backends:
+    """
+    Registry of the backends used by the graph nodes.
+
+    Attributes:
+        llms: LLM per node role (see ROLES); roles without an entry use the default llm
+        wikipedia: Wikipedia retriever with a run(query) -> List[str] method
+        web_search: Web retriever with an invoke(query) -> List[dict] method
+        local: Optional local knowledge base retriever with an invoke(query) -> List[Document] method, e.g. the
+            Chroma retriever built by ChromaIngestion; it is queried alongside Wikipedia when set
+        reranker: Optional callable (query, docs) -> docs; the LLM ranking prompt is used when unset
+        logger: Object with a log_message(session_id, node, message) method
+        clarity: Local classifier that lets detect_ambiguity skip the LLM for clear questions
+        entities: Index of the meanings of ambiguous entity names that lets clarify_question skip the LLM
+        router: Chooses whether retrieval starts with Wikipedia or web search, learning from grading outcomes
+        profile: Optional graph profile (see src/graph/config.py) choosing the models and retriever limits of
+            the shared clients; backends passed in explicitly are used as they are
+        retrieval_flight: Deduplicates concurrent identical retrievals
+        answer_flight: Deduplicates concurrent identical answer generations
+    """
+    ROLES = ("detect_ambiguity", "clarify", "process_clarification", "transform", "expand", "grade", "rerank",
+             "generate")
+
+    def __init__(self, llm: Any = None, llms: Optional[Dict[str, Any]] = None, wikipedia: Any = None,
+                 web_search: Any = None, local: Any = None, reranker: Optional[Callable[[str, List], List]] = None,
+                 logger: Any = CustomLogger, clarity: Optional[ClarityClassifier] = None, router: Optional[SourceRouter] = None,
+                 profile: Any = None, entities: Optional[EntityIndex] = None):
+        unknown = set(llms or {}) - set(self.ROLES)
+        if unknown:
+            raise ValueError(f"Unknown LLM roles: {sorted(unknown)}")
+        self._llm = llm
+        self.llms = dict(llms or {})
+        self._wikipedia = wikipedia
+        self._web_search = web_search
+        self.local = local
+        self.reranker = reranker
+        self.logger = logger
+        self._clarity = clarity
+        self._entities = entities
+        self._router = router
+        self.profile = profile
+        self.retrieval_flight = SingleFlight("retrieval")
+        self.answer_flight = SingleFlight("answer")
+
+    # Unset backends fall back to the shared production clients, resolved on first use
+
+    @property
+    def llm(self) -> Any:
+        if self._llm is not None:
+            return self._llm
+        if self.profile is not None:
+            return get_client("llm", model=self.profile.models.default)
+        return get_client("llm")
+
+    @property
+    def wikipedia(self) -> Any:
+        if self._wikipedia is not None:
+            return self._wikipedia
+        if self.profile is not None:
+            return get_client("wikipedia", top_k_results=self.profile.retrieval.wikipedia_top_k)
+        return get_client("wikipedia")
+
+    @property
+    def web_search(self) -> Any:
+        if self._web_search is not None:
+            return self._web_search
+        if self.profile is not None:
+            return get_client("web_search", k=self.profile.retrieval.web_k)
+        return get_client("web_search")
+
+    @property
+    def clarity(self) -> ClarityClassifier:
+        return self._clarity if self._clarity is not None else get_client("clarity")
+
+    @property
+    def entities(self) -> EntityIndex:
+        return self._entities if self._entities is not None else get_client("entities")
+
+    @property
+    def router(self) -> SourceRouter:
+        return self._router if self._router is not None else get_client("router")
+
+    def llm_for(self, role: str) -> Any:
+        """
+        Returns the LLM configured for a node role, or the default LLM.
+        """
+        llm = self.llms.get(role)
+        if llm is None and self._llm is None and self.profile is not None:
+            return get_client("llm", model=self.profile.models.for_role(role))
+        return llm or self.llm
+
+    def with_profile(self, profile: Any) -> "Backends":
+        """
+        Returns a registry for a graph profile that shares this registry's backends, reranker, logger, clarity
+        classifier, entity index and router; only the shared clients it falls back to follow the profile.
+        Coalescing is kept per profile, since the same query can return different results under different limits
+        and models.
+        """
+        return Backends(llm=self._llm, llms=self.llms, wikipedia=self._wikipedia, web_search=self._web_search,
+                        local=self.local, reranker=self.reranker, logger=self.logger, clarity=self._clarity,
+                        router=self._router, profile=profile, entities=self._entities)
+
+    def warm_up(self):
+        """
+        Resolves every backend up front, e.g. from the application startup event.
+        """
+        # Reading the properties constructs any shared client that has not been built yet
+        _ = (self.llm, self.wikipedia, self.web_search)
+        self.clarity.warm_up()
+        self.entities.warm_up()
+
+    def metrics(self) -> dict:
+        return {
+            "retrieval": self.retrieval_flight.metrics(),
+            "answer": self.answer_flight.metrics(),
+        }
+
+
+_default_backends: Optional[Backends] = None
+
+
+def default_backends() -> Backends:
+    """
+    Returns the process-wide registry backed by the shared production clients.
+    """
+    global _default_backends
+    if _default_backends is None:
+        with _clients_lock:
+            if _default_backends is None:
+                _default_backends = Backends()
+    return _default_backends
+
+
+def load_backends(spec: Optional[str] = None) -> Backends:
+    """
+    Loads a registry from a "package.module:factory" spec, e.g. from the GRAPH_BACKENDS environment variable.
+    :param spec: Import path of a zero-argument callable returning Backends; None for the default registry
+    :return: The registry
+    """
+    spec = spec if spec is not None else os.getenv("GRAPH_BACKENDS")
+    if not spec:
+        return default_backends()
+    module_name, _, factory_name = spec.partition(":")
+    if not factory_name:
+        raise ValueError(f"Backend spec must look like 'package.module:factory', got {spec!r}")
+    backends = getattr(importlib.import_module(module_name), factory_name)()
+    if not isinstance(backends, Backends):
+        raise TypeError(f"{spec} returned {type(backends).__name__}, expected Backends")
+    return backends
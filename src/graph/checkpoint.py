@@ -0,0 +1,86 @@
+"""
+This module contains the SQLite checkpointer that persists graph state per session, so a run paused for a
+clarification can be resumed at the node that asked for it.
+"""
+import os
+import sqlite3
+from typing import List, Optional, Union
+
+from src.graph.history import ChatHistory
+
+# SQLite file holding the checkpoints; checkpointing is off unless a path is given
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "")
+
+
+def open_checkpointer(path: Optional[str] = CHECKPOINT_DB):
+    """
+    Opens the SQLite checkpointer for the graph.
+    :param path: SQLite database path (":memory:" for a throwaway store); empty or "off" disables checkpointing
+    :return: The checkpointer, or None when checkpointing is disabled
+    """
+    if not path or path.lower() in ("0", "off", "false", "none"):
+        return None
+    # Imported here so importing serve.py stays cheap until the graph is compiled
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    # The saver serializes access with its own lock; the connection is shared by the threadpool workers
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSaver(conn)
+
+
+def history_input(graph, history: ChatHistory) -> Union[ChatHistory, List[dict]]:
+    """
+    Returns the chat history in the form the graph input carries it. The state's chat_history channel is never
+    checkpointed, but a checkpointing graph still writes its input to the database, so there the turns are passed
+    as plain dicts; the nodes read either form through ChatHistory.coerce.
+    :param graph: Graph compiled with or without a checkpointer
+    :param history: The session's history
+    """
+    if getattr(graph, "checkpointer", None) is None:
+        return history
+    return history.to_list()
+
+
+def thread_config(session_id: str, profile: Optional[str] = None) -> dict:
+    """
+    Returns the run config that keys the checkpoints on the session.
+    :param session_id: Session ID
+    :param profile: Graph profile the session runs under; each profile's graph keeps its own checkpoints
+    """
+    return {"configurable": {"thread_id": f"{profile}/{session_id}" if profile else session_id}}
+
+
+def interrupt_value(result: dict) -> Optional[dict]:
+    """
+    Returns the value of the interrupt that paused the run, or None when the run finished.
+    :param result: Graph output (or the accumulated stream updates) of the run
+    """
+    interrupts = result.get("__interrupt__")
+    return interrupts[0].value if interrupts else None
+
+
+def pending_clarification(graph, session_id: str, profile: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the clarification question the session's paused run is waiting on, or None.
+    :param graph: Graph compiled with a checkpointer
+    :param session_id: Session ID
+    :param profile: Graph profile the graph was built for
+    """
+    if getattr(graph, "checkpointer", None) is None:
+        return None
+    snapshot = graph.get_state(thread_config(session_id, profile))
+    for pending in snapshot.interrupts:
+        return pending.value.get("clarification")
+    return None
+
+
+def delete_thread(graph, session_id: str, profile: Optional[str] = None):
+    """
+    Deletes the checkpoints of a session, e.g. of a one-off background run. Does nothing without a checkpointer.
+    :param graph: Graph compiled with or without a checkpointer
+    :param session_id: Session ID
+    :param profile: Graph profile the graph was built for
+    """
+    checkpointer = getattr(graph, "checkpointer", None)
+    if checkpointer is not None:
+        checkpointer.delete_thread(thread_config(session_id, profile)["configurable"]["thread_id"])
@@ -0,0 +1,171 @@
+"""
+This module contains the ClarityClassifier, a local pre-check that lets detect_ambiguity skip its LLM
+call for questions that are confidently clear.
+"""
+import os
+import re
+import threading
+from typing import Tuple
+
+# Minimum model probability of "clear" before the LLM ambiguity check is skipped
+CLARITY_THRESHOLD = float(os.getenv("CLARITY_THRESHOLD", "0.7"))
+
+# Questions shorter than this are left to the LLM; they rarely carry enough context to be unambiguous
+MIN_WORDS = 4
+
+# Pronouns that point back into the conversation ("When was he born?")
+_REFERENCES = {"it", "its", "he", "him", "his", "she", "her", "hers", "they", "them", "their", "theirs",
+               "this", "these", "those"}
+
+_WORD = re.compile(r"[A-Za-z0-9][\w'-]*")
+
+# Seed training data: self-contained questions vs. questions an assistant would need to clarify
+CLEAR_EXAMPLES = (
+    "What is the capital of France?",
+    "When was the Eiffel Tower built?",
+    "Who wrote the novel Pride and Prejudice?",
+    "How tall is Mount Everest in meters?",
+    "What year did World War II end?",
+    "Where is the headquarters of Tesla, Inc. located?",
+    "Who is the current CEO of Microsoft?",
+    "What is the population of Tokyo?",
+    "When did Apollo 11 land on the Moon?",
+    "What is the boiling point of water at sea level?",
+    "Who painted the Mona Lisa?",
+    "What language is spoken in Brazil?",
+    "How many moons does Jupiter have?",
+    "What is the chemical symbol for gold?",
+    "Who discovered penicillin in 1928?",
+    "What is the longest river in Africa?",
+    "When was the Python programming language first released?",
+    "Which company manufactures the iPhone?",
+    "What is the speed of light in a vacuum?",
+    "Who was the first president of the United States?",
+    "In which city is the Colosseum located?",
+    "What currency is used in Japan?",
+    "How many players are on a FIFA football team?",
+    "What did Marie Curie win the Nobel Prize for?",
+    "When did the Berlin Wall fall?",
+    "What is the tallest building in Dubai?",
+    "Who founded the company Amazon?",
+    "What is the main ingredient of Japanese miso soup?",
+    "How long is the Great Wall of China?",
+    "Which planet is closest to the Sun?",
+)
+AMBIGUOUS_EXAMPLES = (
+    "What about it?",
+    "Where is Tesla?",
+    "Tell me about Mercury",
+    "What is Java?",
+    "Who won the game?",
+    "How tall is Washington?",
+    "What about Jordan?",
+    "When did they release it?",
+    "Is it good?",
+    "What is the best one?",
+    "Where is Paris?",
+    "Tell me more",
+    "What about the other one?",
+    "How much does it cost?",
+    "Who is the president?",
+    "What is Python?",
+    "Tell me about Amazon",
+    "What happened there?",
+    "Which one is better?",
+    "What is the score?",
+    "What is Apple worth?",
+    "Who is Michael Jordan?",
+    "What does he do now?",
+    "How old is she?",
+    "What was the result?",
+    "Explain the difference",
+    "What are the rules?",
+    "What is the weather like?",
+    "Tell me about Jaguar",
+    "When is the next one?",
+)
+
+
+def _features(question: str) -> Tuple[int, bool, bool]:
+    """
+    Returns the word count and whether the question refers back to the conversation or names an entity.
+    """
+    words = _WORD.findall(question)
+    lowered = {word.lower() for word in words}
+    # A capitalised word after the first one, a number, or a quoted phrase counts as a named entity
+    has_entity = (any(word[0].isupper() or word[0].isdigit() for word in words[1:])
+                  or bool(re.search(r'"[^"]+"|“[^”]+”', question)))
+    return len(words), bool(lowered & _REFERENCES), has_entity
+
+
+class ClarityClassifier:
+    """
+    CPU-only pre-classifier for the ambiguity check. A question is marked clear only when it passes the
+    heuristics (long enough, names an entity, no pronoun referring to the conversation) and a small
+    TF-IDF + logistic regression model trained on the seed examples is confident it is clear. Everything
+    else takes the LLM path, so a miss costs one LLM call rather than a wrong answer.
+    """
+    def __init__(self, threshold: float = CLARITY_THRESHOLD, clear_examples=CLEAR_EXAMPLES,
+                 ambiguous_examples=AMBIGUOUS_EXAMPLES):
+        self.threshold = threshold
+        self._examples = (tuple(clear_examples), tuple(ambiguous_examples))
+        self._model = None
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._bypassed = 0
+
+    def _fit(self):
+        # scikit-learn is imported on first use so importing the graph stays cheap
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        clear, ambiguous = self._examples
+        model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+            LogisticRegression(C=10.0, class_weight="balanced"),
+        )
+        model.fit(clear + ambiguous, [1] * len(clear) + [0] * len(ambiguous))
+        return model
+
+    def warm_up(self):
+        """
+        Trains the model up front, e.g. from the application startup event.
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._fit()
+
+    def clear_probability(self, question: str) -> float:
+        """
+        Returns the model's probability that the question is clear, ignoring the heuristics.
+        """
+        self.warm_up()
+        return float(self._model.predict_proba([question])[0][1])
+
+    def is_clear(self, question: str) -> bool:
+        """
+        Decides whether the question is confidently clear, recording the outcome in the metrics.
+        A pronoun always sends the question to the LLM: it either refers to the conversation, which only
+        the LLM sees, or to nothing at all.
+        :param question: The user's question
+        :return: True to skip the LLM ambiguity check
+        """
+        word_count, refers_back, has_entity = _features(question)
+        clear = (word_count >= MIN_WORDS and has_entity and not refers_back
+                 and self.clear_probability(question) >= self.threshold)
+        with self._lock:
+            self._checked += 1
+            self._bypassed += clear
+        return clear
+
+    def metrics(self) -> dict:
+        with self._lock:
+            checked, bypassed = self._checked, self._bypassed
+        return {
+            "checked": checked,
+            "bypassed": bypassed,
+            "llm_path": checked - bypassed,
+            "llm_path_rate": round((checked - bypassed) / checked, 3) if checked else None,
+        }
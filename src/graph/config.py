@@ -0,0 +1,145 @@
+"""
+This module contains the graph configuration loaded from config.yaml: named profiles that select which
+nodes run, which models and retriever limits they use, and the size limits of every step, so quality can be
+traded for latency per request.
+"""
+import os
+from typing import Dict, Optional
+
+import yaml
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+
+from src.graph.backends import Backends
+from src.graph.context_packing import CONTEXT_TOKEN_BUDGET, MAX_PASSAGE_TOKENS
+from src.graph.history import HISTORY_TOKEN_BUDGET
+from src.graph.passages import PASSAGES_PER_SOURCE
+from src.ingestion.settings import CHUNK_SIZE, IngestionSettings
+
+# Path of the configuration file; a missing or empty file yields the built-in "balanced" profile
+GRAPH_CONFIG = os.getenv("GRAPH_CONFIG", "config.yaml")
+# Queries looked up per retrieval when a profile does not set nodes.query_variants
+MULTI_QUERY_VARIANTS = int(os.getenv("MULTI_QUERY_VARIANTS", "1"))
+
+
+class ConfigError(ValueError):
+    """
+    Raised when the configuration file is invalid or a request names an unknown profile.
+    """
+
+
+class _Settings(BaseModel):
+    # Typos in config.yaml should fail at startup rather than silently keep a default
+    model_config = {"extra": "forbid"}
+
+
+class NodeSettings(_Settings):
+    """
+    Optional steps of the graph. Retrieval and answer generation always run.
+    """
+    detect_ambiguity: bool = True
+    transform: bool = True
+    grade: bool = True
+    web_fallback: bool = True
+    adaptive_routing: bool = True
+    rerank: bool = True
+    query_variants: int = Field(MULTI_QUERY_VARIANTS, ge=1, le=8)
+
+
+class ModelSettings(_Settings):
+    """
+    OpenAI chat models: a default and optional overrides per node role (see Backends.ROLES).
+    """
+    default: str = "gpt-4-turbo"
+    roles: Dict[str, str] = {}
+
+    @field_validator("roles")
+    @classmethod
+    def _known_roles(cls, roles: Dict[str, str]) -> Dict[str, str]:
+        unknown = set(roles) - set(Backends.ROLES)
+        if unknown:
+            raise ValueError(f"unknown roles {sorted(unknown)}; expected some of {list(Backends.ROLES)}")
+        return roles
+
+    def for_role(self, role: str) -> str:
+        return self.roles.get(role, self.default)
+
+
+class RetrievalSettings(_Settings):
+    wikipedia_top_k: int = Field(2, ge=1)
+    web_k: int = Field(5, ge=1)
+    passages_per_source: int = Field(PASSAGES_PER_SOURCE, ge=1)
+    passage_tokens: int = Field(CHUNK_SIZE, ge=16)
+
+
+class LimitSettings(_Settings):
+    grade_passages: int = Field(2, ge=1)
+    rerank_top_k: int = Field(3, ge=1)
+    rerank_summary_chars: int = Field(200, ge=20)
+    context_token_budget: int = Field(CONTEXT_TOKEN_BUDGET, ge=100)
+    history_token_budget: int = Field(HISTORY_TOKEN_BUDGET, ge=0)
+    max_passage_tokens: int = Field(MAX_PASSAGE_TOKENS, ge=16)
+    fallback_answer_chars: int = Field(300, ge=50)
+
+
+class GraphProfile(_Settings):
+    """
+    One named trade-off between answer quality and latency.
+    """
+    name: str = "balanced"
+    nodes: NodeSettings = NodeSettings()
+    models: ModelSettings = ModelSettings()
+    retrieval: RetrievalSettings = RetrievalSettings()
+    limits: LimitSettings = LimitSettings()
+
+
+class GraphConfig(_Settings):
+    default_profile: str = "balanced"
+    ingestion: IngestionSettings = IngestionSettings()
+    profiles: Dict[str, GraphProfile] = {"balanced": GraphProfile()}
+
+    @model_validator(mode="before")
+    @classmethod
+    def _name_profiles(cls, data):
+        # Profiles are named by their key in the file
+        if isinstance(data, dict) and isinstance(data.get("profiles"), dict):
+            data = dict(data, profiles={name: dict(profile or {}, name=name)
+                                        for name, profile in data["profiles"].items()})
+        return data
+
+    @model_validator(mode="after")
+    def _default_exists(self) -> "GraphConfig":
+        if self.default_profile not in self.profiles:
+            raise ValueError(f"default_profile {self.default_profile!r} is not one of {sorted(self.profiles)}")
+        return self
+
+    def profile(self, name: Optional[str] = None) -> GraphProfile:
+        """
+        Returns the named profile, or the default profile when no name is given.
+        :raises ConfigError: When there is no profile with that name
+        """
+        profile = self.profiles.get(name or self.default_profile)
+        if profile is None:
+            raise ConfigError(f"Unknown profile {name!r}; available: {', '.join(sorted(self.profiles))}")
+        return profile
+
+
+# Used by nodes and build_workflow when no profile is given; matches an empty config.yaml
+DEFAULT_PROFILE = GraphProfile()
+
+
+def load_config(path: Optional[str] = None) -> GraphConfig:
+    """
+    Loads and validates the graph configuration.
+    :param path: YAML file, defaults to GRAPH_CONFIG
+    :return: The configuration; built-in defaults when the file is missing or empty
+    :raises ConfigError: When the file is not valid YAML or does not match the schema
+    """
+    path = path or GRAPH_CONFIG
+    if not os.path.exists(path):
+        return GraphConfig()
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return GraphConfig.model_validate(data)
+    except (yaml.YAMLError, ValidationError) as e:
+        raise ConfigError(f"Invalid graph configuration in {path}: {e}") from e
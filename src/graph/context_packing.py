@@ -0,0 +1,121 @@
+"""
+This module contains the context packer, which fits the evidence and the conversation for the answer
+prompt into a token budget.
+"""
+import os
+import re
+from typing import List, Sequence, Set
+
+from langchain_core.documents import Document
+
+from src.graph.history import HISTORY_TOKEN_BUDGET, ChatHistory
+from src.graph.tokens import count_tokens, truncate_tokens
+
+# Tokens available to the evidence and the conversation together in the answer prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Longest passage taken from a single document
+MAX_PASSAGE_TOKENS = int(os.getenv("MAX_PASSAGE_TOKENS", "250"))
+# Passages whose word shingles overlap at least this much with a better passage are dropped
+DUPLICATE_OVERLAP = 0.6
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from has have how in is it of on or that the this to was were what "
+    "when where which who whom why will with".split()
+)
+
+
+def query_terms(text: str) -> Set[str]:
+    """
+    Returns the lower-cased content words of the text.
+    """
+    return {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS}
+
+
+def _shingles(text: str, size: int = 5) -> Set[tuple]:
+    words = _WORD.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _overlap(a: Set[tuple], b: Set[tuple]) -> float:
+    # Containment of the smaller passage, so a snippet copied out of a longer page counts as a duplicate
+    return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+
+class PackedContext:
+    """
+    Evidence and conversation selected for the answer prompt.
+
+    Attributes:
+        passages: Selected passages in retrieval order, each trimmed to MAX_PASSAGE_TOKENS
+        conversation: Most recent turns that fit the rest of the budget, as "Sender: message" lines
+        tokens: Tokens used by the passages and the conversation
+        dropped: Number of passages left out as duplicates or for lack of budget
+    """
+    __slots__ = ("passages", "conversation", "tokens", "dropped")
+
+    def __init__(self, passages: List[Document], conversation: str, tokens: int, dropped: int):
+        self.passages = passages
+        self.conversation = conversation
+        self.tokens = tokens
+        self.dropped = dropped
+
+    @property
+    def content(self) -> str:
+        return "\n".join(doc.page_content for doc in self.passages)
+
+
+def score_passages(query: str, passages: Sequence[Document]) -> List[float]:
+    """
+    Scores passages by the share of query terms they contain, with a small bonus for earlier (better ranked)
+    results so ties keep the retrieval order.
+    """
+    terms = query_terms(query)
+    scores = []
+    for rank, doc in enumerate(passages):
+        coverage = len(terms & query_terms(doc.page_content)) / len(terms) if terms else 0.0
+        scores.append(coverage + 0.1 / (1 + rank))
+    return scores
+
+
+def pack_context(query: str, docs: Sequence[Document], history: ChatHistory,
+                 budget: int = CONTEXT_TOKEN_BUDGET, history_budget: int = HISTORY_TOKEN_BUDGET,
+                 max_passage_tokens: int = MAX_PASSAGE_TOKENS) -> PackedContext:
+    """
+    Selects the evidence and the conversation for the answer prompt within a token budget.
+    Passages are taken best first, skipping near-duplicates of passages already taken; the conversation
+    only gets what the evidence leaves, so it is trimmed before any relevant evidence is.
+    :param query: The question being answered
+    :param docs: Candidate documents, best ranked first
+    :param history: The session history
+    :param budget: Tokens for the passages and the conversation together
+    :param history_budget: Upper bound for the conversation on its own
+    :param max_passage_tokens: Longest passage taken from a single document
+    :return: The packed context
+    """
+    passages = []
+    for doc in docs:
+        text = truncate_tokens(doc.page_content.strip(), max_passage_tokens)
+        if text:
+            passages.append(Document(page_content=text, metadata=doc.metadata))
+    scores = score_passages(query, passages)
+
+    selected, taken_shingles, used, dropped = [], [], 0, 0
+    for index in sorted(range(len(passages)), key=lambda i: scores[i], reverse=True):
+        shingles = _shingles(passages[index].page_content)
+        cost = count_tokens(passages[index].page_content)
+        if used + cost > budget or any(_overlap(shingles, taken) >= DUPLICATE_OVERLAP for taken in taken_shingles):
+            dropped += 1
+            continue
+        selected.append(index)
+        taken_shingles.append(shingles)
+        used += cost
+
+    turns = ChatHistory.coerce(history).tail(max_tokens=min(history_budget, budget - used))
+    conversation = "\n".join(turn.render() for turn in turns)
+    return PackedContext(
+        passages=[passages[i] for i in sorted(selected)],
+        conversation=conversation,
+        tokens=used + sum(turn.token_count for turn in turns),
+        dropped=dropped,
+    )
@@ -0,0 +1,125 @@
+"""
+This module contains the helpers that let graph nodes honour the per-run deadline budget
+carried in GraphState["deadline"].
+"""
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from typing import Any, Callable, List, Optional, Sequence
+
+from src.graph.rate_limit import DeadlineExceeded, current_deadline, deadline_scope
+from src.graph.state import GraphState
+
+
+# Time kept in reserve for generate_answer; below it optional steps are skipped
+RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "8"))
+
+# Retrieval calls run here so they can be abandoned when their timeout expires
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("RETRIEVAL_WORKERS", "32")), thread_name_prefix="retrieval")
+
+
+def new_deadline(seconds: float) -> float:
+    """
+    Returns an absolute deadline (epoch seconds) the given number of seconds from now.
+    """
+    return time.time() + seconds
+
+
+def remaining_seconds(state: GraphState) -> Optional[float]:
+    """
+    Returns the seconds left in the run's budget, or None when the run has no deadline.
+    """
+    deadline = state.get("deadline")
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def budget_low(state: GraphState, reserve: float = RESERVE_SECONDS) -> bool:
+    """
+    Tells whether the remaining budget is too small for optional steps.
+    """
+    remaining = remaining_seconds(state)
+    return remaining is not None and remaining < reserve
+
+
+def call_timeout(state: GraphState, fraction: float) -> Optional[float]:
+    """
+    Returns a timeout proportional to what is left of the budget after the reserve.
+    :param fraction: Share of the spendable budget the call may use
+    """
+    remaining = remaining_seconds(state)
+    if remaining is None:
+        return None
+    return max(0.0, (remaining - RESERVE_SECONDS) * fraction)
+
+
+def _bounded(fn: Callable[..., Any], timeout: float) -> Callable[..., Any]:
+    """
+    Wraps fn so it runs under a deadline no later than timeout seconds from now. Rate limited retries and pooled
+    HTTP requests then stop at the call's own timeout, so an abandoned worker frees its thread soon after.
+    """
+    deadline = time.monotonic() + timeout
+    outer = current_deadline()
+    if outer is not None:
+        deadline = min(deadline, outer)
+
+    def bounded(*args, **kwargs):
+        with deadline_scope(deadline):
+            return fn(*args, **kwargs)
+    return bounded
+
+
+def run_with_timeout(fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Runs fn with a timeout. The worker thread is abandoned (not killed) when the timeout expires.
+    :raises DeadlineExceeded: When fn does not return in time
+    """
+    if timeout is None:
+        return fn(*args, **kwargs)
+    if timeout <= 0:
+        raise DeadlineExceeded("No time left in the request budget")
+    # Copy the context so the worker still sees the request deadline set by with_deadline
+    future = _executor.submit(contextvars.copy_context().run, _bounded(fn, timeout), *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError as e:
+        future.cancel()
+        raise DeadlineExceeded(f"Call did not finish within {timeout:.1f}s") from e
+
+
+def run_all_with_timeout(calls: Sequence[Callable[[], Any]], timeout: Optional[float] = None) -> List[Any]:
+    """
+    Runs the calls concurrently and waits for all of them, up to one shared timeout.
+    Calls still running at the timeout are abandoned like in run_with_timeout.
+    :return: One entry per call: its result, or the exception it raised (DeadlineExceeded when it did not finish)
+    """
+    if timeout is not None and timeout <= 0:
+        return [DeadlineExceeded("No time left in the request budget") for _ in calls]
+    if timeout is not None:
+        calls = [_bounded(call, timeout) for call in calls]
+    futures = [_executor.submit(contextvars.copy_context().run, call) for call in calls]
+    done, _ = wait(futures, timeout=timeout)
+    outcomes = []
+    for future in futures:
+        if future in done:
+            error = future.exception()
+            outcomes.append(error if error is not None else future.result())
+        else:
+            future.cancel()
+            outcomes.append(DeadlineExceeded(f"Call did not finish within {timeout:.1f}s"))
+    return outcomes
+
+
+def with_deadline(node: Callable[..., dict]) -> Callable[..., dict]:
+    """
+    Decorator for graph nodes: rate limited calls made by the node stop retrying at the run deadline.
+    """
+    @functools.wraps(node)
+    def wrapper(state: GraphState, *args, **kwargs) -> dict:
+        remaining = remaining_seconds(state)
+        with deadline_scope(None if remaining is None else time.monotonic() + remaining):
+            return node(state, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,348 @@
+"""
+This module contains the EntityIndex, a local index of the meanings of ambiguous entity names built from Wikipedia
+disambiguation pages. clarify_question uses it to offer the meanings of a known entity ("Tesla" -> Tesla, Inc.,
+Nikola Tesla, ...) as clarification options without an LLM call.
+
+The index is built offline from a pages-articles dump and stored as compact JSON:
+    python -m src.graph.entities enwiki-latest-pages-articles.xml.bz2 --output src/graph/data/entities.json
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+
+# Index file loaded by the shared index; "off" disables local clarification options
+ENTITY_INDEX_PATH = os.getenv("ENTITY_INDEX_PATH",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "entities.json"))
+# Meanings offered in one clarification question; the rest of the page is left to the "something else" option
+ENTITY_MAX_OPTIONS = int(os.getenv("ENTITY_MAX_OPTIONS", "5"))
+# Recent turns of the conversation searched for a meaning the user already settled ("Tesla, Inc." two turns ago)
+ENTITY_CONTEXT_TURNS = int(os.getenv("ENTITY_CONTEXT_TURNS", "4"))
+
+# Meanings kept per entity when building, in page order (disambiguation pages list the most common ones first)
+MAX_CANDIDATES = 10
+# Longest description kept for a meaning, in characters
+MAX_DESCRIPTION = 90
+
+_WORD = re.compile(r"[^\W_]+")
+
+# Single words that have disambiguation pages but are never what a question is about
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from had has have he her his how i in is it its me my of on or our "
+    "she so than that the their them there they this to us was we were what when where which who whom why will "
+    "with would you your about after all also any before best big get give good many more most much new now old "
+    "one other over some tell then time two up use way well".split()
+)
+
+_DISAMBIGUATION_SUFFIX = " (disambiguation)"
+_DISAMBIGUATION_TEMPLATE = re.compile(r"\{\{\s*(disambiguation|disambig|dab|hndis|geodis|surname|given name)\b",
+                                      re.IGNORECASE)
+_LINK = re.compile(r"\[\[([^\]|#]+)(?:#[^\]|]*)?(?:\|([^\]]*))?\]\]")
+_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+_QUALIFIER = re.compile(r"\s*\(([^)]*)\)")
+_SECTION = re.compile(r"^==+\s*(.*?)\s*==+\s*$")
+# Sections that list related pages rather than meanings of the name
+_SKIPPED_SECTIONS = ("see also", "references", "external links")
+
+
+def normalize_entity(text: str) -> str:
+    """
+    Returns the lookup key of a name: lowercase words without accents or punctuation, separated by single spaces.
+    """
+    return " ".join(_words(text))
+
+
+def _words(text: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    return _WORD.findall("".join(char for char in folded if not unicodedata.combining(char)))
+
+
+def _cues(key: str, title: str) -> Tuple[str, ...]:
+    # Normalized phrases that point at one meaning of the name: its title when that says more than the name
+    # ("Apple Inc.", "Freddie Mercury") and the qualifier of the title without years ("Mercury (planet)" -> planet)
+    cues = []
+    name = normalize_entity(_QUALIFIER.sub("", title))
+    if name and name != key:
+        cues.append(name)
+    for qualifier in _QUALIFIER.findall(title):
+        words = [word for word in _words(qualifier) if not word.isdigit()]
+        if words:
+            cues.append(" ".join(words))
+    return tuple(cues)
+
+
+def _plain(wikitext: str) -> str:
+    # Links become their label, templates, bold and italics are dropped
+    text = _LINK.sub(lambda match: match.group(2) or match.group(1), wikitext)
+    while True:
+        stripped = _TEMPLATE.sub("", text)
+        if stripped == text:
+            break
+        text = stripped
+    return re.sub(r"\s+", " ", text.replace("'''", "").replace("''", "")).strip()
+
+
+def parse_disambiguation(wikitext: str, max_candidates: int = MAX_CANDIDATES) -> List[Tuple[str, str]]:
+    """
+    Extracts the meanings listed on a disambiguation page: every top-level bullet that starts with a link.
+    :param wikitext: Source of the page
+    :param max_candidates: Meanings kept, in page order
+    :return: (article title, short description) pairs
+    """
+    candidates = []
+    seen = set()
+    skipping = False
+    for line in wikitext.splitlines():
+        section = _SECTION.match(line)
+        if section:
+            skipping = section.group(1).strip().lower() in _SKIPPED_SECTIONS
+            continue
+        # Nested bullets ("**") qualify the meaning above them
+        if skipping or not line.startswith("*") or line.startswith("**"):
+            continue
+        entry = line.lstrip("*").strip().lstrip("'\"").strip()
+        link = _LINK.match(entry)
+        if link is None:
+            continue
+        title = link.group(1).strip()
+        if title.lower() in seen or title.lower().endswith(_DISAMBIGUATION_SUFFIX):
+            continue
+        seen.add(title.lower())
+        description = _plain(entry[link.end():]).lstrip("'\",;:-– ").strip()
+        if len(description) > MAX_DESCRIPTION:
+            description = description[:MAX_DESCRIPTION].rsplit(" ", 1)[0] + "..."
+        candidates.append((title, description))
+        if len(candidates) >= max_candidates:
+            break
+    return candidates
+
+
+def iter_dump_pages(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Streams the article pages of a MediaWiki XML dump (plain or .bz2).
+    :return: (title, wikitext) pairs
+    """
+    # Only the offline build reads dumps, so the graph does not import the XML parser
+    import bz2
+    import xml.etree.ElementTree as ElementTree
+
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as f:
+        title, namespace, text = None, None, None
+        for _, element in ElementTree.iterparse(f):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag == "title":
+                title = element.text
+            elif tag == "ns":
+                namespace = element.text
+            elif tag == "text":
+                text = element.text
+            elif tag == "page":
+                if namespace == "0" and title and text:
+                    yield title, text
+                title, namespace, text = None, None, None
+                # Pages are not kept once read, so memory stays flat over the whole dump
+                element.clear()
+
+
+def build_entities(pages: Iterable[Tuple[str, str]], names: Optional[Iterable[str]] = None,
+                   max_candidates: int = MAX_CANDIDATES) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Builds the index entries from the disambiguation pages among the given pages.
+    :param pages: (title, wikitext) pairs, e.g. from iter_dump_pages
+    :param names: Only index these entity names; None indexes every disambiguation page
+    :param max_candidates: Meanings kept per entity
+    :return: Meanings per normalized entity name, for entities with at least two meanings
+    """
+    wanted = {normalize_entity(name) for name in names} if names is not None else None
+    entities = {}
+    for title, text in pages:
+        is_disambiguation = title.endswith(_DISAMBIGUATION_SUFFIX)
+        if not is_disambiguation and not _DISAMBIGUATION_TEMPLATE.search(text):
+            continue
+        key = normalize_entity(title[:-len(_DISAMBIGUATION_SUFFIX)] if is_disambiguation else title)
+        if not key or key in _STOPWORDS or (wanted is not None and key not in wanted):
+            continue
+        candidates = parse_disambiguation(text, max_candidates)
+        # "Tesla" and "Tesla (disambiguation)" can both be disambiguation pages; the longer list wins
+        if len(candidates) >= 2 and len(candidates) > len(entities.get(key, ())):
+            entities[key] = candidates
+    return entities
+
+
+def save_entities(entities: Dict[str, List[Tuple[str, str]]], path: str, source: str = ""):
+    """
+    Writes index entries to a JSON file, sorted by name so rebuilds diff cleanly.
+    """
+    data = {"source": source, "entities": {key: [list(candidate) for candidate in entities[key]]
+                                           for key in sorted(entities)}}
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2) + b"\n")
+
+
+class EntityIndex:
+    """
+    Meanings of ambiguous entity names, keyed by normalized name. A question is matched by looking up its word
+    n-grams, longest first, so a lookup costs a few dict probes and takes microseconds. The index is loaded on
+    first use (or by warm_up) and is read-only afterwards, so it is shared by all graph runs without locking.
+    """
+    def __init__(self, entities: Optional[Dict[str, Sequence[Sequence[str]]]] = None, path: Optional[str] = None,
+                 max_options: int = ENTITY_MAX_OPTIONS):
+        """
+        :param entities: Meanings per entity name as (title, description) pairs; names are normalized
+        :param path: Index file to load instead, as written by save_entities; a missing file yields an empty index
+        :param max_options: Meanings offered in one clarification question
+        """
+        self.path = path
+        self.max_options = max_options
+        self._entities: Optional[Dict[str, Tuple[Tuple[str, str], ...]]] = None
+        self._cues: Dict[str, Tuple[Tuple[str, ...], ...]] = {}
+        self._max_words = 0
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._answered = 0
+        if entities is not None or path is None:
+            self._set(entities or {})
+
+    @classmethod
+    def from_env(cls) -> "EntityIndex":
+        """
+        Creates the index configured by ENTITY_INDEX_PATH and ENTITY_MAX_OPTIONS.
+        """
+        if ENTITY_INDEX_PATH.lower() in ("", "off"):
+            return cls()
+        return cls(path=ENTITY_INDEX_PATH)
+
+    def _set(self, entities: Dict[str, Sequence[Sequence[str]]]):
+        index = {}
+        for name, candidates in entities.items():
+            key = normalize_entity(name)
+            if key:
+                index[key] = tuple((title, description) for title, description in candidates)
+        self._cues = {key: tuple(_cues(key, title) for title, _ in candidates) for key, candidates in index.items()}
+        self._max_words = max((key.count(" ") + 1 for key in index), default=0)
+        self._entities = index
+
+    def warm_up(self):
+        """
+        Loads the index file up front, e.g. from the application startup event.
+        """
+        if self._entities is None:
+            with self._lock:
+                if self._entities is None:
+                    entities = {}
+                    if self.path and os.path.exists(self.path):
+                        with open(self.path, "rb") as f:
+                            entities = orjson.loads(f.read())["entities"]
+                    self._set(entities)
+
+    def __len__(self) -> int:
+        self.warm_up()
+        return len(self._entities)
+
+    def candidates(self, name: str) -> Tuple[Tuple[str, str], ...]:
+        """
+        Returns the meanings of an entity name, or an empty tuple for an unknown name.
+        """
+        self.warm_up()
+        return self._entities.get(normalize_entity(name), ())
+
+    def find(self, question: str, context: str = "") -> Optional[Tuple[str, Tuple[Tuple[str, str], ...]]]:
+        """
+        Finds the ambiguous entity a question is about. At each word the longest known name wins, so "Michael
+        Jordan" is matched before "Jordan". An entity is not ambiguous when the question, or else the context,
+        points at exactly one of its meanings ("Apple Inc. revenue", "the planet Mercury").
+        :param question: The user's question
+        :param context: Recent turns of the conversation
+        :return: The entity as written in the question and its meanings, or None when the question names no known
+            entity, more than one, or one whose meaning is already settled
+        """
+        self.warm_up()
+        matches = list(_WORD.finditer(question))
+        # Most questions are ASCII, which needs no accent folding
+        words = [word.lower() if word.isascii() else normalize_entity(word)
+                 for word in (match.group(0) for match in matches)]
+        found = []
+        position = 0
+        while position < len(words):
+            for length in range(min(self._max_words, len(words) - position), 0, -1):
+                key = " ".join(words[position:position + length])
+                if length == 1 and key in _STOPWORDS:
+                    continue
+                candidates = self._entities.get(key)
+                if candidates:
+                    surface = question[matches[position].start():matches[position + length - 1].end()]
+                    found.append((key, surface, candidates))
+                    position += length
+                    break
+            else:
+                position += 1
+        if len({key for key, _, _ in found}) != 1:
+            return None
+        key, surface, candidates = found[0]
+        if self._settled(key, question) or (context and self._settled(key, context)):
+            return None
+        return surface, candidates
+
+    def _settled(self, key: str, text: str) -> bool:
+        # Exactly one meaning has to be named; a list of several (e.g. an earlier clarification) settles nothing
+        padded = f" {normalize_entity(text)} "
+        named = sum(any(f" {cue} " in padded for cue in cues) for cues in self._cues[key])
+        return named == 1
+
+    def clarification(self, question: str, context: str = "") -> Optional[str]:
+        """
+        Builds a clarification question listing the meanings of the entity the question is about, in the bullet
+        format process_clarification expects, recording the outcome in the metrics.
+        :param question: The user's question
+        :param context: Recent turns of the conversation, which may already settle the meaning
+        :return: The clarification question, or None when the LLM has to write it
+        """
+        match = self.find(question, context)
+        with self._lock:
+            self._lookups += 1
+            self._answered += match is not None
+        if match is None:
+            return None
+        surface, candidates = match
+        options = [f"- {title}: {description}" if description else f"- {title}"
+                   for title, description in candidates[:self.max_options]]
+        options.append("- Something else (please describe it)")
+        return f'Which "{surface}" do you mean?\n' + "\n".join(options)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups, answered = self._lookups, self._answered
+        return {
+            "entities": len(self._entities) if self._entities is not None else None,
+            "lookups": lookups,
+            "answered_locally": answered,
+            "llm_path": lookups - answered,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the entity index from a Wikipedia pages-articles dump.")
+    parser.add_argument("dump", help="pages-articles XML dump, optionally .bz2 compressed")
+    parser.add_argument("--output", default=ENTITY_INDEX_PATH, help="Index file to write")
+    parser.add_argument("--names", help="File with one entity name per line; only these are indexed")
+    parser.add_argument("--max-candidates", type=int, default=MAX_CANDIDATES, help="Meanings kept per entity")
+    args = parser.parse_args(argv)
+
+    names = None
+    if args.names:
+        with open(args.names, encoding="utf-8") as f:
+            names = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    entities = build_entities(iter_dump_pages(args.dump), names, args.max_candidates)
+    save_entities(entities, args.output, source=os.path.basename(args.dump))
+    sys.stdout.write(f"Indexed {len(entities)} entities from {args.dump} into {args.output}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+This module contains the helpers for multi-query retrieval: parsing the query variants generated by the LLM
+and fusing the result lists of several lookups into one ranking.
+"""
+import hashlib
+import re
+from typing import Dict, List, Sequence
+
+from langchain_core.documents import Document
+
+# Damping constant of reciprocal rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def parse_variants(text: str, query: str, limit: int) -> List[str]:
+    """
+    Parses the LLM's one-query-per-line answer into at most limit distinct queries.
+    :param text: LLM output
+    :param query: The query the variants were generated for; always kept first
+    :param limit: Maximum number of queries to return
+    :return: The query followed by its variants
+    """
+    variants, seen = [], set()
+    for line in [query] + text.splitlines():
+        variant = _LIST_MARKER.sub("", line).strip().strip("\"'")
+        key = variant.lower().rstrip("?!. ")
+        if variant and key not in seen:
+            seen.add(key)
+            variants.append(variant)
+    return variants[:max(1, limit)]
+
+
+def content_hash(doc: Document) -> str:
+    """
+    Hashes the document text with whitespace and case normalised, so the same page returned by several
+    lookups (or sources) is recognised.
+    """
+    normalized = " ".join(doc.page_content.lower().split())
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = RRF_K) -> List[Document]:
+    """
+    Fuses several rankings into one: each document scores sum(1 / (k + rank)) over the rankings it appears in.
+    Duplicates (by content hash) are merged and keep the metadata of their first occurrence.
+    :param rankings: Result lists, each best first
+    :param k: RRF damping constant
+    :return: Distinct documents, best first
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, doc in enumerate(ranking, start=1):
+            key = content_hash(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    # sorted() is stable, so ties keep first-seen order
+    return [docs[key] for key in sorted(docs, key=lambda key: scores[key], reverse=True)]
@@ -1,46 +1,138 @@
+import functools
+from typing import Optional
+
 from dotenv import load_dotenv
 load_dotenv()
-from langgraph.graph import StateGraph, END
+from src.graph.backends import Backends, default_backends
+from src.graph.config import DEFAULT_PROFILE, GraphProfile
+from src.graph.deadline import budget_low
 from src.graph.state import GraphState
 import src.graph.nodes as nodes
 
 
-def build_workflow() -> StateGraph:
+def skip_when_budget_low(next_node: str):
+    """
+    Builds a router that jumps straight to generate_answer once the deadline budget is nearly spent.
+    :param next_node: The node to go to while there is still time
+    :return: Router function for a conditional edge
+    """
+    return lambda state: "generate_answer" if budget_low(state) else next_node
+
+
+def build_workflow(backends: Optional[Backends] = None, resumable: bool = False,
+                   query_variants: Optional[int] = None, profile: Optional[GraphProfile] = None) -> "StateGraph":
     """
     Builds the workflow for the conversational agent.
+    :param backends: Backend registry bound into every node, defaults to the shared production backends
+    :param resumable: Pause for the user's reply when the clarification is still ambiguous. The graph must then
+        be compiled with a checkpointer, and the reply resumes the run with Command(resume=...)
+    :param query_variants: Queries to retrieve with, overriding the profile. Above 1, an expand_query step
+        generates the variants and the retrievers look them all up concurrently and fuse the results
+    :param profile: Graph profile selecting the optional nodes and their limits (see src/graph/config.py),
+        defaults to the built-in "balanced" profile
     :return: The graph representing the workflow.
     """
+    # Imported here so importing this module (and serve.py) stays cheap until the graph is built
+    from langgraph.graph import StateGraph, END
+
+    backends = backends or default_backends()
+    profile = profile or DEFAULT_PROFILE
+    steps = profile.nodes
+    query_variants = query_variants if query_variants is not None else steps.query_variants
+    # Grading only decides whether to fall back to web search, and routing whether to start there
+    grade = steps.grade and steps.web_fallback
+    routing = steps.adaptive_routing and steps.web_fallback
+
+    def bind(node, **options):
+        return functools.partial(node, backends=backends, **options)
+
     workflow = StateGraph(GraphState)
-    workflow.add_node("detect_ambiguity", nodes.detect_ambiguity)
-    workflow.add_node("clarify", nodes.clarify_question)
-    workflow.add_node("process_clarification", nodes.process_clarification)
-    workflow.add_node("transform", nodes.transform_query)
-    workflow.add_node("retrieve_wikipedia", nodes.retrieve_wikipedia)
-    workflow.add_node("grade_wikipedia", nodes.grade_wikipedia)
-    workflow.add_node("retrieve_web", nodes.retrieve_web)
-    workflow.add_node("rerank", nodes.rerank_documents)
-    workflow.add_node("generate_answer", nodes.generate_answer)
-
-    # Set the entry point for the conversation; initially, ambiguity is checked.
-    workflow.set_entry_point("detect_ambiguity")
-
-    # Define conditional edges:
-    workflow.add_conditional_edges(
-        "detect_ambiguity",
-        lambda state: "clarify" if state["needs_clarification"] else "retrieve_wikipedia",
-        {"clarify": "clarify", "retrieve_wikipedia": "retrieve_wikipedia"}
-    )
-    workflow.add_edge("clarify", "process_clarification")
-    workflow.add_edge("process_clarification", "transform")
-    workflow.add_edge("transform", "retrieve_wikipedia")
-    workflow.add_edge("retrieve_wikipedia", "grade_wikipedia")
+    workflow.add_node("retrieve_wikipedia", bind(nodes.retrieve_wikipedia, profile=profile))
+    # The first retrieval step: the source router when adaptive routing is on
+    first_leg = "retrieve_wikipedia"
+    if routing:
+        workflow.add_node("route_source", bind(nodes.route_source))
+        workflow.add_conditional_edges(
+            "route_source",
+            lambda state: "retrieve_web" if state["first_source"] == "web" else "retrieve_wikipedia",
+            ["retrieve_wikipedia", "retrieve_web"]
+        )
+        first_leg = "route_source"
+    # The step that leads into retrieval: variant generation in multi-query mode
+    retrieve = first_leg
+    if query_variants > 1:
+        workflow.add_node("expand_query", bind(nodes.expand_query, variants=query_variants))
+        workflow.add_edge("expand_query", first_leg)
+        retrieve = "expand_query"
+    workflow.add_node("generate_answer", bind(nodes.generate_answer, profile=profile))
+    workflow.add_edge("generate_answer", END)
+
+    if steps.detect_ambiguity:
+        workflow.add_node("detect_ambiguity", bind(nodes.detect_ambiguity))
+        workflow.add_node("clarify", bind(nodes.clarify_question))
+        workflow.add_node("process_clarification", bind(nodes.process_clarification))
+        # Set the entry point for the conversation; initially, ambiguity is checked.
+        workflow.set_entry_point("detect_ambiguity")
+        workflow.add_conditional_edges(
+            "detect_ambiguity",
+            lambda state: "clarify" if state["needs_clarification"] else retrieve,
+            ["clarify", retrieve]
+        )
+        workflow.add_edge("clarify", "process_clarification")
+        if resumable:
+            workflow.add_node("await_clarification", bind(nodes.await_clarification))
+            workflow.add_edge("await_clarification", "process_clarification")
+        # The clarified question is refined before retrieval unless the profile skips the step
+        refine = retrieve
+        if steps.transform:
+            workflow.add_node("transform", bind(nodes.transform_query))
+            workflow.add_edge("transform", retrieve)
+            refine = "transform"
+
+        def after_clarification(state):
+            if resumable and state["needs_clarification"]:
+                return "await_clarification"
+            return first_leg if budget_low(state) else refine
+
+        workflow.add_conditional_edges(
+            "process_clarification",
+            after_clarification,
+            list({refine, first_leg, *(["await_clarification"] if resumable else [])})
+        )
+    else:
+        workflow.set_entry_point(retrieve)
+
+    if grade:
+        workflow.add_node("grade_wikipedia", bind(nodes.grade_wikipedia, profile=profile))
+    if steps.web_fallback:
+        workflow.add_node("retrieve_web", bind(nodes.retrieve_web, profile=profile))
+        after_web = "generate_answer"
+        if steps.rerank:
+            workflow.add_node("rerank", bind(nodes.rerank_documents, profile=profile))
+            workflow.add_edge("rerank", "generate_answer")
+            after_web = "rerank"
+        # Optional steps (grading, rerank) are skipped when the deadline budget is nearly spent
+        workflow.add_conditional_edges("retrieve_web", skip_when_budget_low(after_web),
+                                       list({after_web, "generate_answer"}))
+
+    if grade:
+        workflow.add_conditional_edges(
+            "grade_wikipedia",
+            lambda state: "generate_answer" if state.get("wikipedia_sufficient") else "retrieve_web",
+            ["generate_answer", "retrieve_web"]
+        )
+        after_wikipedia = skip_when_budget_low("grade_wikipedia")
+    elif steps.web_fallback:
+        # Without grading, the web is searched only when Wikipedia returned nothing
+        def after_wikipedia(state):
+            return "retrieve_web" if not state["wikipedia_docs"] and not budget_low(state) else "generate_answer"
+    else:
+        def after_wikipedia(state):
+            return "generate_answer"
     workflow.add_conditional_edges(
-        "grade_wikipedia",
-        lambda state: "generate_answer" if state.get("final_answer") else "retrieve_web",
-        {"generate_answer": "generate_answer", "retrieve_web": "retrieve_web"}
+        "retrieve_wikipedia",
+        after_wikipedia,
+        ["generate_answer"] + (["grade_wikipedia"] if grade else ["retrieve_web"] if steps.web_fallback else [])
     )
-    workflow.add_edge("retrieve_web", "rerank")
-    workflow.add_edge("rerank", "generate_answer")
-    workflow.add_edge("generate_answer", END)
 
     return workflow
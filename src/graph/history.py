@@ -0,0 +1,152 @@
+"""
+This module contains the Turn and ChatHistory classes, the compact chat history representation
+shared by serve.py and the graph nodes.
+"""
+import os
+import time
+from enum import StrEnum
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from src.graph.tokens import count_tokens
+
+
+# Token budget for the conversation included in node prompts
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+
+
+class Sender(StrEnum):
+    """
+    Author of a chat turn. Members are singletons, so turns share their sender instead of storing strings.
+    """
+    USER = "User"
+    BOT = "Bot"
+
+
+class Turn:
+    """
+    One chat message.
+
+    Attributes:
+        sender: Author of the message
+        message: Message text
+        timestamp: Creation time in epoch seconds
+        token_count: Number of tokens in the rendered turn, computed once on first access
+    """
+    __slots__ = ("sender", "message", "timestamp", "_token_count")
+
+    def __init__(self, sender: Union[Sender, str], message: str, timestamp: Optional[float] = None):
+        self.sender = Sender(sender)
+        self.message = message
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._token_count = None
+
+    @property
+    def token_count(self) -> int:
+        if self._token_count is None:
+            self._token_count = count_tokens(self.render())
+        return self._token_count
+
+    def render(self) -> str:
+        return f"{self.sender}: {self.message}"
+
+    def to_dict(self) -> dict:
+        return {"sender": str(self.sender), "message": self.message, "timestamp": self.timestamp}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Turn":
+        return cls(data.get("sender", Sender.USER), data.get("message", ""), data.get("timestamp"))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Turn) and (self.sender, self.message, self.timestamp) == (
+            other.sender, other.message, other.timestamp)
+
+    def __repr__(self) -> str:
+        return f"Turn({self.sender!s}, {self.message!r})"
+
+
+class ChatHistory:
+    """
+    Append-only sequence of turns with a token-budgeted view of the most recent ones.
+    """
+    __slots__ = ("_turns",)
+
+    def __init__(self, turns: Iterable[Turn] = ()):
+        self._turns: List[Turn] = list(turns)
+
+    @classmethod
+    def coerce(cls, value: Union["ChatHistory", Iterable[Union[Turn, dict]], None]) -> "ChatHistory":
+        """
+        Builds a history from None, a ChatHistory, or a list of Turn objects / {"sender", "message"} dicts.
+        """
+        if isinstance(value, ChatHistory):
+            return value
+        return cls(item if isinstance(item, Turn) else Turn.from_dict(item) for item in value or ())
+
+    def append(self, sender: Union[Sender, str], message: str) -> Turn:
+        turn = Turn(sender, message)
+        self._turns.append(turn)
+        return turn
+
+    def tail(self, max_tokens: Optional[int] = None, max_turns: Optional[int] = None) -> List[Turn]:
+        """
+        Returns the most recent turns that fit in the budget, oldest first.
+        :param max_tokens: Token budget for the returned turns
+        :param max_turns: Maximum number of turns to return
+        """
+        selected = []
+        used = 0
+        for turn in reversed(self._turns):
+            if max_turns is not None and len(selected) >= max_turns:
+                break
+            if max_tokens is not None and used + turn.token_count > max_tokens:
+                break
+            used += turn.token_count
+            selected.append(turn)
+        selected.reverse()
+        return selected
+
+    def render(self, max_tokens: Optional[int] = HISTORY_TOKEN_BUDGET) -> str:
+        """
+        Renders the most recent turns within the token budget as "Sender: message" lines.
+        """
+        return "\n".join(turn.render() for turn in self.tail(max_tokens=max_tokens))
+
+    def to_list(self, start: int = 0) -> List[dict]:
+        """
+        Serializes the turns from the given position on, each with its position as "index".
+        """
+        return [dict(turn.to_dict(), index=i) for i, turn in enumerate(self._turns[start:], start)]
+
+    def page(self, before: Optional[int] = None, limit: int = 20) -> Tuple[List[dict], Optional[int]]:
+        """
+        Returns a page of serialized turns ending just before the given position, oldest first.
+        :param before: Position to page back from; None for the most recent turns
+        :param limit: Maximum number of turns in the page
+        :return: The page and the "before" cursor of the next older page (None when there are no older turns)
+        """
+        end = len(self._turns) if before is None else max(0, min(before, len(self._turns)))
+        start = max(0, end - limit)
+        turns = [dict(turn.to_dict(), index=i) for i, turn in enumerate(self._turns[start:end], start)]
+        return turns, (start if start > 0 else None)
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __iter__(self) -> Iterator[Turn]:
+        return iter(self._turns)
+
+    def __getitem__(self, index):
+        return self._turns[index]
+
+    def __repr__(self) -> str:
+        return f"ChatHistory({len(self._turns)} turns)"
+
+
+def conversation_text(state: dict, max_tokens: Optional[int] = HISTORY_TOKEN_BUDGET) -> str:
+    """
+    Renders the state's chat history for a prompt, keeping only the most recent turns within the budget.
+    :param state: The current state of the graph
+    :param max_tokens: Token budget for the conversation
+    :return: "Sender: message" lines
+    """
+    return ChatHistory.coerce(state.get("chat_history")).render(max_tokens)
@@ -0,0 +1,167 @@
+"""
+This module contains the PooledHttpClient class, a shared keep-alive HTTP client used by the
+retrieval backends so connections (and their TLS handshakes) are reused across calls.
+"""
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from src.graph.rate_limit import DeadlineExceeded, current_deadline
+
+
+def http2_available() -> bool:
+    """
+    Tells whether httpx with HTTP/2 support (the h2 package) is installed.
+    """
+    return importlib.util.find_spec("httpx") is not None and importlib.util.find_spec("h2") is not None
+
+
+class PooledHttpClient:
+    """
+    Shared HTTP client with a bounded keep-alive connection pool.
+
+    Uses httpx with HTTP/2 when it is installed and requested, otherwise a requests Session
+    with a pooled HTTPAdapter. Both raise on non-2xx responses with the response attached,
+    so the retry helpers in rate_limit can read the status code.
+    """
+    def __init__(self, pool_size: int = 20, timeout: float = 10.0, http2: bool = True):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.http2 = http2 and http2_available()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._connections = 0
+        if self.http2:
+            import httpx
+            self._client = httpx.Client(
+                http2=True,
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        else:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self._client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            self._client.mount("https://", adapter)
+            self._client.mount("http://", adapter)
+
+    def _trace(self, event_name: str, info: dict):
+        # httpcore trace hook: a completed TCP connect means a new connection was opened
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._connections += 1
+
+    def _timeout(self, timeout: Optional[float]) -> float:
+        # A call abandoned at its deadline (see deadline.run_with_timeout) must not keep its worker thread busy
+        # for the full client timeout, so the request never outlives the deadline of the calling scope
+        timeout = timeout or self.timeout
+        deadline = current_deadline()
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("No time left for the HTTP request")
+        return min(timeout, remaining)
+
+    def send(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Sends a request over the pooled connections.
+        :param method: HTTP method
+        :param url: Absolute URL
+        :param timeout: Per-call timeout, defaults to the client timeout; cut to what is left of the current deadline
+        :return: The response (requests or httpx), not checked for its status
+        :raises DeadlineExceeded: When the deadline has already passed
+        """
+        timeout = self._timeout(timeout)
+        with self._lock:
+            self._requests += 1
+        if self.http2:
+            return self._client.request(method, url, timeout=timeout, extensions={"trace": self._trace}, **kwargs)
+        return self._client.request(method, url, timeout=timeout, **kwargs)
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Sends a request over the pooled connections and returns the decoded JSON body.
+        :return: The parsed JSON response
+        :param timeout: Per-call timeout, see send
+        """
+        response = self.send(method, url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def get(self, url: str, **kwargs) -> Any:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Any:
+        return self.request("POST", url, **kwargs)
+
+    def _opened_connections(self) -> int:
+        if self.http2:
+            return self._connections
+        # urllib3 keeps a per-host pool that counts the connections it has opened
+        total = 0
+        for adapter in set(self._client.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def metrics(self) -> dict:
+        """
+        Returns request and connection counters; reused = requests served on an existing connection.
+        """
+        opened = self._opened_connections()
+        with self._lock:
+            requests_total = self._requests
+        return {
+            "transport": "httpx-http2" if self.http2 else "requests",
+            "pool_size": self.pool_size,
+            "requests_total": requests_total,
+            "connections_opened": opened,
+            "connections_reused": max(0, requests_total - opened),
+        }
+
+    def close(self):
+        self._client.close()
+
+
+class PooledRequests:
+    """
+    Stand-in for the requests module in libraries that call requests.get/post directly rather than taking a
+    session: the wikipedia package behind langchain's WikipediaAPIWrapper and langchain's Tavily wrapper. Their
+    calls go over the pooled connections, with the deadline-bound timeout.
+    """
+    def __init__(self, client: PooledHttpClient):
+        self.client = client
+
+    def get(self, url: str, **kwargs) -> Any:
+        return self.client.send("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Any:
+        return self.client.send("POST", url, **kwargs)
+
+
+def route_requests(module_name: str, client: PooledHttpClient):
+    """
+    Points the module-level requests calls of a library module at the pooled client.
+    :param module_name: Module that imports requests and calls requests.get/post, e.g. "wikipedia.wikipedia"
+    """
+    module = importlib.import_module(module_name)
+    module.requests = PooledRequests(client)
+
+
+def client_from_env() -> PooledHttpClient:
+    """
+    Builds the shared client from HTTP_POOL_SIZE, HTTP_TIMEOUT_SECONDS and HTTP2.
+    """
+    return PooledHttpClient(
+        pool_size=int(os.getenv("HTTP_POOL_SIZE", "20")),
+        timeout=float(os.getenv("HTTP_TIMEOUT_SECONDS", "10")),
+        http2=os.getenv("HTTP2", "1").lower() in ("1", "true", "yes"),
+    )
@@ -1,78 +1,118 @@
 """
 This module contains the node functions for the graph-based question answering system.
 """
+import functools
+import re
+import time
+from typing import List, Optional, Union
+
 from dotenv import load_dotenv
 load_dotenv()
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_community.tools import TavilySearchResults
-from logger.logger import CustomLogger
+from src.graph.backends import Backends, default_backends
+from src.graph.config import DEFAULT_PROFILE, GraphProfile
+from src.graph.deadline import budget_low, call_timeout, run_all_with_timeout, with_deadline
+from src.graph.fusion import parse_variants, reciprocal_rank_fusion
+from src.graph.context_packing import pack_context
+from src.graph.entities import ENTITY_CONTEXT_TURNS
+from src.graph.history import ChatHistory, conversation_text
+from src.graph.passages import best_passages
+from src.graph.rate_limit import DeadlineExceeded
+from src.graph.singleflight import normalize_query
 from src.graph.state import GraphState
 
 
-# Initialize shared LLM and tools
-llm = ChatOpenAI(model="gpt-4-turbo")
-wikipedia = WikipediaAPIWrapper(top_k_results=2)
-web_search = TavilySearchResults(k=5)
+def _entity_context(state: GraphState) -> str:
+    # The recent turns in which the user may already have said which meaning of an entity they mean
+    turns = ChatHistory.coerce(state.get("chat_history")).tail(max_turns=ENTITY_CONTEXT_TURNS)
+    return "\n".join(turn.message for turn in turns)
 
 
-def detect_ambiguity(state: GraphState) -> dict:
+@with_deadline
+def detect_ambiguity(state: GraphState, backends: Optional[Backends] = None) -> dict:
     """
     Detects ambiguity in the user's question.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
     :return: The updated state with the ambiguity status
     """
-    CustomLogger.log_message(state["session_id"], "detect_ambiguity", "Started processing detect_ambiguity node")
-    # Convert each chat history entry (a dict) into a string
-    conversation = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in state.get("chat_history", [])])
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "detect_ambiguity", "Started processing detect_ambiguity node")
+    if budget_low(state):
+        backends.logger.log_message(state["session_id"], "detect_ambiguity", "Deadline budget low; assuming the question is clear")
+        return {"needs_clarification": False}
+    # A question about a known ambiguous name ("Where is the headquarters of Midas located?") reads as clear to the
+    # classifier, so it always gets the LLM check
+    question = state["original_question"]
+    if backends.entities.find(question, _entity_context(state)) is None and backends.clarity.is_clear(question):
+        backends.logger.log_message(state["session_id"], "detect_ambiguity", "Question classified as clear locally; skipping the LLM check")
+        return {"needs_clarification": False}
+    conversation = conversation_text(state)
     prompt = (
         f"Based on the conversation history below:\n{conversation}\n\n"
         f"Is the current question ambiguous? Respond ONLY with 'yes' or 'no'.\n"
         f"Current question: {state['original_question']}"
     )
-    response = llm.invoke(prompt).content.lower()
+    try:
+        response = backends.llm_for("detect_ambiguity").invoke(prompt).content.lower()
+    except DeadlineExceeded as e:
+        backends.logger.log_message(state["session_id"], "detect_ambiguity", f"Ambiguity check ran out of time: {e}; assuming the question is clear")
+        return {"needs_clarification": False}
     ambiguous = "yes" in response
-    CustomLogger.log_message(state["session_id"], "detect_ambiguity", f"Ambiguity detected: {ambiguous}")
+    backends.logger.log_message(state["session_id"], "detect_ambiguity", f"Ambiguity detected: {ambiguous}")
     return {"needs_clarification": ambiguous}
 
 
-def clarify_question(state: GraphState) -> dict:
+@with_deadline
+def clarify_question(state: GraphState, backends: Optional[Backends] = None) -> dict:
     """
     Generates a clarification question to resolve ambiguity.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
     :return: Clarification question and flag indicating need for clarification
     """
-    CustomLogger.log_message(state["session_id"], "clarify_question", "Started processing clarify_question node")
-    # Convert each history entry (a dict) to a string format
-    conversation = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in state.get("chat_history", [])])
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "clarify_question", "Started processing clarify_question node")
+    # A known ambiguous entity gets its meanings from the local index instead of the LLM
+    options = backends.entities.clarification(state["original_question"], _entity_context(state))
+    if options is not None:
+        backends.logger.log_message(state["session_id"], "clarify_question", "Clarification options found in the entity index; skipping the LLM")
+        return {"clarified_question": options, "needs_clarification": True}
+    conversation = conversation_text(state)
     prompt = (
         f"Conversation so far:\n{conversation}\n\n"
         f"The user originally asked: \"{state['original_question']}\"\n"
         "Generate a follow-up clarification question in bullet points asking the user to specify their intent."
     )
-    clarification = llm.invoke(prompt).content
-    CustomLogger.log_message(state["session_id"], "clarify_question", f"Generated clarification: {clarification.strip()}")
+    try:
+        clarification = backends.llm_for("clarify").invoke(prompt).content
+    except DeadlineExceeded as e:
+        # Without a clarification question the run goes on with the question as asked
+        backends.logger.log_message(state["session_id"], "clarify_question", f"Clarification ran out of time: {e}; answering the original question")
+        return {"clarified_question": None, "needs_clarification": False}
+    backends.logger.log_message(state["session_id"], "clarify_question", f"Generated clarification: {clarification.strip()}")
     return {"clarified_question": clarification, "needs_clarification": True}
 
 
-def process_clarification(state: GraphState) -> dict:
+@with_deadline
+def process_clarification(state: GraphState, backends: Optional[Backends] = None) -> dict:
     """
     Processes the clarification question to determine if it is specific enough.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
     :return: Clarified question and flag indicating need for further clarification
     """
-    CustomLogger.log_message(state["session_id"], "process_clarification", "Started processing process_clarification node")
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "process_clarification", "Started processing process_clarification node")
     original = state["original_question"]
-    clarification = state.get("clarified_question", "").strip()
-    # Convert chat history entries (dicts) into strings
-    conversation = "\n".join(
-        [f"{msg['sender']}: {msg['message']}" for msg in state.get("chat_history", [])]
-    )
+    # A reply to a paused clarification question takes precedence over the generated clarification
+    answer = state.get("clarification_answer")
+    clarification = (answer or state.get("clarified_question") or "").strip()
+    conversation = conversation_text(state)
     # Check if clarification is too ambiguous: if it contains more than one bullet point, defer to user input
     bullet_points = [line for line in clarification.split("\n") if line.strip().startswith("-")]
-    if len(bullet_points) > 1:
-        CustomLogger.log_message(state["session_id"], "process_clarification", "Clarification is too ambiguous; deferring to user input.")
+    if not answer and len(bullet_points) > 1:
+        backends.logger.log_message(state["session_id"], "process_clarification", "Clarification is too ambiguous; deferring to user input.")
         return {"clarified_question": clarification, "needs_clarification": True}
     else:
         prompt = (
@@ -81,182 +121,387 @@ def process_clarification(state: GraphState) -> dict:
             f"Clarification provided: \"{clarification}\"\n"
             "Based on this, provide a clarified version of the question that best captures the intended meaning. Keep it concise."
         )
-        clarified = llm.invoke(prompt).content.strip()
-        CustomLogger.log_message(state["session_id"], "process_clarification", f"Clarified question: {clarified}")
+        try:
+            clarified = backends.llm_for("process_clarification").invoke(prompt).content.strip()
+        except DeadlineExceeded as e:
+            # The user's reply, if any, is kept next to the original question rather than merged by the LLM
+            clarified = f"{original} ({answer.strip()})" if answer else original
+            backends.logger.log_message(state["session_id"], "process_clarification", f"Clarification ran out of time: {e}; using: {clarified}")
+            return {"clarified_question": clarified, "needs_clarification": False}
+        backends.logger.log_message(state["session_id"], "process_clarification", f"Clarified question: {clarified}")
         return {"clarified_question": clarified, "needs_clarification": False}
 
 
-def transform_query(state: GraphState) -> dict:
+def await_clarification(state: GraphState, backends: Optional[Backends] = None) -> dict:
+    """
+    Pauses the run until the user answers the clarification question. Only used when the graph is compiled
+    with a checkpointer; the reply resumes the run here with the rest of the state intact.
+    :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
+    :return: The user's reply to the clarification question
+    """
+    from langgraph.types import interrupt
+
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "await_clarification", "Waiting for the user's clarification")
+    answer = interrupt({"clarification": state["clarified_question"]})
+    backends.logger.log_message(state["session_id"], "await_clarification", f"Clarification received: {answer}")
+    return {"clarification_answer": answer}
+
+
+@with_deadline
+def transform_query(state: GraphState, backends: Optional[Backends] = None) -> dict:
     """
     Transforms the query for better clarity.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
     :return: Optimized query if transformation is successful
     """
-    CustomLogger.log_message(state["session_id"], "transform_query", "Started processing transform_query node")
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "transform_query", "Started processing transform_query node")
     if state.get("needs_clarification", False):
-        CustomLogger.log_message(state["session_id"], "transform_query", "Skipping transformation due to ambiguous clarification.")
+        backends.logger.log_message(state["session_id"], "transform_query", "Skipping transformation due to ambiguous clarification.")
+        return {}
+    if budget_low(state):
+        backends.logger.log_message(state["session_id"], "transform_query", "Deadline budget low; skipping transformation")
         return {}
     # Use history to possibly refine the question further
-    conversation = "\n".join(state["chat_history"]) if state["chat_history"] else ""
+    conversation = conversation_text(state)
     question = state.get("clarified_question") or state["original_question"]
     prompt = (
         f"Conversation so far:\n{conversation}\n\n"
         f"Refine the following query for clarity based on the conversation: '{question}'"
     )
-    transformed = llm.invoke(prompt).content.strip()
+    try:
+        transformed = backends.llm_for("transform").invoke(prompt).content.strip()
+    except DeadlineExceeded as e:
+        backends.logger.log_message(state["session_id"], "transform_query", f"Transformation ran out of time: {e}; keeping the query")
+        return {}
     if transformed and transformed.lower() != question.lower():
-        CustomLogger.log_message(state["session_id"], "transform_query", f"Transformed query to: {transformed}")
+        backends.logger.log_message(state["session_id"], "transform_query", f"Transformed query to: {transformed}")
         return {"clarified_question": transformed}
     else:
-        CustomLogger.log_message(state["session_id"], "transform_query", "No transformation applied")
+        backends.logger.log_message(state["session_id"], "transform_query", "No transformation applied")
         return {}
 
 
-def retrieve_wikipedia(state: GraphState) -> dict:
+def _retrieve_all(backends: Backends, state: GraphState, node: str, lookups: List[tuple],
+                  fraction: float) -> List[List[Document]]:
     """
-    Retrieves relevant Wikipedia content for the query.
+    Runs the lookups concurrently under one timeout; identical lookups from concurrent runs are shared.
+    A lookup that fails or times out is logged and left out, so one slow variant does not cost the others.
+    :param lookups: (source, search function, query, to_documents) tuples
+    :param fraction: Share of the spendable deadline budget the lookups may use
+    :return: One document list per successful lookup, in lookup order
+    :raises Exception: The first error when every lookup failed with something other than a timeout
+    """
+    calls = [functools.partial(backends.retrieval_flight.do, (source, normalize_query(query)), search, query)
+             for source, search, query, _ in lookups]
+    outcomes = run_all_with_timeout(calls, timeout=call_timeout(state, fraction))
+    rankings, errors, shared = [], [], 0
+    for (source, _, _, to_documents), outcome in zip(lookups, outcomes):
+        if isinstance(outcome, BaseException):
+            errors.append(outcome)
+            continue
+        results, was_shared = outcome
+        shared += was_shared
+        rankings.append(to_documents(results))
+    if errors:
+        backends.logger.log_message(state["session_id"], node, f"{len(errors)} of {len(lookups)} lookup(s) failed: {errors[0]}")
+        if not rankings and not isinstance(errors[0], DeadlineExceeded):
+            raise errors[0]
+    if shared:
+        backends.logger.log_message(state["session_id"], node, f"{shared} lookup(s) shared with concurrent runs")
+    return rankings
+
+
+# WikipediaAPIWrapper.run joins its page summaries into one string, each starting with "Page: "
+_WIKIPEDIA_PAGE_BREAK = re.compile(r"\n\n(?=Page: )")
+_WIKIPEDIA_NO_RESULT = "No good Wikipedia Search Result was found"
+
+
+def _wikipedia_documents(results: Union[str, List[str]]) -> List[Document]:
+    if isinstance(results, str):
+        results = [] if results.startswith(_WIKIPEDIA_NO_RESULT) else _WIKIPEDIA_PAGE_BREAK.split(results)
+    return [Document(page_content=res, metadata={"source": "Wikipedia"}) for res in results if res.strip()]
+
+
+def _web_documents(results: List) -> List[Document]:
+    docs = []
+    for res in results:
+        if isinstance(res, dict):
+            content = res.get("content", "")
+            source = res.get("url", "unknown")
+        else:
+            content = res
+            source = "unknown"
+        docs.append(Document(page_content=content, metadata={"source": source}))
+    return docs
+
+
+@with_deadline
+def expand_query(state: GraphState, backends: Optional[Backends] = None, variants: int = 3) -> dict:
+    """
+    Generates alternative phrasings of the query in one LLM call, so the retrievers can look all of them up
+    concurrently (multi-query mode).
     :param state: The current state of the graph
-    :return: Retrieved Wikipedia documents
+    :param backends: Backend registry, defaults to the shared production backends
+    :param variants: Number of queries to retrieve with, including the query itself
+    :return: The query followed by its variants
     """
-    CustomLogger.log_message(state["session_id"], "retrieve_wikipedia", "Started processing retrieve_wikipedia node")
-    # Convert chat history from dicts to strings
-    conversation = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in state.get("chat_history", [])])
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "expand_query", "Started processing expand_query node")
     query = state.get("clarified_question") or state["original_question"]
+    if variants <= 1 or budget_low(state):
+        backends.logger.log_message(state["session_id"], "expand_query", "Retrieving with the query only")
+        return {"query_variants": [query]}
+    conversation = conversation_text(state)
     prompt = (
-        f"Conversation history:\n{conversation}\n\n"
-        f"Retrieve relevant Wikipedia content for the query: '{query}'."
+        f"Conversation so far:\n{conversation}\n\n"
+        f"Write {variants - 1} alternative search queries for: '{query}'. Use different wording or related terms "
+        "that could find the answer. Return one query per line and nothing else."
     )
-    wiki_results = wikipedia.run(prompt)
-    docs = [Document(page_content=res, metadata={"source": "Wikipedia"}) for res in wiki_results]
-    CustomLogger.log_message(state["session_id"], "retrieve_wikipedia", f"Retrieved {len(docs)} Wikipedia document(s)")
+    try:
+        response = backends.llm_for("expand").invoke(prompt).content
+    except DeadlineExceeded as e:
+        backends.logger.log_message(state["session_id"], "expand_query", f"Query expansion ran out of time: {e}; retrieving with the query only")
+        return {"query_variants": [query]}
+    query_variants = parse_variants(response, query, variants)
+    backends.logger.log_message(state["session_id"], "expand_query", f"Query variants: {query_variants}")
+    return {"query_variants": query_variants}
+
+
+def route_source(state: GraphState, backends: Optional[Backends] = None) -> dict:
+    """
+    Chooses where retrieval starts: Wikipedia, or straight to web search for questions Wikipedia is unlikely
+    to answer (see src/graph/routing.py).
+    :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
+    :return: The first source and the time of the decision
+    """
+    backends = backends or default_backends()
+    query = state.get("clarified_question") or state["original_question"]
+    source = backends.router.route(query)
+    backends.logger.log_message(state["session_id"], "route_source", f"Retrieving from {source} first")
+    return {"first_source": source, "routed_at": time.time()}
+
+
+@with_deadline
+def retrieve_wikipedia(state: GraphState, backends: Optional[Backends] = None,
+                       profile: Optional[GraphProfile] = None) -> dict:
+    """
+    Retrieves relevant Wikipedia content (and local knowledge base content, when configured) for the query.
+    Every query variant is looked up concurrently and the result lists are fused.
+    :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
+    :param profile: Graph profile with the passage limits, defaults to the built-in profile
+    :return: Retrieved Wikipedia documents
+    """
+    backends = backends or default_backends()
+    retrieval = (profile or DEFAULT_PROFILE).retrieval
+    backends.logger.log_message(state["session_id"], "retrieve_wikipedia", "Started processing retrieve_wikipedia node")
+    conversation = conversation_text(state)
+    query = state.get("clarified_question") or state["original_question"]
+    lookups = []
+    for variant in state.get("query_variants") or [query]:
+        prompt = (
+            f"Conversation history:\n{conversation}\n\n"
+            f"Retrieve relevant Wikipedia content for the query: '{variant}'."
+        )
+        lookups.append(("wikipedia", backends.wikipedia.run, prompt, _wikipedia_documents))
+        if backends.local is not None:
+            lookups.append(("local", backends.local.invoke, variant, list))
+    rankings = _retrieve_all(backends, state, "retrieve_wikipedia", lookups, 0.4)
+    pages = reciprocal_rank_fusion(rankings)
+    # Only the passages that best match the query are passed on to grading and answering
+    docs = best_passages(query, pages, retrieval.passages_per_source, retrieval.passage_tokens)
+    backends.logger.log_message(state["session_id"], "retrieve_wikipedia",
+                                f"Retrieved {len(pages)} distinct page(s) from {len(rankings)} lookup(s), "
+                                f"kept {len(docs)} passage(s)")
     return {"wikipedia_docs": docs}
 
 
-def grade_wikipedia(state: GraphState) -> dict:
+@with_deadline
+def grade_wikipedia(state: GraphState, backends: Optional[Backends] = None,
+                    profile: Optional[GraphProfile] = None) -> dict:
     """
     Grades the Wikipedia content to determine if it sufficiently answers the query.
     :param state: The current state of the graph
-    :return: Generated answer if Wikipedia content is sufficient
+    :param backends: Backend registry, defaults to the shared production backends
+    :param profile: Graph profile with the number of passages to grade, defaults to the built-in profile
+    :return: Whether the Wikipedia content is sufficient; the graph then routes to generate_answer or web search
     """
-    CustomLogger.log_message(state["session_id"], "grade_wikipedia", "Started processing grade_wikipedia node")
+    backends = backends or default_backends()
+    backends.logger.log_message(state["session_id"], "grade_wikipedia", "Started processing grade_wikipedia node")
     docs = state["wikipedia_docs"]
-    # Convert chat history entries to strings
-    conversation = "\n".join(
-        [f"{msg['sender']}: {msg['message']}" for msg in state.get("chat_history", [])]
-    )
+    conversation = conversation_text(state)
     query = state.get("clarified_question") or state["original_question"]
     if not docs:
-        CustomLogger.log_message(state["session_id"], "grade_wikipedia", "No Wikipedia docs found; triggering fallback")
-        return {"final_answer": None}
-    sample = docs[0].page_content[:1000]
+        backends.logger.log_message(state["session_id"], "grade_wikipedia", "No Wikipedia docs found; triggering fallback")
+        _record_wikipedia_outcome(state, backends, query, False)
+        return {"wikipedia_sufficient": False}
+    if budget_low(state):
+        backends.logger.log_message(state["session_id"], "grade_wikipedia", "Deadline budget low; answering from Wikipedia without grading")
+        return {"wikipedia_sufficient": True}
+    # The passages are ranked best first; the top ones are what an answer would mostly rely on
+    sample = "\n".join(doc.page_content for doc in docs[:(profile or DEFAULT_PROFILE).limits.grade_passages])
     prompt = (
         f"Conversation history:\n{conversation}\n\n"
         f"Does the following Wikipedia content sufficiently answer the query '{query}'? "
         "Respond ONLY with 'yes' or 'no'.\nContent: " + sample
     )
-    response = llm.invoke(prompt).content.lower()
-    if "yes" in response:
-        CustomLogger.log_message(state["session_id"], "grade_wikipedia", "Wikipedia content deemed sufficient")
-        return generate_answer(state)
-    CustomLogger.log_message(state["session_id"], "grade_wikipedia", "Wikipedia content insufficient; falling back to web search")
-    return {"final_answer": None}
+    try:
+        response = backends.llm_for("grade").invoke(prompt).content.lower()
+    except DeadlineExceeded as e:
+        # Like a low budget: answer from the Wikipedia passages without teaching the router an outcome
+        backends.logger.log_message(state["session_id"], "grade_wikipedia", f"Grading ran out of time: {e}; answering from Wikipedia without grading")
+        return {"wikipedia_sufficient": True}
+    sufficient = "yes" in response
+    _record_wikipedia_outcome(state, backends, query, sufficient)
+    if sufficient:
+        backends.logger.log_message(state["session_id"], "grade_wikipedia", "Wikipedia content deemed sufficient")
+        return {"wikipedia_sufficient": True}
+    backends.logger.log_message(state["session_id"], "grade_wikipedia", "Wikipedia content insufficient; falling back to web search")
+    return {"wikipedia_sufficient": False}
 
 
-def retrieve_web(state: GraphState) -> dict:
+def _record_wikipedia_outcome(state: GraphState, backends: Backends, query: str, sufficient: bool):
+    # Only runs that went through the router teach it; the leg is timed from the routing decision
+    if state.get("first_source") == "wikipedia":
+        backends.router.record(query, sufficient, time.time() - state["routed_at"])
+
+
+@with_deadline
+def retrieve_web(state: GraphState, backends: Optional[Backends] = None,
+                 profile: Optional[GraphProfile] = None) -> dict:
     """
-    Retrieves relevant web content for the query.
+    Retrieves relevant web content for the query. Every query variant is searched concurrently and the
+    result lists are fused before reranking.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
+    :param profile: Graph profile with the passage limits, defaults to the built-in profile
     :return: Uses Tavily to retrieve web documents
     """
-    CustomLogger.log_message(state["session_id"], "retrieve_web", "Started processing retrieve_web node")
-    # Convert each history entry (a dict) to a string: "Sender: Message"
-    conversation = "\n".join(
-        [f"{msg.get('sender', 'Unknown')}: {msg.get('message', '')}" for msg in state.get("chat_history", [])]
-    )
+    backends = backends or default_backends()
+    retrieval = (profile or DEFAULT_PROFILE).retrieval
+    backends.logger.log_message(state["session_id"], "retrieve_web", "Started processing retrieve_web node")
+    conversation = conversation_text(state)
     query = state.get("clarified_question") or state["original_question"]
-    prompt = (
-        f"Conversation history:\n{conversation}\n\n"
-        f"Perform a web search for: '{query}' and return the top results."
-    )
-    results = web_search.invoke(prompt)
-    docs = []
-    for res in results:
-        if isinstance(res, dict):
-            content = res.get("content", "")
-            source = res.get("url", "unknown")
-        else:
-            content = res
-            source = "unknown"
-        docs.append(Document(page_content=content, metadata={"source": source}))
-    CustomLogger.log_message(state["session_id"], "retrieve_web", f"Retrieved {len(docs)} web document(s)")
+    lookups = []
+    for variant in state.get("query_variants") or [query]:
+        prompt = (
+            f"Conversation history:\n{conversation}\n\n"
+            f"Perform a web search for: '{variant}' and return the top results."
+        )
+        lookups.append(("web", backends.web_search.invoke, prompt, _web_documents))
+    rankings = _retrieve_all(backends, state, "retrieve_web", lookups, 0.5)
+    results = reciprocal_rank_fusion(rankings)
+    docs = best_passages(query, results, retrieval.passages_per_source, retrieval.passage_tokens)
+    backends.logger.log_message(state["session_id"], "retrieve_web",
+                                f"Retrieved {len(results)} distinct web document(s) from {len(rankings)} lookup(s), "
+                                f"kept {len(docs)} passage(s)")
     return {"web_docs": docs}
 
 
-def rerank_documents(state: GraphState) -> dict:
+@with_deadline
+def rerank_documents(state: GraphState, backends: Optional[Backends] = None,
+                     profile: Optional[GraphProfile] = None) -> dict:
     """
     Reranks the web documents based on relevance.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
+    :param profile: Graph profile with the rerank limits, defaults to the built-in profile
     :return: Performs reranking of web documents
     """
-    CustomLogger.log_message(state["session_id"], "rerank_documents", "Started processing rerank_documents node")
+    backends = backends or default_backends()
+    limits = (profile or DEFAULT_PROFILE).limits
+    top_k = limits.rerank_top_k
+    backends.logger.log_message(state["session_id"], "rerank_documents", "Started processing rerank_documents node")
     query = state.get("clarified_question") or state["original_question"]
     docs = state["web_docs"]
     if not docs:
-        CustomLogger.log_message(state["session_id"], "rerank_documents", "No web docs to rerank")
+        backends.logger.log_message(state["session_id"], "rerank_documents", "No web docs to rerank")
         return {"reranked_docs": []}
+    if budget_low(state):
+        backends.logger.log_message(state["session_id"], "rerank_documents", f"Deadline budget low; keeping the first {top_k} docs")
+        return {"reranked_docs": docs[:top_k]}
+    if backends.reranker is not None:
+        reranked = backends.reranker(query, docs)[:top_k]
+        backends.logger.log_message(state["session_id"], "rerank_documents", f"Reranker kept {len(reranked)} document(s)")
+        return {"reranked_docs": reranked}
 
-    # Convert chat history entries (dicts) to strings
-    conversation = "\n".join(
-        [f"{msg.get('sender', 'Unknown')}: {msg.get('message', '')}" for msg in state.get("chat_history", [])]
-    )
-    doc_summaries = "\n".join([f"Doc {i}: {doc.page_content[:200]}" for i, doc in enumerate(docs)])
+    conversation = conversation_text(state)
+    doc_summaries = "\n".join([f"Doc {i}: {doc.page_content[:limits.rerank_summary_chars]}" for i, doc in enumerate(docs)])
 
     prompt = (
             f"Conversation history:\n{conversation}\n\n"
             f"Based on the conversation history and the query '{query}', rank these documents by relevance. "
-            "Return the indices of the top 3 documents as comma-separated numbers.\nDocuments:\n" + doc_summaries
+            f"Return the indices of the top {top_k} documents as comma-separated numbers.\nDocuments:\n" + doc_summaries
     )
 
     try:
-        response = llm.invoke(prompt).content
+        response = backends.llm_for("rerank").invoke(prompt).content
         indices = [int(x.strip()) for x in response.split(",") if x.strip().isdigit()]
-        valid = [docs[i] for i in indices if 0 <= i < len(docs)]
-        CustomLogger.log_message(state["session_id"], "rerank_documents", f"Selected document indices: {indices}")
+        valid = [docs[i] for i in indices if 0 <= i < len(docs)][:top_k]
+        backends.logger.log_message(state["session_id"], "rerank_documents", f"Selected document indices: {indices}")
         return {"reranked_docs": valid}
     except Exception as e:
-        CustomLogger.log_message(state["session_id"], "rerank_documents",
-                                 f"Error during reranking: {str(e)}; defaulting to first 3 docs")
-        return {"reranked_docs": docs[:3]}
+        backends.logger.log_message(state["session_id"], "rerank_documents",
+                                    f"Error during reranking: {str(e)}; defaulting to first {top_k} docs")
+        return {"reranked_docs": docs[:top_k]}
 
 
-def generate_answer(state: GraphState) -> dict:
+@with_deadline
+def generate_answer(state: GraphState, backends: Optional[Backends] = None,
+                    profile: Optional[GraphProfile] = None) -> dict:
     """
     Generates a concise answer based on the conversation history and retrieved documents.
     :param state: The current state of the graph
+    :param backends: Backend registry, defaults to the shared production backends
+    :param profile: Graph profile with the context budgets, defaults to the built-in profile
     :return: Generated answer
     """
-    CustomLogger.log_message(state["session_id"], "generate_answer", "Started processing generate_answer node")
-    # Convert each entry in chat_history to a string format.
-    conversation = "\n".join(
-        [f"{msg.get('sender', 'Unknown')}: {msg.get('message', '')}" for msg in state.get("chat_history", [])]
-    ) if state.get("chat_history") else ""
-
+    backends = backends or default_backends()
+    limits = (profile or DEFAULT_PROFILE).limits
+    backends.logger.log_message(state["session_id"], "generate_answer", "Started processing generate_answer node")
     query = state.get("clarified_question") or state["original_question"]
 
-    if state["wikipedia_docs"]:
+    # When rerank was skipped, fall back to the unranked web results
+    web_docs = state.get("reranked_docs") or state.get("web_docs", [])[:limits.rerank_top_k]
+    # Wikipedia docs graded as insufficient are ignored in favour of the web results, if there are any
+    if state["wikipedia_docs"] and (state.get("wikipedia_sufficient") is not False or not web_docs):
         source = "Wikipedia"
-        content = "\n".join([d.page_content[:500] for d in state["wikipedia_docs"]])
+        docs = state["wikipedia_docs"]
     else:
         source = "Web"
-        content = "\n".join([d.page_content[:500] for d in state["reranked_docs"]])
+        docs = web_docs
+    # The evidence and the conversation share one token budget; the conversation is trimmed first
+    packed = pack_context(query, docs, ChatHistory.coerce(state.get("chat_history")), limits.context_token_budget,
+                          limits.history_token_budget, limits.max_passage_tokens)
+    content = packed.content
+    backends.logger.log_message(state["session_id"], "generate_answer",
+                                f"Packed {len(packed.passages)} passage(s) and the conversation into {packed.tokens} "
+                                f"tokens ({packed.dropped} passage(s) dropped)")
 
     prompt = (
-        f"Conversation history:\n{conversation}\n\n"
+        f"Conversation history:\n{packed.conversation}\n\n"
         f"Generate a concise 1-2 sentence answer for the query: '{query}'. "
         f"Use the following content from {source}:\n{content}\n"
         "Include the source in parentheses at the end."
     )
 
-    answer = llm.invoke(prompt).content.strip()
-    CustomLogger.log_message(state["session_id"], "generate_answer", f"Generated answer: {answer}")
+    try:
+        if state.get("chat_history"):
+            answer = backends.llm_for("generate").invoke(prompt).content.strip()
+        else:
+            # Without history the prompt only depends on the query and the docs, so identical
+            # questions arriving together can share one generation
+            key = ("answer", normalize_query(query), source, hash(content))
+            answer, _ = backends.answer_flight.do(key, lambda: backends.llm_for("generate").invoke(prompt).content.strip())
+    except DeadlineExceeded as e:
+        backends.logger.log_message(state["session_id"], "generate_answer", f"Answer generation ran out of time: {e}")
+        if not docs:
+            return {"final_answer": "Sorry, I could not find an answer in time. Please try again."}
+        answer = f"{docs[0].page_content[:limits.fallback_answer_chars].strip()} ({docs[0].metadata.get('source', source)})"
+    backends.logger.log_message(state["session_id"], "generate_answer", f"Generated answer: {answer}")
     return {"final_answer": answer}
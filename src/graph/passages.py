@@ -0,0 +1,74 @@
+"""
+This module contains the passage helpers, which split retrieved pages into passages and keep only the
+ones that best match the query.
+"""
+import functools
+import os
+from typing import List, Sequence
+
+from langchain_core.documents import Document
+
+from src.graph.tokens import count_tokens
+# Same chunking as Ingestion.text_splitter
+from src.ingestion.settings import CHUNK_OVERLAP, CHUNK_SIZE
+
+# Passages kept per retrieval
+PASSAGES_PER_SOURCE = int(os.getenv("PASSAGES_PER_SOURCE", "4"))
+
+
+@functools.lru_cache(maxsize=None)
+def _splitter(chunk_size: int, chunk_overlap: int):
+    # Imported here so importing the graph stays cheap
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # Token-sized chunks like RecursiveCharacterTextSplitter.from_tiktoken_encoder, measured with the shared
+    # counter so chunking keeps working where the tiktoken encoding cannot be downloaded
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                          length_function=count_tokens)
+
+
+def split_passages(docs: Sequence[Document], chunk_size: int = CHUNK_SIZE,
+                   chunk_overlap: int = CHUNK_OVERLAP) -> List[Document]:
+    """
+    Splits documents into token-sized passages; each passage keeps its document's metadata.
+    :param docs: Retrieved documents
+    :param chunk_size: Passage size in tokens
+    :param chunk_overlap: Tokens shared by consecutive passages
+    :return: Passages in document order
+    """
+    return _splitter(chunk_size, chunk_overlap).split_documents(list(docs))
+
+
+def rank_passages(query: str, passages: Sequence[Document], k: int = PASSAGES_PER_SOURCE) -> List[Document]:
+    """
+    Scores all passages against the query in one TF-IDF pass and returns the best ones.
+    :param query: The search query
+    :param passages: Candidate passages
+    :param k: Number of passages to keep
+    :return: Up to k passages, best first; ties keep the retrieval order
+    """
+    passages = list(passages)
+    if len(passages) <= 1 or k <= 0:
+        return passages[:max(k, 0)]
+    # scikit-learn is imported on first use so importing the graph stays cheap
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    import numpy as np
+
+    vectorizer = TfidfVectorizer(sublinear_tf=True, stop_words="english")
+    try:
+        matrix = vectorizer.fit_transform([doc.page_content for doc in passages] + [query])
+    except ValueError:
+        # Nothing but stop words; keep the retrieval order
+        return passages[:k]
+    # Rows are L2-normalised, so the dot product with the query row is the cosine similarity
+    scores = (matrix[:-1] @ matrix[-1].T).toarray().ravel()
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [passages[i] for i in order]
+
+
+def best_passages(query: str, docs: Sequence[Document], k: int = PASSAGES_PER_SOURCE,
+                  chunk_size: int = CHUNK_SIZE) -> List[Document]:
+    """
+    Splits retrieved documents into passages of chunk_size tokens and keeps the k that best match the query.
+    """
+    return rank_passages(query, split_passages(docs, chunk_size), k)
@@ -0,0 +1,251 @@
+"""
+This module contains the client-side rate limiting and retry helpers used in front of
+the external clients (OpenAI, Wikipedia and Tavily).
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+
+# Absolute deadline (time.monotonic based) of the request currently being processed
+_current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("current_deadline", default=None)
+
+# Exception class names raised by openai / requests / httpx for transient transport failures
+RETRYABLE_EXCEPTION_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+    "InternalServerError",
+    "ConnectionError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "Timeout",
+    "TimeoutException",
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a call cannot complete before the request deadline.
+    """
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    """
+    Sets the request deadline for every rate limited call made inside the block.
+    :param deadline: Absolute deadline in time.monotonic() seconds, or None for no deadline
+    """
+    token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """
+    Returns the deadline set by the innermost deadline_scope, if any.
+    """
+    return _current_deadline.get()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Callers reserve capacity up front and sleep outside of the lock,
+    so waiting callers are served roughly in arrival order.
+    """
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        if per_minute <= 0:
+            raise ValueError("per_minute must be positive")
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, deadline: Optional[float] = None) -> float:
+        """
+        Reserves the given amount of tokens.
+        :param amount: Number of tokens to take from the bucket
+        :param deadline: Absolute time.monotonic() deadline the wait must not exceed
+        :return: Seconds the caller has to wait before using the reservation
+        :raises DeadlineExceeded: When the wait would run past the deadline
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (amount - self._tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded("Rate limit wait would exceed the request deadline")
+            # The balance may go negative; that is the queue of reservations still to be served
+            self._tokens -= amount
+            return wait
+
+    def refund(self, amount: float):
+        """
+        Returns a reservation that will not be used, e.g. when a later limit of the same call gave up.
+        """
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and (optionally) tokens-per-minute limits for one external service.
+    """
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Blocks until one request (and the given number of tokens) may be sent.
+        :param tokens: Estimated tokens the request will consume
+        :param deadline: Absolute time.monotonic() deadline
+        """
+        wait = self.requests.reserve(1, deadline)
+        if self.tokens is not None and tokens:
+            try:
+                # A single request can never need more than a full bucket
+                wait = max(wait, self.tokens.reserve(min(tokens, self.tokens.capacity), deadline))
+            except BaseException:
+                # The request is not sent, so its slot goes back to the waiting callers
+                self.requests.refund(1)
+                raise
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RetryPolicy:
+    """
+    Retry settings for transient failures: full-jitter exponential backoff bounded by
+    a number of attempts and by the overall request deadline.
+    """
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_elapsed: Optional[float] = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns the jittered delay before the given retry attempt (1-based).
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Decides whether an exception from an external client is worth retrying (429, 5xx or transport errors).
+    """
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in RETRYABLE_EXCEPTION_NAMES
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(fn: Callable[..., Any], *args, limiter: Optional[RateLimiter] = None, tokens: int = 0,
+                    policy: Optional[RetryPolicy] = None, **kwargs) -> Any:
+    """
+    Calls fn through the rate limiter, retrying transient failures with jittered exponential backoff.
+    :param fn: The client call to make
+    :param limiter: Rate limiter of the external service
+    :param tokens: Estimated tokens consumed by the call
+    :param policy: Retry policy, defaults to RetryPolicy()
+    :return: The return value of fn
+    :raises DeadlineExceeded: When the request deadline passes before a successful attempt
+    """
+    policy = policy or RetryPolicy()
+    started = time.monotonic()
+    deadline = current_deadline()
+    if policy.max_elapsed is not None:
+        own_deadline = started + policy.max_elapsed
+        deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+
+    attempt = 1
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens, deadline)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= policy.max_attempts or not is_retryable(e):
+                raise
+            delay = max(policy.backoff(attempt), _retry_after(e) or 0.0)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise DeadlineExceeded(f"Giving up after {attempt} attempt(s): {e}") from e
+            time.sleep(delay)
+            attempt += 1
+
+
+def estimate_tokens(prompt: Any, completion_tokens: int = 256) -> int:
+    """
+    Cheap token estimate (about four characters per token) used for tokens-per-minute accounting.
+    """
+    return len(str(prompt)) // 4 + completion_tokens
+
+
+class RateLimitedClient:
+    """
+    Wraps an external client so that invoke() and run() go through a rate limiter and retry policy.
+    Every other attribute is delegated to the wrapped client.
+    """
+    def __init__(self, client: Any, limiter: RateLimiter, policy: Optional[RetryPolicy] = None,
+                 token_estimator: Optional[Callable[[Any], int]] = None):
+        self._client = client
+        self._limiter = limiter
+        self._policy = policy
+        self._token_estimator = token_estimator
+
+    def _call(self, method: str, payload: Any, *args, **kwargs) -> Any:
+        tokens = self._token_estimator(payload) if self._token_estimator else 0
+        return call_with_retry(getattr(self._client, method), payload, *args, limiter=self._limiter,
+                               tokens=tokens, policy=self._policy, **kwargs)
+
+    def invoke(self, payload: Any, *args, **kwargs) -> Any:
+        return self._call("invoke", payload, *args, **kwargs)
+
+    def run(self, payload: Any, *args, **kwargs) -> Any:
+        return self._call("run", payload, *args, **kwargs)
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._client, item)
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+# One shared limiter per external service, sized from the environment
+OPENAI_LIMITER = RateLimiter("openai", _env_float("OPENAI_RPM", 500), _env_float("OPENAI_TPM", 150000))
+WIKIPEDIA_LIMITER = RateLimiter("wikipedia", _env_float("WIKIPEDIA_RPM", 200))
+TAVILY_LIMITER = RateLimiter("tavily", _env_float("TAVILY_RPM", 100))
+DEFAULT_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", "4")),
+    max_elapsed=_env_float("RETRY_MAX_ELAPSED_SECONDS", 30.0),
+)
@@ -0,0 +1,240 @@
+"""
+This module contains the trace recorder: in record mode every /chat request is written to a gzip-compressed
+JSONL file with its inputs, every external call the graph made (LLM prompts and responses, retrieval queries
+and results) and their timings, so the traffic can be replayed offline (see src/graph/replay.py).
+"""
+import contextvars
+import gzip
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+import orjson
+from langchain_core.documents import Document
+
+from src.graph.backends import Backends
+from src.graph.singleflight import SingleFlight
+
+TRACE_FORMAT_VERSION = 1
+
+# The trace of the request being handled; worker threads see it through copied contexts
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    Converts call inputs and outputs to JSON: Documents and chat messages are tagged so replay can rebuild them.
+    """
+    if isinstance(value, Document):
+        return {"__document__": {"page_content": value.page_content, "metadata": value.metadata}}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "content"):
+        return {"__message__": to_jsonable(value.content)}
+    return repr(value)
+
+
+class Trace:
+    """
+    Everything recorded for one request.
+    """
+    __slots__ = ("trace_id", "session_id", "inputs", "calls", "result", "error", "started_at", "_started")
+
+    def __init__(self, session_id: str, inputs: dict):
+        self.trace_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.inputs = inputs
+        self.calls: List[dict] = []
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+    def add_call(self, kind: str, name: str, payload: Any, output: Any, error: Optional[BaseException],
+                 started: float, seconds: float):
+        # list.append is atomic, so concurrent lookups of one request can record without a lock
+        self.calls.append({
+            "kind": kind,
+            "name": name,
+            "input": to_jsonable(payload),
+            "output": None if error is not None else to_jsonable(output),
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+            "offset": round(started - self._started, 6),
+            "seconds": round(seconds, 6),
+        })
+
+    def finish(self, result: dict, cached: bool = False):
+        """
+        Records the answer of the request.
+        """
+        self.result = {
+            "final_answer": result.get("final_answer"),
+            "awaiting_clarification": bool(result.get("__interrupt__")),
+            "cached": cached,
+            # The live router learns and explores, so replay pins the source it chose
+            "first_source": result.get("first_source"),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "version": TRACE_FORMAT_VERSION,
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "seconds": round(time.perf_counter() - self._started, 6),
+            "inputs": self.inputs,
+            "calls": sorted(self.calls, key=lambda call: call["offset"]),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class RecordingClient:
+    """
+    Wraps a backend so that its invoke() and run() calls are added to the current request's trace.
+    Every other attribute is delegated to the wrapped client.
+    """
+    def __init__(self, resolve: Callable[[], Any], kind: str, name: str):
+        # The client is resolved on first use so shared clients are still built lazily
+        self._resolve = resolve
+        self._client = None
+        self.kind = kind
+        self.name = name
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = self._resolve()
+        return self._client
+
+    def _call(self, method: str, payload: Any, *args, **kwargs) -> Any:
+        trace = _current_trace.get()
+        if trace is None:
+            return getattr(self.client, method)(payload, *args, **kwargs)
+        started = time.perf_counter()
+        output, error = None, None
+        try:
+            output = getattr(self.client, method)(payload, *args, **kwargs)
+            return output
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            trace.add_call(self.kind, self.name, payload, output, error, started, time.perf_counter() - started)
+
+    def invoke(self, payload: Any, *args, **kwargs) -> Any:
+        return self._call("invoke", payload, *args, **kwargs)
+
+    def run(self, payload: Any, *args, **kwargs) -> Any:
+        return self._call("run", payload, *args, **kwargs)
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self.client, item)
+
+
+def recording_backends(backends: Backends) -> Backends:
+    """
+    Returns a registry whose LLMs and retrievers record their calls into the current trace.
+    The reranker, clarity classifier, entity index, router and logger are shared with the given registry.
+    Concurrent identical calls are not coalesced: a run that shared another run's result would have no call of
+    its own in its trace, and could not be replayed.
+    """
+    def llm(role):
+        return RecordingClient(lambda: backends.llm_for(role), "llm", role)
+
+    registry = Backends(
+        llms={role: llm(role) for role in Backends.ROLES},
+        wikipedia=RecordingClient(lambda: backends.wikipedia, "retrieval", "wikipedia"),
+        web_search=RecordingClient(lambda: backends.web_search, "retrieval", "web_search"),
+        local=None if backends.local is None else RecordingClient(lambda: backends.local, "retrieval", "local"),
+        reranker=backends.reranker,
+        logger=backends.logger,
+        clarity=backends.clarity,
+        router=backends.router,
+        entities=backends.entities,
+    )
+    registry.retrieval_flight = SingleFlight("retrieval", enabled=False)
+    registry.answer_flight = SingleFlight("answer", enabled=False)
+    return registry
+
+
+class Recorder:
+    """
+    Appends request traces to a gzip-compressed JSONL file. A recorder without a path is disabled: its
+    traces are collected but never written.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    @classmethod
+    def from_env(cls) -> "Recorder":
+        """
+        Creates the recorder configured by RECORD_TRACES (path of the .jsonl.gz file; unset disables recording).
+        """
+        return cls(os.getenv("RECORD_TRACES") or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @contextmanager
+    def trace(self, session_id: str, inputs: dict) -> Iterator[Trace]:
+        """
+        Records the external calls made inside the block and writes the trace when it exits.
+        :param session_id: Session ID
+        :param inputs: JSON-serializable request inputs (see replay.initial_state for what replay needs)
+        """
+        trace = Trace(session_id, inputs)
+        if not self.enabled:
+            yield trace
+            return
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_trace.reset(token)
+            self.write(trace)
+
+    def write(self, trace: Trace):
+        line = orjson.dumps(trace.to_dict(), option=orjson.OPT_NON_STR_KEYS) + b"\n"
+        with self._lock:
+            if self._file is None:
+                # Appending starts a new gzip member; readers see one continuous stream
+                self._file = gzip.open(self.path, "ab")
+            self._file.write(line)
+            # Flush per trace so a crash loses at most the request in flight
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def load_traces(path: str) -> Iterator[dict]:
+    """
+    Reads the traces of a recording, oldest first.
+    """
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+        except EOFError:
+            # The recording process was stopped without closing the file; the flushed traces are complete
+            return
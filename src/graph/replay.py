@@ -0,0 +1,333 @@
+"""
+This module contains the replay engine, which re-runs build_workflow against a recording made in record mode
+(see src/graph/recording.py). External calls are answered from the recording, after sleeping for their
+original latency times a scale factor, so performance changes can be compared on real traffic offline.
+
+Usage:
+    python -m src.graph.replay traces.jsonl.gz --latency-scale 1.0 --output report.json
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from langchain_core.documents import Document
+
+from src.graph.backends import Backends
+from src.graph.config import GraphConfig, load_config
+from src.graph.deadline import new_deadline
+from src.graph.history import ChatHistory
+from src.graph.recording import load_traces, to_jsonable
+
+
+class ReplayMiss(LookupError):
+    """
+    Raised when the graph makes an external call the recording has no answer for.
+    """
+
+
+class ReplayedError(RuntimeError):
+    """
+    Raised for a call that failed in the recording.
+    """
+
+
+class ReplayMessage:
+    """
+    Stand-in for a recorded chat model response.
+    """
+    __slots__ = ("content",)
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+def from_jsonable(value: Any) -> Any:
+    """
+    Rebuilds the Documents and chat messages tagged by recording.to_jsonable.
+    """
+    if isinstance(value, list):
+        return [from_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        if "__document__" in value:
+            return Document(**value["__document__"])
+        if "__message__" in value:
+            return ReplayMessage(value["__message__"])
+        return {key: from_jsonable(item) for key, item in value.items()}
+    return value
+
+
+class TraceCalls:
+    """
+    The recorded calls of one trace, looked up by exact input first and by position second, so replay keeps
+    working after a prompt wording change. Each recorded call answers at most once.
+    """
+    def __init__(self, calls: Iterable[dict]):
+        self._calls = list(calls)
+        self._exact: Dict[Tuple[str, str, str], List[int]] = defaultdict(list)
+        self._ordered: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for index, call in enumerate(self._calls):
+            self._exact[(call["kind"], call["name"], _input_key(call["input"]))].append(index)
+            self._ordered[(call["kind"], call["name"])].append(index)
+        self._used = set()
+        self._lock = threading.Lock()
+        self.misses = 0
+        self.inexact = 0
+
+    def has(self, kind: str, name: str) -> bool:
+        return bool(self._ordered.get((kind, name)))
+
+    def take(self, kind: str, name: str, payload: Any) -> dict:
+        """
+        Returns the recorded call answering this one.
+        :raises ReplayMiss: When every recorded call of that kind and name has been used
+        """
+        with self._lock:
+            for candidates, exact in ((self._exact.get((kind, name, _input_key(to_jsonable(payload)))), True),
+                                      (self._ordered.get((kind, name)), False)):
+                index = next((i for i in candidates or () if i not in self._used), None)
+                if index is not None:
+                    self._used.add(index)
+                    self.inexact += not exact
+                    return self._calls[index]
+            self.misses += 1
+        raise ReplayMiss(f"No recorded {kind} call left for {name!r}")
+
+
+def _input_key(value: Any) -> str:
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode()
+
+
+class ReplayClient:
+    """
+    Answers invoke() and run() calls from the recording after the recorded (scaled) latency.
+    """
+    def __init__(self, calls: TraceCalls, kind: str, name: str, latency_scale: float = 1.0):
+        self.calls = calls
+        self.kind = kind
+        self.name = name
+        self.latency_scale = latency_scale
+
+    def _call(self, payload: Any) -> Any:
+        call = self.calls.take(self.kind, self.name, payload)
+        if self.latency_scale > 0:
+            time.sleep(call["seconds"] * self.latency_scale)
+        if call["error"] is not None:
+            raise ReplayedError(call["error"])
+        return from_jsonable(call["output"])
+
+    def invoke(self, payload: Any, *args, **kwargs) -> Any:
+        return self._call(payload)
+
+    def run(self, payload: Any, *args, **kwargs) -> Any:
+        return self._call(payload)
+
+
+class _QuietLogger:
+    @staticmethod
+    def log_message(session_id: str, node: str, message: str):
+        pass
+
+
+class RecordedRouter:
+    """
+    Stand-in for the SourceRouter that always picks the source the recorded request started from, so replay makes
+    the same retrieval calls whatever the live router has learned since. It learns nothing.
+    """
+    __slots__ = ("source",)
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def route(self, question: str) -> str:
+        return self.source
+
+    def record(self, question: str, sufficient: bool, leg_seconds: Optional[float] = None):
+        pass
+
+
+def replay_backends(calls: TraceCalls, latency_scale: float = 1.0, base: Optional[Backends] = None,
+                    first_source: Optional[str] = None) -> Backends:
+    """
+    Builds a registry whose LLMs and retrievers answer from the recorded calls.
+    :param base: Registry to take the reranker, clarity classifier, entity index and router from
+    :param first_source: Source the recorded request started retrieval from; pins the router when given
+    """
+    def client(kind, name):
+        return ReplayClient(calls, kind, name, latency_scale)
+
+    return Backends(
+        llms={role: client("llm", role) for role in Backends.ROLES},
+        wikipedia=client("retrieval", "wikipedia"),
+        web_search=client("retrieval", "web_search"),
+        # Only look up the local retriever when the recorded deployment had one
+        local=client("retrieval", "local") if calls.has("retrieval", "local") else None,
+        reranker=base.reranker if base is not None else None,
+        logger=_QuietLogger,
+        clarity=base.clarity if base is not None else None,
+        router=RecordedRouter(first_source) if first_source else base.router if base is not None else None,
+        entities=base.entities if base is not None else None,
+    )
+
+
+def initial_state(trace: dict) -> dict:
+    """
+    Rebuilds the graph input of a recorded request.
+    """
+    inputs = trace["inputs"]
+    return {
+        "chat_history": ChatHistory.coerce(inputs.get("chat_history")),
+        "original_question": inputs["user_message"],
+        "clarified_question": None,
+        "query_variants": [],
+        "wikipedia_docs": [],
+        "wikipedia_sufficient": None,
+        "web_docs": [],
+        "reranked_docs": [],
+        "final_answer": None,
+        "needs_clarification": False,
+        "clarification_answer": None,
+        "first_source": None,
+        "routed_at": None,
+        "session_id": trace["session_id"],
+        "deadline": new_deadline(inputs["deadline_seconds"]) if inputs.get("deadline_seconds") else None,
+    }
+
+
+def replayable(trace: dict) -> bool:
+    """
+    Tells whether a trace can be replayed on its own: cache hits never ran the graph, and runs that paused for
+    or resumed from a clarification depend on the checkpoint of another request.
+    """
+    result = trace.get("result") or {}
+    return not (result.get("cached") or result.get("awaiting_clarification") or trace["inputs"].get("resume"))
+
+
+def replay_trace(trace: dict, latency_scale: float = 1.0, build_options: Optional[dict] = None,
+                 base: Optional[Backends] = None, config: Optional[GraphConfig] = None) -> dict:
+    """
+    Re-runs one recorded request.
+    :param trace: The recorded trace
+    :param latency_scale: Factor for the recorded call latencies (0 replays without waiting)
+    :param build_options: Extra keyword arguments for build_workflow, e.g. {"query_variants": 3}; without a
+        "profile", the graph is built for the profile the request was recorded under
+    :param base: Registry to take the reranker, clarity classifier, entity index and router from
+    :param config: Configuration to look the recorded profile up in, defaults to load_config()
+    :return: Recorded and replayed timings and whether the answer matched
+    """
+    from src.graph.graph import build_workflow
+
+    options = dict(build_options or {})
+    if "profile" not in options and trace["inputs"].get("profile"):
+        options["profile"] = (config or load_config()).profile(trace["inputs"]["profile"])
+    calls = TraceCalls(trace["calls"])
+    # Traces recorded before first_source was kept fall back to the router of base
+    first_source = (trace.get("result") or {}).get("first_source")
+    backends = replay_backends(calls, latency_scale, base, first_source)
+    graph = build_workflow(backends, **options).compile()
+    # Keep one-off model training out of the measured time
+    backends.clarity.warm_up()
+    backends.entities.warm_up()
+    started = time.perf_counter()
+    error = None
+    try:
+        result = graph.invoke(initial_state(trace))
+    except Exception as e:
+        result, error = {}, f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - started
+    recorded_answer = (trace.get("result") or {}).get("final_answer")
+    return {
+        "trace_id": trace["trace_id"],
+        "recorded_seconds": trace["seconds"],
+        "replayed_seconds": round(seconds, 6),
+        "recorded_calls": len(trace["calls"]),
+        "inexact_calls": calls.inexact,
+        "missed_calls": calls.misses,
+        "answer_matches": result.get("final_answer") == recorded_answer,
+        "error": error,
+    }
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(results: List[dict], skipped: int = 0) -> dict:
+    """
+    Aggregates per-trace replay results into latency percentiles and match rates.
+    """
+    def latency(key):
+        values = [r[key] for r in results]
+        return {"p50": _percentile(values, 50), "p95": _percentile(values, 95),
+                "mean": statistics.fmean(values) if values else None}
+
+    return {
+        "replayed": len(results),
+        "skipped": skipped,
+        "errors": sum(r["error"] is not None for r in results),
+        "answer_match_rate": (sum(r["answer_matches"] for r in results) / len(results)) if results else None,
+        "inexact_calls": sum(r["inexact_calls"] for r in results),
+        "missed_calls": sum(r["missed_calls"] for r in results),
+        "recorded_seconds": latency("recorded_seconds"),
+        "replayed_seconds": latency("replayed_seconds"),
+    }
+
+
+def replay(path: str, latency_scale: float = 1.0, limit: Optional[int] = None,
+           build_options: Optional[dict] = None, base: Optional[Backends] = None) -> dict:
+    """
+    Replays a recording request by request.
+    :param path: Recording (.jsonl.gz) written in record mode
+    :param latency_scale: Factor for the recorded call latencies (0 replays without waiting)
+    :param limit: Replay at most this many traces
+    :param build_options: Extra keyword arguments for build_workflow
+    :param base: Registry to take the reranker, clarity classifier, entity index and router from
+    :return: The summary and the per-trace results
+    """
+    config = load_config()
+    results, skipped = [], 0
+    for trace in load_traces(path):
+        if limit is not None and len(results) >= limit:
+            break
+        if not replayable(trace):
+            skipped += 1
+            continue
+        results.append(replay_trace(trace, latency_scale, build_options, base, config))
+    return {"summary": summarize(results, skipped), "traces": results}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded /chat traces against the current graph.")
+    parser.add_argument("recording", help="Trace file written with RECORD_TRACES")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Factor for recorded call latencies; 0 measures graph overhead only")
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many traces")
+    parser.add_argument("--profile",
+                        help="Replay every trace with this config.yaml profile instead of the recorded one")
+    parser.add_argument("--query-variants", type=int, default=None, help="Override the profile's query_variants")
+    parser.add_argument("--output", help="Write the full JSON report to this file")
+    args = parser.parse_args(argv)
+
+    build_options = {}
+    if args.profile:
+        build_options["profile"] = load_config().profile(args.profile)
+    if args.query_variants is not None:
+        build_options["query_variants"] = args.query_variants
+    report = replay(args.recording, args.latency_scale, args.limit, build_options)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    sys.stdout.write(orjson.dumps(report["summary"], option=orjson.OPT_INDENT_2).decode() + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+This module contains the SourceRouter, which predicts whether Wikipedia is likely to answer a question before the
+graph retrieves from it. Questions that Wikipedia rarely answers (breaking news, prices, scores) go straight to web
+search, which saves the Wikipedia lookup and the grading call that would have rejected it.
+
+The prediction starts from a prior derived from query features and is updated online with the grading outcome of
+every Wikipedia leg, kept per query pattern.
+"""
+import datetime
+import os
+import random
+import re
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import orjson
+
+# Below this predicted probability that Wikipedia suffices, the question goes to web search first
+ROUTE_WEB_BELOW = float(os.getenv("ROUTE_WEB_BELOW", "0.35"))
+# Share of web-first predictions still sent to Wikipedia, so the outcomes of every pattern keep being learned
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", "0.05"))
+# JSON file the pattern statistics are loaded from and saved to on shutdown; unset keeps them in memory
+ROUTING_STATS_PATH = os.getenv("ROUTING_STATS_PATH") or None
+
+# Prior probability that Wikipedia suffices for questions about recent facts, about topics whose facts change
+# often, and for everything else, and how many graded outcomes the prior is worth
+RECENT_PRIOR = 0.2
+VOLATILE_PRIOR = 0.45
+TIMELESS_PRIOR = 0.8
+PRIOR_WEIGHT = 4.0
+# Smoothing of the average duration of a wasted Wikipedia leg
+LEG_SECONDS_ALPHA = 0.2
+
+_WORD = re.compile(r"[a-z0-9]+")
+_YEAR = re.compile(r"\b(19|20)\d{2}\b")
+
+# Only words that mark recency on their own; "now", "current" or "live" also appear in timeless questions
+# ("Where do penguins live?"), so they only count inside the phrases below
+_RECENCY_WORDS = frozenset(
+    "today tonight yesterday tomorrow latest recent recently newest breaking upcoming ongoing".split()
+)
+_RECENCY_PHRASES = ("this week", "this weekend", "this month", "this year", "right now", "as of now",
+                    "at the moment", "so far", "as of", "currently serving", "currently in office", "current ceo",
+                    "current president", "current prime minister", "current price", "current score",
+                    "live score", "live scores", "live stream", "still alive")
+
+# Coarse topics whose answers change often; a topic splits the statistics of otherwise similar questions
+_TOPICS = {
+    "finance": frozenset("price prices stock stocks share shares market bitcoin crypto inflation rate rates "
+                         "earnings dividend exchange".split()),
+    "sports": frozenset("score scores game match matches won win winner league cup season playoff playoffs "
+                        "tournament standings".split()),
+    "weather": frozenset("weather forecast temperature rain storm snow hurricane".split()),
+    "news": frozenset("news election elections announced announcement released release launch launched died "
+                      "resigned appointed poll polls".split()),
+    "tech": frozenset("version update iphone android software app gpu".split()),
+}
+
+_KINDS = (
+    ("who", ("who", "whom", "whose")),
+    ("where", ("where",)),
+    ("when", ("when",)),
+    ("quantity", ("how many", "how much", "how long", "how tall", "how old")),
+    ("definition", ("what is", "what are", "what was", "define", "meaning of")),
+)
+
+
+class QueryFeatures:
+    """
+    Routing features of a question.
+
+    Attributes:
+        recent: Whether the question asks about recent or changing facts
+        kind: Expected answer type ("who", "where", "when", "quantity", "definition" or "other")
+        topic: Topic whose facts change often, or "general"
+    """
+    __slots__ = ("recent", "kind", "topic")
+
+    def __init__(self, recent: bool, kind: str, topic: str):
+        self.recent = recent
+        self.kind = kind
+        self.topic = topic
+
+    @property
+    def pattern(self) -> str:
+        return f"{'recent' if self.recent else 'timeless'}|{self.kind}|{self.topic}"
+
+    @property
+    def prior(self) -> float:
+        if self.recent:
+            return RECENT_PRIOR
+        return TIMELESS_PRIOR if self.topic in ("general", "tech") else VOLATILE_PRIOR
+
+
+def query_features(question: str, today: Optional[datetime.date] = None) -> QueryFeatures:
+    """
+    Extracts the routing features of a question.
+    :param question: The question
+    :param today: Reference date for "recent" years, defaults to today
+    """
+    text = question.lower()
+    words = set(_WORD.findall(text))
+    year = (today or datetime.date.today()).year
+    recent = (bool(words & _RECENCY_WORDS) or any(phrase in text for phrase in _RECENCY_PHRASES)
+              or any(int(match.group(0)) >= year - 1 for match in _YEAR.finditer(text)))
+    kind = next((name for name, cues in _KINDS if any(re.search(rf"\b{cue}\b", text) for cue in cues)), "other")
+    topic = next((name for name, vocabulary in _TOPICS.items() if words & vocabulary), "general")
+    return QueryFeatures(recent, kind, topic)
+
+
+class PatternStats:
+    """
+    Grading outcomes of the Wikipedia legs of one query pattern.
+    """
+    __slots__ = ("sufficient", "insufficient")
+
+    def __init__(self, sufficient: int = 0, insufficient: int = 0):
+        self.sufficient = sufficient
+        self.insufficient = insufficient
+
+
+class SourceRouter:
+    """
+    Chooses the first retrieval source for a question and learns from the grading outcomes.
+    Thread-safe; one router is shared by all graph runs of the process.
+    """
+    def __init__(self, threshold: float = ROUTE_WEB_BELOW, explore_rate: float = ROUTER_EXPLORE_RATE,
+                 path: Optional[str] = None, rng: Optional[random.Random] = None):
+        """
+        :param threshold: Route to web search first below this probability that Wikipedia suffices
+        :param explore_rate: Share of web-first predictions still sent to Wikipedia
+        :param path: JSON file to load the statistics from and save them to
+        :param rng: Random source for exploration
+        """
+        self.threshold = threshold
+        self.explore_rate = explore_rate
+        self.path = path
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, PatternStats] = {}
+        self._routed = {"wikipedia": 0, "web": 0}
+        self._explored = 0
+        self._graded = 0
+        self._wasted = 0
+        self._wasted_leg_seconds: Optional[float] = None
+        self._seconds_saved = 0.0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @classmethod
+    def from_env(cls) -> "SourceRouter":
+        """
+        Creates the router configured by ROUTE_WEB_BELOW, ROUTER_EXPLORE_RATE and ROUTING_STATS_PATH.
+        """
+        return cls(path=ROUTING_STATS_PATH)
+
+    def wikipedia_probability(self, question: str) -> float:
+        """
+        Returns the predicted probability that Wikipedia answers the question: the feature prior updated with
+        the graded outcomes of the question's pattern.
+        """
+        features = query_features(question)
+        prior = features.prior
+        with self._lock:
+            stats = self._stats.get(features.pattern)
+            sufficient, total = (stats.sufficient, stats.sufficient + stats.insufficient) if stats else (0, 0)
+        return (prior * PRIOR_WEIGHT + sufficient) / (PRIOR_WEIGHT + total)
+
+    def route(self, question: str) -> str:
+        """
+        Chooses the first source for the question.
+        :return: "wikipedia" or "web"
+        """
+        source = "wikipedia"
+        if self.wikipedia_probability(question) < self.threshold:
+            source = "web"
+        with self._lock:
+            if source == "web" and self._rng.random() < self.explore_rate:
+                source = "wikipedia"
+                self._explored += 1
+            self._routed[source] += 1
+            if source == "web" and self._wasted_leg_seconds is not None:
+                self._seconds_saved += self._wasted_leg_seconds
+        return source
+
+    def record(self, question: str, sufficient: bool, leg_seconds: Optional[float] = None):
+        """
+        Records the grading outcome of a Wikipedia leg.
+        :param question: The question the leg retrieved for
+        :param sufficient: Whether grading found the Wikipedia content sufficient
+        :param leg_seconds: Time spent on retrieval and grading
+        """
+        pattern = query_features(question).pattern
+        with self._lock:
+            stats = self._stats.setdefault(pattern, PatternStats())
+            self._graded += 1
+            if sufficient:
+                stats.sufficient += 1
+                return
+            stats.insufficient += 1
+            self._wasted += 1
+            if leg_seconds is not None:
+                previous = self._wasted_leg_seconds
+                self._wasted_leg_seconds = leg_seconds if previous is None else (
+                    previous + LEG_SECONDS_ALPHA * (leg_seconds - previous))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "wikipedia_first": self._routed["wikipedia"],
+                "explored": self._explored,
+                "graded_wikipedia_legs": self._graded,
+                "wasted_wikipedia_legs": self._wasted,
+                "wasted_leg_rate": round(self._wasted / self._graded, 3) if self._graded else None,
+                "skipped_wikipedia_legs": self._routed["web"],
+                "avg_wasted_leg_seconds": (round(self._wasted_leg_seconds, 3)
+                                           if self._wasted_leg_seconds is not None else None),
+                "estimated_seconds_saved": round(self._seconds_saved, 3),
+                "patterns": len(self._stats),
+            }
+
+    def load(self, path: str):
+        """
+        Adds the statistics saved at path to the router's.
+        """
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+        with self._lock:
+            for pattern, (sufficient, insufficient) in data.get("patterns", {}).items():
+                stats = self._stats.setdefault(pattern, PatternStats())
+                stats.sufficient += sufficient
+                stats.insufficient += insufficient
+            if self._wasted_leg_seconds is None:
+                self._wasted_leg_seconds = data.get("wasted_leg_seconds")
+
+    def save(self, path: Optional[str] = None):
+        """
+        Writes the pattern statistics to path (default: the router's path), replacing the file atomically.
+        """
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            data = {
+                "patterns": {pattern: [s.sufficient, s.insufficient] for pattern, s in self._stats.items()},
+                "wasted_leg_seconds": self._wasted_leg_seconds,
+            }
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix=".routing-", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(data))
+        os.replace(tmp, path)
@@ -0,0 +1,106 @@
+"""
+This module contains the SingleFlight class, which lets concurrent graph runs that need the
+same external call share one in-flight execution instead of issuing duplicates.
+"""
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from src.graph.rate_limit import DeadlineExceeded, current_deadline
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a query so that trivially different spellings map to the same key.
+    :param text: The query or prompt
+    :return: Lower-cased text with collapsed whitespace and no trailing punctuation
+    """
+    return re.sub(r"\s+", " ", text or "").strip().lower().rstrip("?!.")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Thread-safe call deduplication: the first caller for a key runs the function, callers that
+    arrive while it is running wait for and share its result (or exception). A follower waits no longer than
+    its own request deadline, and does not inherit a leader's DeadlineExceeded while it still has time left.
+    A disabled SingleFlight runs every call itself.
+    """
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._executed = 0
+        self._coalesced = 0
+        self._follower_timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Runs fn once per key among concurrent callers.
+        :param key: Deduplication key, e.g. the normalized query
+        :param fn: The call to make
+        :return: The result and whether it was shared from another caller's execution
+        :raises DeadlineExceeded: When a follower's deadline (see deadline_scope) passes before the shared call ends
+        """
+        if not self.enabled:
+            with self._lock:
+                self._executed += 1
+            return fn(*args, **kwargs), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            deadline = current_deadline()
+            if not call.done.wait(None if deadline is None else max(0.0, deadline - time.monotonic())):
+                with self._lock:
+                    self._follower_timeouts += 1
+                raise DeadlineExceeded(f"Shared {self.name} call did not finish before the request deadline")
+            if call.error is not None:
+                # The leader ran out of its own budget; a follower with time left makes the call itself
+                if isinstance(call.error, DeadlineExceeded) and (deadline is None or time.monotonic() < deadline):
+                    return fn(*args, **kwargs), False
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def metrics(self) -> dict:
+        """
+        Returns how many calls were executed and how many were served from a shared execution.
+        """
+        with self._lock:
+            return {
+                "executed_total": self._executed,
+                "coalesced_total": self._coalesced,
+                "follower_timeouts_total": self._follower_timeouts,
+                "in_flight": len(self._calls),
+            }
@@ -1,8 +1,11 @@
 """
 This module contains the GraphState class, which represents the state of our graph.
 """
-from typing import List, TypedDict, Optional
+from typing import Annotated, List, TypedDict, Optional
 from langchain_core.documents import Document
+from langgraph.channels.untracked_value import UntrackedValue
+
+from src.graph.history import ChatHistory
 
 
 class GraphState(TypedDict):
@@ -13,19 +16,33 @@ class GraphState(TypedDict):
         chat_history: Chat history
         original_question: Question from the user
         clarified_question: Clarified question
+        query_variants: Queries the retrievers look up concurrently in multi-query mode (the query itself first)
         wikipedia_docs: Wikipedia documents
+        wikipedia_sufficient: Whether grading found the Wikipedia documents sufficient (None when not graded)
         web_docs: Web documents from Tavily
         reranked_docs: Reranked documents
         final_answer: Final answer
         needs_clarification: Whether the question needs clarification
+        clarification_answer: The user's reply to a clarification question (resumed runs only)
+        first_source: Source the router sent retrieval to first, "wikipedia" or "web" (None without routing)
+        routed_at: Epoch seconds of the routing decision, used to time the Wikipedia leg
         session_id: Session ID
+        deadline: Absolute deadline of the run in epoch seconds (None for no deadline)
     """
-    chat_history: List[str]          # Stores all previous messages (user & bot)
+    # Stores all previous messages (user & bot). Never checkpointed: every run, fresh or resumed, is given the
+    # session's history, so the checkpoints only hold what the run itself produced
+    chat_history: Annotated[ChatHistory, UntrackedValue(ChatHistory)]
     original_question: str
     clarified_question: Optional[str]
+    query_variants: List[str]
     wikipedia_docs: List[Document]
+    wikipedia_sufficient: Optional[bool]
     web_docs: List[Document]
     reranked_docs: List[Document]
     final_answer: Optional[str]
     needs_clarification: bool
+    clarification_answer: Optional[str]
+    first_source: Optional[str]
+    routed_at: Optional[float]
     session_id: str
+    deadline: Optional[float]
@@ -0,0 +1,49 @@
+"""
+This module contains the token counting helper shared by the chat history and prompt building code.
+"""
+import functools
+import logging
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except ImportError:
+        return None
+    except Exception as e:
+        # The encoding file is downloaded on first use; offline replicas fall back to the estimate
+        logging.warning(f"Could not load the tiktoken encoding, estimating token counts instead: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of the text with tiktoken's cl100k_base encoding.
+    Falls back to an estimate of four characters per token when tiktoken is not available.
+    :param text: The text to count
+    :return: Number of tokens
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts the text down to at most max_tokens tokens.
+    :param text: The text to truncate
+    :param max_tokens: Token limit
+    :return: The text itself when it fits, otherwise its first max_tokens tokens
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
@@ -7,10 +7,12 @@ import logging
 
 from langchain_core.embeddings import Embeddings
 from pydantic import BaseModel
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents.base import Document
 
+from src.ingestion.settings import load_ingestion_settings
+
 
 class Ingestion(BaseModel):
 
@@ -39,10 +41,14 @@ class Ingestion(BaseModel):
         self.docs_list = [item for sublist in docs for item in sublist]
         logging.info(f"Number of documents loaded: {len(self.docs_list)}")
 
-    def text_splitter(self, chunk_size: int = 250, chunk_overlap: int = 0) -> list[Document]:
+    def text_splitter(self, chunk_size: int = None, chunk_overlap: int = None) -> list[Document]:
         """
         Split the documents into manageable chunks using the RecursiveCharacterTextSplitter.
+        The chunk size and overlap default to the ingestion section of config.yaml, read once per process.
         """
+        settings = load_ingestion_settings()
+        chunk_size = chunk_size if chunk_size is not None else settings.chunk_size
+        chunk_overlap = chunk_overlap if chunk_overlap is not None else settings.chunk_overlap
         logging.info("Splitting the documents into manageable chunks...")
         text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
             chunk_size=chunk_size, chunk_overlap=chunk_overlap
@@ -0,0 +1,176 @@
+"""
+This module contains the QuantizedIndex class, an on-disk vector index that stores int8-quantized vectors in
+memory-mapped files. Worker processes open the same files read-only, so the operating system shares the
+pages between them and each worker adds almost nothing to its own RSS for the index.
+"""
+import mmap
+import os
+import shutil
+import tempfile
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import orjson
+
+INDEX_FORMAT_VERSION = 1
+# Bytes of float32 scratch space used per block when scanning the int8 codes
+SCAN_BLOCK_BYTES = 16 * 1024 * 1024
+
+_META = "meta.json"
+_CODES = "codes.int8.npy"
+_SCALES = "scales.f32.npy"
+_VECTORS = "vectors.f32.npy"
+_PAYLOADS = "payloads.bin"
+_OFFSETS = "offsets.i64.npy"
+
+
+def _retired(path: str) -> str:
+    # Where the previous index is moved while a rebuild swaps the new one in
+    return os.path.abspath(path).rstrip(os.sep) + ".old"
+
+
+def _recover(path: str):
+    """
+    Restores the previous index when a rebuild died after moving it aside but before the new one was in place.
+    """
+    if not os.path.exists(path) and os.path.exists(os.path.join(_retired(path), _META)):
+        os.replace(_retired(path), path)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes each row symmetrically to int8 with its own scale.
+    :param vectors: float32 matrix, one vector per row
+    :return: The int8 codes and the per-row float32 scales (row ~= codes * scale)
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedIndex:
+    """
+    Cosine similarity index over int8 codes with an exact float32 re-score of the shortlist.
+
+    Files in the index directory (all opened with mmap, read-only):
+        codes.int8.npy: Quantized unit vectors, scanned for every query
+        scales.f32.npy: Per-vector dequantization scales
+        vectors.f32.npy: Full-precision unit vectors; only the shortlisted rows are read
+        payloads.bin / offsets.i64.npy: JSON {"page_content", "metadata"} per vector
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, _META), "rb") as f:
+            self.meta = orjson.loads(f.read())
+        if self.meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version {self.meta.get('version')} in {path}")
+        self.codes = np.load(os.path.join(path, _CODES), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, _SCALES), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, _VECTORS), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, _OFFSETS), mmap_mode="r")
+        self._payload_file = open(os.path.join(path, _PAYLOADS), "rb")
+        self._payloads = (mmap.mmap(self._payload_file.fileno(), 0, access=mmap.ACCESS_READ)
+                          if self.offsets[-1] > 0 else b"")
+
+    @classmethod
+    def build(cls, path: str, vectors: Sequence[Sequence[float]], payloads: Iterable[dict]) -> "QuantizedIndex":
+        """
+        Writes a new index and opens it. The files are written to a temporary directory, and the old index is
+        renamed aside before the new one is renamed into place and only deleted afterwards, so workers never see
+        a half-written index and a build that dies in between leaves the old index to open_index.
+        :param path: Index directory
+        :param vectors: Embeddings, one per document
+        :param payloads: {"page_content", "metadata"} per embedding
+        :return: The opened index
+        """
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        if matrix.ndim != 2:
+            raise ValueError("vectors must be a non-empty 2-D array")
+        codes, scales = quantize(matrix)
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".quantized-", dir=parent)
+        try:
+            np.save(os.path.join(staging, _CODES), codes)
+            np.save(os.path.join(staging, _SCALES), scales)
+            np.save(os.path.join(staging, _VECTORS), matrix)
+            offsets = [0]
+            with open(os.path.join(staging, _PAYLOADS), "wb") as f:
+                for payload in payloads:
+                    offsets.append(offsets[-1] + f.write(orjson.dumps(payload)))
+            if len(offsets) - 1 != len(matrix):
+                raise ValueError(f"Got {len(offsets) - 1} payloads for {len(matrix)} vectors")
+            np.save(os.path.join(staging, _OFFSETS), np.asarray(offsets, dtype=np.int64))
+            with open(os.path.join(staging, _META), "wb") as f:
+                f.write(orjson.dumps({"version": INDEX_FORMAT_VERSION, "count": int(matrix.shape[0]),
+                                      "dim": int(matrix.shape[1]), "metric": "cosine", "quantization": "int8"}))
+            _recover(path)
+            retired = _retired(path)
+            if os.path.exists(retired):
+                # Left over from a build that died after the swap
+                shutil.rmtree(retired)
+            if os.path.exists(path):
+                os.replace(path, retired)
+            os.replace(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        # Workers that still map the old files keep reading them after the delete
+        shutil.rmtree(_retired(path), ignore_errors=True)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    def payload(self, index: int) -> dict:
+        return orjson.loads(self._payloads[int(self.offsets[index]):int(self.offsets[index + 1])])
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Scores every vector against the unit query from the int8 codes, block by block so the float32
+        scratch space stays bounded whatever the index size.
+        """
+        scores = np.empty(len(self), dtype=np.float32)
+        block = max(1, SCAN_BLOCK_BYTES // (4 * max(1, self.codes.shape[1])))
+        for start in range(0, len(self), block):
+            end = min(start + block, len(self))
+            scores[start:end] = (self.codes[start:end].astype(np.float32) @ query) * self.scales[start:end]
+        return scores
+
+    def search(self, query_vector: Sequence[float], k: int = 4, shortlist: int = 50) -> List[Tuple[int, float]]:
+        """
+        Finds the k most similar vectors: a shortlist by int8 score, then an exact float32 re-score.
+        :param query_vector: Query embedding
+        :param k: Number of results
+        :param shortlist: Candidates re-scored exactly; larger values trade speed for recall
+        :return: (position, cosine similarity) pairs, most similar first
+        """
+        if len(self) == 0 or k <= 0:
+            return []
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        approximate = self.approximate_scores(query)
+        size = min(len(self), max(k, shortlist))
+        candidates = np.argpartition(-approximate, size - 1)[:size] if size < len(self) else np.arange(len(self))
+        candidates.sort()  # Ascending row order reads the memory-mapped vectors sequentially
+        exact = self.vectors[candidates] @ query
+        order = np.argsort(-exact, kind="stable")[:k]
+        return [(int(candidates[i]), float(exact[i])) for i in order]
+
+    def close(self):
+        if isinstance(self._payloads, mmap.mmap):
+            self._payloads.close()
+        self._payload_file.close()
+
+
+def open_index(path: str) -> Optional[QuantizedIndex]:
+    """
+    Opens the index at path, or returns None when none has been built there yet.
+    """
+    _recover(path)
+    return QuantizedIndex(path) if os.path.exists(os.path.join(path, _META)) else None
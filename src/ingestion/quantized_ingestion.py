@@ -0,0 +1,95 @@
+"""
+This module contains the QuantizedIngestion class, which stores the embedded corpus in a memory-mapped int8
+index (see src/ingestion/quantized_index.py) instead of Chroma, and the retriever that searches it.
+"""
+import logging
+from typing import List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents.base import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from src.ingestion.ingestion import Ingestion
+from src.ingestion.quantized_index import QuantizedIndex, open_index
+
+
+class QuantizedRetriever(BaseRetriever):
+    """
+    Retriever over a QuantizedIndex; usable as Backends(local=...).
+    """
+    index: QuantizedIndex
+    embeddings: Embeddings
+    k: int = 4
+    shortlist: int = 50
+
+    model_config = {
+        'arbitrary_types_allowed': True,
+    }
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        hits = self.index.search(self.embeddings.embed_query(query), k=self.k, shortlist=self.shortlist)
+        return [Document(**self.index.payload(position)) for position, _ in hits]
+
+
+class QuantizedIngestion(Ingestion):
+    index_dir: str = "./.quantized_index"
+    shortlist: int = 50
+
+    _index: Optional[QuantizedIndex] = PrivateAttr(default=None)
+
+    @property
+    def index(self) -> QuantizedIndex:
+        """
+        The index on disk, opened on first use. Every worker maps the same files, so the pages are shared.
+        """
+        if self._index is None:
+            self._index = open_index(self.index_dir)
+            if self._index is None:
+                raise FileNotFoundError(f"No quantized index in {self.index_dir}; run insert_documents or from_chroma")
+        return self._index
+
+    def as_retriever(self, k: int = 4) -> QuantizedRetriever:
+        return QuantizedRetriever(index=self.index, embeddings=self.embeddings, k=k, shortlist=self.shortlist)
+
+    def insert_documents(self, text_splits):
+        """
+        Embed the text splits using the specified embedding model and write them to the quantized index.
+        """
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in text_splits])
+        self._build(vectors, [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in text_splits])
+        return self.as_retriever()
+
+    def retrieve_documents(self, query: str):
+        """
+        Retrieve documents related to the given query.
+        """
+        return self.as_retriever().invoke(query)
+
+    @classmethod
+    def from_chroma(cls, embeddings: Embeddings, persist_directory: str = "./.chroma",
+                    collection_name: str = "rag-chroma", **kwargs) -> "QuantizedIngestion":
+        """
+        Converts an existing Chroma collection (as written by ChromaIngestion) without re-embedding it.
+        :param embeddings: The embedding model the collection was built with; used for queries
+        :param persist_directory: Chroma directory
+        :param collection_name: Chroma collection
+        :return: The ingestion, with its index built
+        """
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=persist_directory).get_collection(collection_name)
+        records = collection.get(include=["embeddings", "documents", "metadatas"])
+        ingestion = cls(embeddings=embeddings, **kwargs)
+        ingestion._build(records["embeddings"], [
+            {"page_content": text, "metadata": metadata or {}}
+            for text, metadata in zip(records["documents"], records["metadatas"])
+        ])
+        return ingestion
+
+    def _build(self, vectors, payloads: List[dict]):
+        if self._index is not None:
+            self._index.close()
+        self._index = QuantizedIndex.build(self.index_dir, vectors, payloads)
+        logging.info(f"Quantized index with {len(self._index)} vectors is ready for retrieval!")
@@ -0,0 +1,49 @@
+"""
+This module contains the ingestion settings read from the ingestion section of config.yaml. It depends only on
+yaml and pydantic, so ingestion scripts can read their chunk sizes without importing the graph.
+"""
+import functools
+import os
+from typing import Optional
+
+import yaml
+from pydantic import BaseModel, Field, ValidationError, model_validator
+
+# Same file the graph configuration is read from (see src/graph/config.py)
+GRAPH_CONFIG = os.getenv("GRAPH_CONFIG", "config.yaml")
+# Token-sized chunks used when config.yaml has no ingestion section
+CHUNK_SIZE = 250
+CHUNK_OVERLAP = 0
+
+
+class IngestionSettings(BaseModel):
+    # Typos in config.yaml should fail at startup rather than silently keep a default
+    model_config = {"extra": "forbid"}
+
+    chunk_size: int = Field(CHUNK_SIZE, ge=16)
+    chunk_overlap: int = Field(CHUNK_OVERLAP, ge=0)
+
+    @model_validator(mode="after")
+    def _overlap_below_size(self) -> "IngestionSettings":
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        return self
+
+
+@functools.lru_cache(maxsize=None)
+def load_ingestion_settings(path: Optional[str] = None) -> IngestionSettings:
+    """
+    Loads and validates the ingestion section of the configuration file, once per path.
+    :param path: YAML file, defaults to GRAPH_CONFIG
+    :return: The settings; built-in defaults when the file or the section is missing
+    :raises ValueError: When the file is not valid YAML or the section does not match the schema
+    """
+    path = path or GRAPH_CONFIG
+    if not os.path.exists(path):
+        return IngestionSettings()
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return IngestionSettings.model_validate(data.get("ingestion") or {})
+    except (yaml.YAMLError, ValidationError) as e:
+        raise ValueError(f"Invalid ingestion configuration in {path}: {e}") from e
@@ -0,0 +1,144 @@
+"""
+This module contains the AdmissionController class, which limits how many graph runs
+are in flight at once and keeps each session to a single in-flight message.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted and should be answered with a 429.
+    """
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admission control for graph runs.
+
+    A global semaphore bounds the number of concurrent runs, a per-session lock makes
+    sure only one message per session is processed at a time and a bounded waiting
+    queue sheds load with a retry hint once it is full.
+    """
+    SESSION_POLICIES = ("wait", "reject")
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, session_policy: str = "wait"):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative")
+        if session_policy not in self.SESSION_POLICIES:
+            raise ValueError(f"session_policy must be one of {self.SESSION_POLICIES}")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.session_policy = session_policy
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._session_users: Dict[str, int] = {}
+        self._in_flight = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._admitted = 0
+        self._completed = 0
+        self._rejected = {"queue_full": 0, "session_busy": 0}
+        self._avg_service_seconds = 0.0
+
+    def retry_after(self) -> int:
+        """
+        Estimates how many seconds a rejected client should wait before retrying.
+        :return: Retry delay in whole seconds, at least 1
+        """
+        waves = (self._queued + self._in_flight) / self.max_concurrency
+        return max(1, math.ceil(self._avg_service_seconds * waves))
+
+    def _reject(self, reason: str):
+        self._rejected[reason] += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, session_id: str) -> AsyncIterator[None]:
+        """
+        Waits for a free slot for the given session and holds it for the duration of the block.
+        :param session_id: Session the request belongs to
+        :raises AdmissionRejected: When the queue is full or the session is busy under the reject policy
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is not None and lock.locked() and self.session_policy == "reject":
+            self._reject("session_busy")
+        must_wait = self._semaphore.locked() or (lock is not None and lock.locked())
+        if must_wait and self._queued >= self.max_queue:
+            self._reject("queue_full")
+
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        self._session_users[session_id] = self._session_users.get(session_id, 0) + 1
+        self._queued += 1
+        self._max_queued = max(self._max_queued, self._queued)
+        try:
+            await lock.acquire()
+            try:
+                await self._semaphore.acquire()
+            except BaseException:
+                lock.release()
+                raise
+        except BaseException:
+            self._release_session(session_id)
+            raise
+        finally:
+            self._queued -= 1
+
+        self._admitted += 1
+        self._in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            # Exponentially weighted so the retry hint follows recent latency; seeded by the first completed run,
+            # not the first admitted one, since later admissions may finish first
+            self._completed += 1
+            self._avg_service_seconds = elapsed if self._completed == 1 else (
+                0.8 * self._avg_service_seconds + 0.2 * elapsed
+            )
+            self._in_flight -= 1
+            self._semaphore.release()
+            lock.release()
+            self._release_session(session_id)
+
+    def has_capacity(self) -> bool:
+        """
+        Whether a new run would start at once: a slot is free and nobody is waiting.
+        """
+        return self._queued == 0 and self._in_flight < self.max_concurrency
+
+    def _release_session(self, session_id: str):
+        remaining = self._session_users.get(session_id, 1) - 1
+        if remaining <= 0:
+            self._session_users.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+        else:
+            self._session_users[session_id] = remaining
+
+    def metrics(self) -> dict:
+        """
+        Returns a snapshot of the admission metrics.
+        :return: Queue depth, in-flight count and admission counters
+        """
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": self._queued,
+            "max_queue_depth_seen": self._max_queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "session_policy": self.session_policy,
+            "admitted_total": self._admitted,
+            "completed_total": self._completed,
+            "rejected_total": dict(self._rejected),
+            "avg_service_seconds": round(self._avg_service_seconds, 4),
+        }
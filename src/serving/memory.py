@@ -0,0 +1,204 @@
+"""
+This module contains the MemoryProfiler class, an opt-in tracemalloc profiler for long-running servers. It
+snapshots the traced allocations periodically and reports the largest allocation sites, their growth since
+startup and the memory held per chat session, so a replica whose RSS keeps growing can be diagnosed in place.
+"""
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from enum import Enum
+from types import FunctionType, ModuleType
+from typing import Iterable, List, Optional, Tuple
+
+# Enables tracemalloc and the periodic snapshots; tracing slows allocations down, so it is off by default
+MEMORY_PROFILE = os.getenv("MEMORY_PROFILE", "0").lower() in ("1", "true", "yes")
+# Interval between snapshots
+MEMORY_SNAPSHOT_SECONDS = float(os.getenv("MEMORY_SNAPSHOT_SECONDS", "300"))
+# Stack frames stored per allocation; more frames attribute allocations better and cost more memory
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+# Allocation sites and sessions listed in a report
+MEMORY_TOP = int(os.getenv("MEMORY_TOP", "15"))
+
+# Allocations of the profiler itself and of the import machinery are left out of the reports
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Shared objects that are not owned by the structure being measured
+_SHARED_TYPES = (type, ModuleType, FunctionType, Enum)
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    Returns the resident set size of the process, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def deep_sizeof(obj) -> int:
+    """
+    Returns the size of an object and everything it references through containers, instance attributes and
+    slots, counting each object once. Classes, modules, functions and enum members are shared and not counted.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SHARED_TYPES):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif not isinstance(current, (str, bytes, int, float, bool)) and current is not None:
+            if hasattr(current, "__dict__"):
+                stack.append(vars(current))
+            for cls in type(current).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(current, name):
+                        stack.append(getattr(current, name))
+    return size
+
+
+def session_memory(sessions: Iterable[Tuple[str, object]], top: int = MEMORY_TOP) -> dict:
+    """
+    Measures the memory held by each chat session.
+    :param sessions: (session ID, history) pairs
+    :param top: Number of largest sessions to list
+    :return: Session count, total and average bytes, and the largest sessions
+    """
+    sizes = [(session_id, len(history), deep_sizeof(history)) for session_id, history in sessions]
+    total = sum(size for _, _, size in sizes)
+    sizes.sort(key=lambda item: item[2], reverse=True)
+    return {
+        "count": len(sizes),
+        "total_bytes": total,
+        "avg_bytes": round(total / len(sizes)) if sizes else None,
+        "largest": [{"session_id": session_id, "turns": turns, "bytes": size}
+                    for session_id, turns, size in sizes[:top]],
+    }
+
+
+class MemoryProfiler:
+    """
+    Periodic tracemalloc snapshots of the process. The first snapshot is kept as the baseline the later ones are
+    compared with.
+    """
+    def __init__(self, enabled: bool = MEMORY_PROFILE, interval_seconds: float = MEMORY_SNAPSHOT_SECONDS,
+                 frames: int = MEMORY_TRACE_FRAMES, exclude: Iterable[str] = ()):
+        """
+        :param enabled: Whether start() traces allocations
+        :param interval_seconds: Interval between periodic snapshots
+        :param frames: Stack frames stored per allocation
+        :param exclude: Filename patterns whose allocations are left out of the snapshots
+        """
+        self.enabled = enabled
+        self.interval_seconds = interval_seconds
+        self.frames = frames
+        self._filters = _SNAPSHOT_FILTERS + tuple(tracemalloc.Filter(False, pattern) for pattern in exclude)
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._latest: Optional[tracemalloc.Snapshot] = None
+        self._latest_at: Optional[float] = None
+        self._snapshots = 0
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Starts tracing and the snapshot thread. Does nothing when profiling is disabled.
+        """
+        if not self.enabled or self._thread is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self.snapshot()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the snapshot thread, and tracing if this profiler started it.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Takes a snapshot now; the first one becomes the baseline.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        # Garbage that is merely uncollected would otherwise show up as growth
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        with self._lock:
+            if self._baseline is None:
+                self._baseline = snapshot
+            self._latest = snapshot
+            self._latest_at = time.time()
+            self._snapshots += 1
+
+    def report(self, top: int = MEMORY_TOP) -> dict:
+        """
+        Returns the process RSS and, when profiling is enabled, the traced memory, the largest allocation sites
+        of the latest snapshot and the sites that grew the most since the baseline.
+        """
+        report = {"enabled": self.enabled, "rss_bytes": rss_bytes()}
+        with self._lock:
+            baseline, latest, latest_at, snapshots = self._baseline, self._latest, self._latest_at, self._snapshots
+        if latest is None:
+            return report
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        growth = latest.compare_to(baseline, "lineno")
+        report.update({
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "snapshots": snapshots,
+            "snapshot_age_seconds": round(time.time() - latest_at, 1),
+            # Unlike traced_bytes, this leaves out the memory of the snapshots themselves
+            "growth_since_start_bytes": sum(stat.size_diff for stat in growth),
+            "top_sites": _site_stats(latest.statistics("lineno")[:top]),
+            "growth_since_start": [
+                {"site": _site(stat.traceback), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff,
+                 "size_bytes": stat.size}
+                for stat in growth[:top] if stat.size_diff
+            ],
+        })
+        return report
+
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def _site_stats(stats: List[tracemalloc.Statistic]) -> List[dict]:
+    return [{"site": _site(stat.traceback), "size_bytes": stat.size, "count": stat.count} for stat in stats]
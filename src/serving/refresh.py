@@ -0,0 +1,264 @@
+"""
+This module contains the hot question tracker and the refresh-ahead scheduler of the answer cache. A few questions
+(about entities like "Tesla") make up most of the traffic; the tracker keeps a decaying count of the questions
+that open a session, and the scheduler re-runs the most frequent ones in the background shortly before their
+cached answer expires, so they are always answered from the cache and never expire under a burst of requests.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from logger.logger import CustomLogger
+from src.graph.history import ChatHistory
+from src.graph.singleflight import normalize_query
+from src.serving.result_cache import ResultCache
+
+# Number of hot questions kept fresh in the cache; 0 disables tracking and refreshing
+HOT_QUESTIONS_TOP_N = int(os.getenv("HOT_QUESTIONS_TOP_N", "20"))
+# Decayed ask count a question needs before it is refreshed
+HOT_QUESTIONS_MIN_COUNT = float(os.getenv("HOT_QUESTIONS_MIN_COUNT", "3"))
+# Half-life of the ask counts, so questions that stop being asked fall out of the top
+HOT_QUESTIONS_HALF_LIFE_SECONDS = float(os.getenv("HOT_QUESTIONS_HALF_LIFE_SECONDS", "3600"))
+# Optional file of questions to pre-warm at startup, one per line ("profile: question" picks a profile)
+HOT_QUESTIONS_FILE = os.getenv("HOT_QUESTIONS_FILE") or None
+# How often the scheduler looks for answers to refresh
+REFRESH_INTERVAL_SECONDS = float(os.getenv("REFRESH_INTERVAL_SECONDS", "30"))
+# A hot answer is refreshed once it expires within this many seconds (or is missing)
+REFRESH_AHEAD_SECONDS = float(os.getenv("REFRESH_AHEAD_SECONDS", "120"))
+
+
+class _Count:
+    __slots__ = ("question", "score", "updated_at")
+
+    def __init__(self, question: str, score: float, updated_at: float):
+        self.question = question
+        self.score = score
+        self.updated_at = updated_at
+
+
+class HotQuestions:
+    """
+    Exponentially decaying ask counts per (profile, normalized question), bounded to a multiple of top_n entries.
+    Only used from the event loop, so it needs no lock.
+    """
+    def __init__(self, top_n: int = HOT_QUESTIONS_TOP_N, min_count: float = HOT_QUESTIONS_MIN_COUNT,
+                 half_life_seconds: float = HOT_QUESTIONS_HALF_LIFE_SECONDS, max_tracked: Optional[int] = None):
+        """
+        :param top_n: Number of questions top() returns at most
+        :param min_count: Decayed count a question needs to be returned by top()
+        :param half_life_seconds: Time after which a count is worth half
+        :param max_tracked: Questions counted at once; the lowest counts are dropped beyond it
+        """
+        self.top_n = top_n
+        self.min_count = min_count
+        self.half_life_seconds = half_life_seconds
+        self.max_tracked = max_tracked or max(100, 20 * top_n)
+        self._counts: Dict[Tuple[str, str], _Count] = {}
+        self._recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_n > 0
+
+    def _score(self, count: _Count, now: float) -> float:
+        return count.score * 0.5 ** ((now - count.updated_at) / self.half_life_seconds)
+
+    def record(self, question: str, profile: str, weight: float = 1.0):
+        """
+        Counts one ask of a question. The most recent wording is kept for refreshing.
+        :param question: The question as the user asked it
+        :param profile: Graph profile it was asked under
+        :param weight: Added to the count
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        key = (profile, normalize_query(question))
+        count = self._counts.get(key)
+        if count is None:
+            self._counts[key] = _Count(question, weight, now)
+            if len(self._counts) > self.max_tracked:
+                self._prune(now)
+        else:
+            count.question = question
+            count.score = self._score(count, now) + weight
+            count.updated_at = now
+        self._recorded += 1
+
+    def seed(self, questions: Iterable[Tuple[str, str]]):
+        """
+        Marks (question, profile) pairs as hot, e.g. to pre-warm the cache at startup. A seeded question stays hot
+        for one half-life without being asked.
+        """
+        for question, profile in questions:
+            self.record(question, profile, weight=2 * self.min_count)
+
+    def _prune(self, now: float):
+        # Keep the upper half by current score; pruning in bulk keeps record() cheap on average
+        ranked = sorted(self._counts.items(), key=lambda item: self._score(item[1], now), reverse=True)
+        self._counts = dict(ranked[:self.max_tracked // 2])
+
+    def top(self) -> List[Tuple[str, str, float]]:
+        """
+        Returns the hottest questions, most asked first.
+        :return: (question, profile, decayed count) tuples
+        """
+        now = time.monotonic()
+        scored = [(count.question, profile, self._score(count, now)) for (profile, _), count in self._counts.items()]
+        scored = [item for item in scored if item[2] >= self.min_count]
+        scored.sort(key=lambda item: item[2], reverse=True)
+        return scored[:self.top_n]
+
+    def metrics(self) -> dict:
+        return {
+            "tracked": len(self._counts),
+            "recorded": self._recorded,
+            "top": [{"question": question, "profile": profile, "count": round(score, 2)}
+                    for question, profile, score in self.top()[:5]],
+        }
+
+
+def load_seed_questions(path: Optional[str], default_profile: str,
+                        profiles: Iterable[str] = ()) -> List[Tuple[str, str]]:
+    """
+    Reads the pre-warm file: one question per line, optionally prefixed with "profile: ". Blank lines and lines
+    starting with "#" are skipped.
+    :param path: The file; a missing file yields no questions
+    :param default_profile: Profile of questions without a prefix
+    :param profiles: Profile names a prefix may name; any other prefix is part of the question
+    :return: (question, profile) pairs
+    """
+    if not path or not os.path.exists(path):
+        return []
+    profiles = set(profiles)
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            profile, separator, question = line.partition(":")
+            if not separator or profile.strip() not in profiles:
+                profile, question = default_profile, line
+            questions.append((question.strip(), profile.strip()))
+    return questions
+
+
+class RefreshScheduler:
+    """
+    Background task that keeps the answers to the hot questions in the cache.
+
+    Each round refreshes, one at a time, the hot questions whose answer is missing or expires within
+    ahead_seconds. A question whose run cannot be cached (it paused for a clarification or produced no answer) is
+    not retried for one cache TTL. Rounds stop early while the server has no spare capacity, so user requests
+    always come first.
+    """
+    def __init__(self, hot: HotQuestions, cache: ResultCache, refresh: Callable[[str, str], Awaitable[bool]],
+                 has_capacity: Callable[[], bool] = lambda: True, interval_seconds: float = REFRESH_INTERVAL_SECONDS,
+                 ahead_seconds: float = REFRESH_AHEAD_SECONDS):
+        """
+        :param hot: Tracker of the hot questions
+        :param cache: Answer cache the refreshed answers are stored in
+        :param refresh: Coroutine function (question, profile) that runs the question with an empty history and
+            caches the answer, returning whether it was cached
+        :param has_capacity: Whether a refresh may run now
+        :param interval_seconds: Time between rounds
+        :param ahead_seconds: Refresh an answer once it expires within this many seconds
+        """
+        self.hot = hot
+        self.cache = cache
+        self.refresh = refresh
+        self.has_capacity = has_capacity
+        self.interval_seconds = interval_seconds
+        self.ahead_seconds = ahead_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._uncacheable: Dict[str, float] = {}
+        self._rounds = 0
+        self._refreshed = 0
+        self._failed = 0
+        self._deferred = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.hot.enabled and self.cache.enabled
+
+    def due(self) -> List[Tuple[str, str]]:
+        """
+        Returns the hot (question, profile) pairs whose cached answer is missing or about to expire.
+        """
+        now = time.monotonic()
+        due = []
+        for question, profile, _ in self.hot.top():
+            # A session's first question is keyed on an empty history
+            key = self.cache.key(question, ChatHistory(), namespace=profile)
+            if self._uncacheable.get(key, 0) > now:
+                continue
+            remaining = self.cache.expires_in(key)
+            if remaining is None or remaining <= self.ahead_seconds:
+                due.append((question, profile))
+        return due
+
+    async def run_once(self) -> int:
+        """
+        Runs one round of refreshes.
+        :return: Number of answers refreshed
+        """
+        self._rounds += 1
+        now = time.monotonic()
+        self._uncacheable = {key: until for key, until in self._uncacheable.items() if until > now}
+        refreshed = 0
+        for question, profile in self.due():
+            if not self.has_capacity():
+                self._deferred += 1
+                break
+            try:
+                cached = await self.refresh(question, profile)
+            except Exception as e:
+                self._failed += 1
+                CustomLogger.log_message("refresh", "refresh", f"Refreshing {question!r} failed: {e}")
+                continue
+            if cached:
+                refreshed += 1
+            else:
+                key = self.cache.key(question, ChatHistory(), namespace=profile)
+                self._uncacheable[key] = time.monotonic() + self.cache.ttl_seconds
+        self._refreshed += refreshed
+        return refreshed
+
+    async def _run(self):
+        # The first round runs at once, so seeded questions are pre-warmed right after startup
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                CustomLogger.log_message("refresh", "refresh", f"Refresh round failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """
+        Starts the background task on the running event loop. Does nothing when tracking or the cache is off.
+        """
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "rounds": self._rounds,
+            "refreshed": self._refreshed,
+            "failed": self._failed,
+            "deferred_for_capacity": self._deferred,
+            "uncacheable": sum(until > now for until in self._uncacheable.values()),
+            "hot_questions": self.hot.metrics(),
+        }
@@ -0,0 +1,144 @@
+"""
+This module contains the ResultCache class, an exact answer cache for /chat keyed on the normalized
+question and a fingerprint of the recent conversation.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from src.graph.history import ChatHistory, Sender
+from src.graph.singleflight import normalize_query
+
+# Graph outputs kept per entry: the answer and the documents it was generated from
+CACHED_KEYS = ("final_answer", "wikipedia_docs", "wikipedia_sufficient", "web_docs", "reranked_docs")
+
+
+class _Entry:
+    __slots__ = ("question", "result", "expires_at")
+
+    def __init__(self, question: str, result: dict, expires_at: float):
+        self.question = question
+        self.result = result
+        self.expires_at = expires_at
+
+
+class ResultCache:
+    """
+    LRU cache of graph results with a time-to-live.
+
+    The key is a SHA-256 of the normalized question and the last few turns of the conversation, so a
+    refreshed or retried question in the same context is answered without running the graph, while the
+    same words after a different exchange are not.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0, history_turns: int = 4):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.history_turns = history_turns
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def key(self, user_message: str, history: ChatHistory, namespace: str = "") -> str:
+        """
+        Builds the cache key for a question asked after the given history.
+        A retry of the question that was just answered keys on the context before the first ask, so it hits.
+        :param user_message: The user's message
+        :param history: The session history before the message
+        :param namespace: Keeps answers apart that must not be shared, e.g. those of different graph profiles
+        :return: Hex digest of the normalized question and the last history_turns turns
+        """
+        question = normalize_query(user_message)
+        end = len(history)
+        while (end >= 2 and history[end - 2].sender is Sender.USER and history[end - 1].sender is Sender.BOT
+               and normalize_query(history[end - 2].message) == question):
+            end -= 2
+        digest = hashlib.sha256(question.encode())
+        if namespace:
+            digest.update(b"\x1d" + namespace.encode())
+        for turn in history[max(0, end - self.history_turns):end] if self.history_turns else ():
+            digest.update(b"\x1e")
+            digest.update(turn.render().encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the cached result for the key, or None when it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return dict(entry.result)
+
+    def expires_in(self, key: str) -> Optional[float]:
+        """
+        Returns the seconds until the entry for the key expires, or None when there is no live entry.
+        Unlike get, it does not count as a lookup or refresh the entry's LRU position.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            remaining = entry.expires_at - time.monotonic() if entry is not None else None
+        return remaining if remaining is not None and remaining > 0 else None
+
+    def put(self, key: str, user_message: str, result: dict) -> bool:
+        """
+        Caches a finished result. Runs that paused for clarification or produced no answer are not cached.
+        :return: Whether the result was cached
+        """
+        if not self.enabled or result.get("__interrupt__") or not result.get("final_answer"):
+            return False
+        entry = _Entry(normalize_query(user_message), {k: result[k] for k in CACHED_KEYS if k in result},
+                       time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return True
+
+    def purge(self, question: Optional[str] = None) -> int:
+        """
+        Removes cached results.
+        :param question: Only remove entries for this question (in any context); None removes everything
+        :return: Number of entries removed
+        """
+        with self._lock:
+            if question is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            normalized = normalize_query(question)
+            keys = [key for key, entry in self._entries.items() if entry.question == normalized]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
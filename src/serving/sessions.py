@@ -0,0 +1,127 @@
+"""
+This module contains the SessionStore class, the bounded in-memory store of chat histories used by serve.py.
+Sessions are evicted least recently used first once the store is full, and after a period without messages, so a
+long-running replica does not keep every session it has ever seen. An on_evict callback releases what else a session
+holds, e.g. its checkpoints.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.graph.history import ChatHistory
+
+# Sessions kept in memory; the least recently used one is dropped beyond this
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+# Sessions idle for longer than this are dropped; 0 keeps idle sessions until they are evicted by SESSION_MAX
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "86400"))
+
+
+class SessionStore:
+    """
+    LRU store of chat histories keyed by session ID, with an idle time-to-live.
+
+    It supports the dict operations serve.py uses (get, setdefault, item access, len, in). Reads through get and
+    setdefault count as activity; item access does not.
+    """
+    def __init__(self, max_sessions: int = SESSION_MAX, idle_ttl_seconds: float = SESSION_IDLE_TTL_SECONDS,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        """
+        :param on_evict: Called with the ID of every session dropped by eviction or expiry, outside the store's
+            lock and in the thread of the call that dropped it
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[str, Tuple[ChatHistory, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._expired = 0
+        # Sessions dropped under the lock, handed to on_evict once it is released
+        self._dropped: List[str] = []
+
+    def _expire(self, now: float):
+        # The least recently used sessions come first, so the scan stops at the first live one
+        if self.idle_ttl_seconds <= 0:
+            return
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self._dropped.append(session_id)
+            self._expired += 1
+
+    def _store(self, session_id: str, history: ChatHistory, now: float):
+        self._sessions[session_id] = (history, now)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            self._dropped.append(session_id)
+            self._evicted += 1
+
+    def _release(self):
+        if not self._dropped:
+            return
+        with self._lock:
+            dropped, self._dropped = self._dropped, []
+        if self.on_evict is not None:
+            for session_id in dropped:
+                self.on_evict(session_id)
+
+    def get(self, session_id: str, default: Optional[ChatHistory] = None) -> Optional[ChatHistory]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self._store(session_id, entry[0], now)
+        self._release()
+        return entry[0] if entry is not None else default
+
+    def setdefault(self, session_id: str, default: ChatHistory) -> ChatHistory:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            history = entry[0] if entry is not None else default
+            self._store(session_id, history, now)
+        self._release()
+        return history
+
+    def __getitem__(self, session_id: str) -> ChatHistory:
+        with self._lock:
+            return self._sessions[session_id][0]
+
+    def __setitem__(self, session_id: str, history: ChatHistory):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._store(session_id, history, now)
+        self._release()
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def items(self) -> List[Tuple[str, ChatHistory]]:
+        """
+        Returns a snapshot of the (session ID, history) pairs, least recently used first.
+        """
+        with self._lock:
+            return [(session_id, history) for session_id, (history, _) in self._sessions.items()]
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "evicted": self._evicted,
+                "expired": self._expired,
+            }
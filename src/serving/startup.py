@@ -0,0 +1,82 @@
+"""
+This module contains the StartupProfiler class, which records how long each phase of the
+application start takes, and a small command line tool that reports the slowest imports
+of a module using `python -X importtime`.
+"""
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from logger.logger import CustomLogger
+
+
+class StartupProfiler:
+    """
+    Collects wall-clock timings of named startup phases.
+    """
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block under the given phase name.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    def report(self) -> dict:
+        """
+        Returns the phase timings in milliseconds and the time since the profiler was created.
+        """
+        return {
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "since_start_ms": round((time.perf_counter() - self.created) * 1000, 1),
+        }
+
+    def log(self, session_id: str = "startup"):
+        for name, ms in self.report()["phases_ms"].items():
+            CustomLogger.log_message(session_id, "startup", f"{name}: {ms} ms")
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """
+    Parses `python -X importtime` output.
+    :param output: The stderr of the profiled interpreter
+    :return: (module, self_us, cumulative_us) tuples
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_imports(module: str, top: int = 20) -> List[Tuple[str, int, int]]:
+    """
+    Imports the module in a fresh interpreter and returns its slowest imports by cumulative time.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    rows = parse_importtime(completed.stderr)
+    return sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in profile_imports(target):
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
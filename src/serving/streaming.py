@@ -0,0 +1,60 @@
+"""
+This module contains the bridge that streams a synchronous generator into async code.
+"""
+import asyncio
+import contextvars
+import threading
+from typing import AsyncIterator, Callable, Iterator
+
+from starlette.concurrency import run_in_threadpool
+
+_DONE = object()
+
+
+async def stream_in_thread(fn: Callable[..., Iterator], *args, **kwargs) -> AsyncIterator:
+    """
+    Runs a synchronous generator function on the threadpool the HTTP endpoints use and yields its items on the
+    event loop. The graph runs synchronously (the SQLite checkpointer has no async API), so the WebSocket streams
+    the sync graph.stream() through this bridge.
+
+    Closing the iterator early (use contextlib.aclosing) tells the worker to stop at the next item and waits for
+    it to finish, so a caller holding an admission slot keeps it while the graph still runs, e.g. after the
+    client disconnected mid-answer.
+    :param fn: Generator function
+    :return: Async iterator over the generated items; exceptions are re-raised in the caller
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        iterator = fn(*args, **kwargs)
+        try:
+            for item in iterator:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, e))
+            return
+        finally:
+            # Closing the generator stops the graph before its next step
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+
+    # Run in a copy of the caller's context so context variables (e.g. the recorded trace) reach the graph
+    context = contextvars.copy_context()
+    worker = asyncio.ensure_future(run_in_threadpool(context.run, produce))
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        cancelled.set()
+        await worker
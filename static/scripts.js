@@ -4,24 +4,66 @@ document.addEventListener('DOMContentLoaded', function() {
   const userInput = document.getElementById('user-input');
   const loadingIndicator = document.getElementById('loading-indicator');
   const sessionIdField = document.getElementById('session_id');
+  const submitButton = document.getElementById('submit-btn');
+
+  // One WebSocket per session; falls back to HTTP POST /chat when it is unavailable
+  let socket = null;
+  let pendingBotMessage = null;
+  let awaitingReply = false;
 
   function appendMessage(message, sender) {
     const msgDiv = document.createElement('div');
     msgDiv.classList.add('message', sender === 'User' ? 'user-message' : 'bot-message');
-    msgDiv.innerHTML = `<strong>${sender}:</strong> ${message}`;
+    msgDiv.innerHTML = `<strong>${sender}:</strong> <span class="message-text"></span>`;
+    msgDiv.querySelector('.message-text').textContent = message;
     chatWindow.appendChild(msgDiv);
     chatWindow.scrollTop = chatWindow.scrollHeight;
+    return msgDiv.querySelector('.message-text');
   }
 
-  chatForm.addEventListener('submit', async function(e) {
-    e.preventDefault();
-    const userMessage = userInput.value.trim();
-    if (!userMessage) return;
-    appendMessage(userMessage, 'User');
-    userInput.value = '';
-    document.getElementById('submit-btn').disabled = true;
-    loadingIndicator.style.display = 'inline';
+  function setBusy(busy, label) {
+    submitButton.disabled = busy;
+    loadingIndicator.textContent = label || 'Sending...';
+    loadingIndicator.style.display = busy ? 'inline' : 'none';
+  }
+
+  function finishMessage(text) {
+    if (!pendingBotMessage) {
+      pendingBotMessage = appendMessage('', 'Bot');
+    }
+    pendingBotMessage.textContent = text;
+    pendingBotMessage = null;
+    awaitingReply = false;
+    chatWindow.scrollTop = chatWindow.scrollHeight;
+    setBusy(false);
+  }
+
+  function connectSocket() {
+    if (!('WebSocket' in window)) return;
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const ws = new WebSocket(`${protocol}://${window.location.host}/ws/${encodeURIComponent(sessionIdField.value)}`);
+    ws.onopen = function() { socket = ws; };
+    ws.onclose = function() {
+      if (socket === ws) socket = null;
+      if (awaitingReply) finishMessage('Error processing message.');
+    };
+    ws.onmessage = function(event) {
+      const data = JSON.parse(event.data);
+      if (data.type === 'progress') {
+        setBusy(true, `Working (${data.node})...`);
+      } else if (data.type === 'token') {
+        if (!pendingBotMessage) pendingBotMessage = appendMessage('', 'Bot');
+        pendingBotMessage.textContent += data.content;
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+      } else if (data.type === 'answer') {
+        finishMessage(data.bot_message);
+      } else if (data.type === 'error') {
+        finishMessage(data.retry_after ? `Busy, please retry in ${data.retry_after}s.` : 'Error processing message.');
+      }
+    };
+  }
 
+  async function postMessage(userMessage) {
     const formData = new FormData();
     formData.append('user_message', userMessage);
     formData.append('session_id', sessionIdField.value);
@@ -40,8 +82,26 @@ document.addEventListener('DOMContentLoaded', function() {
       console.error('Error:', error);
       appendMessage('Error processing message.', 'Bot');
     } finally {
-      document.getElementById('submit-btn').disabled = false;
-      loadingIndicator.style.display = 'none';
+      setBusy(false);
+    }
+  }
+
+  chatForm.addEventListener('submit', async function(e) {
+    e.preventDefault();
+    const userMessage = userInput.value.trim();
+    if (!userMessage) return;
+    appendMessage(userMessage, 'User');
+    userInput.value = '';
+    setBusy(true);
+
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      pendingBotMessage = null;
+      awaitingReply = true;
+      socket.send(JSON.stringify({ message: userMessage }));
+    } else {
+      await postMessage(userMessage);
     }
   });
+
+  connectSocket();
 });
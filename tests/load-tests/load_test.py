@@ -0,0 +1,393 @@
+"""
+Load-test suite for serve.py. Virtual users drive the ASGI app in-process through httpx with the stub backends
+of stub_backends.py, over four scenarios: the chat page (`/`), single questions (`/chat`), multi-turn sessions
+and clarification flows that pause and resume. Every user runs a fixed number of iterations over seeded question
+choices, so runs are comparable; the report gives throughput and latency percentiles per scenario, and
+--thresholds fails the run when a scenario falls below the committed baseline, scaled to the speed of the machine.
+
+Usage:
+    python tests/load-tests/load_test.py --output report.json --thresholds tests/load-tests/thresholds.json
+    python tests/load-tests/load_test.py --write-thresholds tests/load-tests/thresholds.json
+"""
+import argparse
+import asyncio
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import orjson
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if __name__ == "__main__":
+    # Run as a script, only this directory is importable, and serve.py resolves templates and static files relative
+    # to the working directory; importing the module (pytest, soak_test) changes neither
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+import httpx  # noqa: E402
+
+import serve  # noqa: E402
+from src.graph.checkpoint import open_checkpointer  # noqa: E402
+from src.serving.result_cache import ResultCache  # noqa: E402
+from src.serving.sessions import SessionStore  # noqa: E402
+from stub_backends import AMBIGUOUS_QUESTIONS, STUB_LLM_MS, STUB_RETRIEVAL_MS, stub_backends  # noqa: E402
+
+QUESTIONS = (
+    "Where is the Eiffel Tower?",
+    "Who wrote Pride and Prejudice?",
+    "What is the population of Canada?",
+    "When did the Berlin Wall fall?",
+    "What is the latest news about the Mars rover today?",
+    "How many moons does Jupiter have?",
+    "Who painted the Mona Lisa?",
+    "What is the population of Tokyo?",
+)
+
+FOLLOW_UPS = ("Tell me more about it.", "Why is that important?", "Who else was involved?")
+
+CLARIFICATION_REPLIES = ("The company", "The car maker", "The brand")
+
+PAGE_RELOADS = 9
+
+# Throughput and latency margins applied to a run's figures by --write-thresholds
+RPS_MARGIN = 0.7
+LATENCY_MARGIN = 2.0
+# Sub-millisecond latencies (the chat page) jitter by more than any margin; allow at least this much on top
+LATENCY_FLOOR_MS = 5.0
+
+
+class Recorder:
+    """
+    Collects the latency of every request a scenario makes and the failures of its flows.
+    """
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.flows = 0
+        self.errors: List[str] = []
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """
+        Sends one request, timing it; non-200 answers are recorded as errors and return None.
+        """
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            self.errors.append(f"{method} {url} returned {response.status_code}")
+            return None
+        return response
+
+    async def chat(self, client: httpx.AsyncClient, message: str, session_id: str, profile: Optional[str]):
+        data = {"user_message": message, "session_id": session_id}
+        if profile:
+            data["profile"] = profile
+        response = await self.request(client, "POST", "/chat", data=data)
+        return response.json() if response is not None else None
+
+
+async def index_page(client, rec: Recorder, rng: random.Random, session_id: str, profile: Optional[str]):
+    # A new visitor, then a few reloads of an existing session
+    if await rec.request(client, "GET", "/") is None:
+        return
+    for _ in range(PAGE_RELOADS):
+        if await rec.request(client, "GET", "/", params={"session_id": session_id}) is None:
+            return
+    rec.flows += 1
+
+
+async def single_question(client, rec: Recorder, rng: random.Random, session_id: str, profile: Optional[str]):
+    body = await rec.chat(client, rng.choice(QUESTIONS), session_id, profile)
+    if body is None:
+        return
+    if not body["bot_message"]:
+        rec.errors.append("empty answer")
+        return
+    rec.flows += 1
+
+
+async def multi_turn(client, rec: Recorder, rng: random.Random, session_id: str, profile: Optional[str]):
+    messages = [rng.choice(QUESTIONS)] + list(FOLLOW_UPS)
+    for turn, message in enumerate(messages, 1):
+        body = await rec.chat(client, message, session_id, profile)
+        if body is None:
+            return
+        if body["turn_count"] != 2 * turn:
+            rec.errors.append(f"turn {turn} saw turn_count {body['turn_count']}")
+            return
+    rec.flows += 1
+
+
+async def clarification(client, rec: Recorder, rng: random.Random, session_id: str, profile: Optional[str]):
+    body = await rec.chat(client, rng.choice(AMBIGUOUS_QUESTIONS), session_id, profile)
+    if body is None:
+        return
+    if not body["awaiting_clarification"]:
+        rec.errors.append("ambiguous question did not ask for clarification")
+        return
+    body = await rec.chat(client, rng.choice(CLARIFICATION_REPLIES), session_id, profile)
+    if body is None:
+        return
+    if body["awaiting_clarification"]:
+        rec.errors.append("clarification reply did not resume the run")
+        return
+    rec.flows += 1
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "index": index_page,
+    "chat": single_question,
+    "multi_turn": multi_turn,
+    "clarification": clarification,
+}
+
+
+def _percentile(values: List[float], q: int) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+async def run_scenario(name: str, users: int, iterations: int, seed: int, profile: Optional[str],
+                       run: int = 0) -> dict:
+    """
+    Runs one scenario with concurrent virtual users.
+    :param name: Key of SCENARIOS
+    :param users: Number of concurrent virtual users
+    :param iterations: Flows each user runs, one after the other
+    :param seed: Seed of the users' question choices
+    :param profile: Graph profile sent with every message, None for the default one
+    :param run: Number of the run, which keeps the session IDs of repeated runs apart
+    :return: Throughput, latency percentiles and errors of the scenario
+    """
+    scenario = SCENARIOS[name]
+    rec = Recorder()
+
+    async def user(index: int, client: httpx.AsyncClient):
+        rng = random.Random(f"{seed}/{name}/{index}")
+        for iteration in range(iterations):
+            try:
+                await scenario(client, rec, rng, f"load-{name}-{run}-{index}-{iteration}", profile)
+            except Exception as e:
+                rec.errors.append(f"{type(e).__name__}: {e}")
+
+    transport = httpx.ASGITransport(app=serve.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i, client) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    latencies = rec.latencies
+    return {
+        "requests": len(latencies),
+        "flows": rec.flows,
+        "errors": len(rec.errors),
+        "error_rate": round(len(rec.errors) / (users * iterations), 4),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": _ms(_percentile(latencies, 50)),
+            "p95": _ms(_percentile(latencies, 95)),
+            "p99": _ms(_percentile(latencies, 99)),
+            "max": _ms(max(latencies, default=None)),
+        },
+        "sample_errors": sorted(set(rec.errors))[:5],
+    }
+
+
+@contextmanager
+def stubbed_serve(llm_ms: float, retrieval_ms: float, cache: bool, sessions: Optional[SessionStore] = None,
+                  checkpoint_db: str = ":memory:"):
+    """
+    Points serve.py at fresh stub backends, a new checkpointer and empty session and answer stores, restoring the
+    module afterwards.
+    :param cache: Keep the answer cache; off by default so every message runs the graph
+    :param sessions: Session store to use, a default SessionStore releasing the checkpoints of evicted sessions
+        when None
+    :param checkpoint_db: SQLite path of the checkpointer
+    """
+    replaced = {
+        "backends": stub_backends(llm_ms, retrieval_ms),
+        "chain_apps": None,
+        "profile_backends": {},
+        "open_checkpointer": lambda: open_checkpointer(checkpoint_db),
+        "chat_histories": sessions if sessions is not None else SessionStore(on_evict=serve.forget_session),
+        "result_cache": ResultCache() if cache else ResultCache(max_entries=0),
+    }
+    saved = {name: getattr(serve, name) for name in replaced}
+    for name, value in replaced.items():
+        setattr(serve, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(serve, name, value)
+
+
+async def run_suite(scenarios: List[str], users: int, iterations: int, seed: int = 0, profile: Optional[str] = None,
+                    llm_ms: float = STUB_LLM_MS, retrieval_ms: float = STUB_RETRIEVAL_MS,
+                    cache: bool = False, repeats: int = 1) -> dict:
+    """
+    Runs the scenarios one after the other against serve.app with stub backends.
+    :param repeats: Runs per scenario; the run with the median throughput is reported, which keeps one noisy
+        run from failing (or setting) the thresholds
+    :return: The report: the run settings, the environment and the results per scenario
+    """
+    settings = {"users": users, "iterations": iterations, "seed": seed, "profile": profile,
+                "stub_llm_ms": llm_ms, "stub_retrieval_ms": retrieval_ms, "result_cache": cache,
+                "repeats": repeats}
+    results = {}
+    with stubbed_serve(llm_ms, retrieval_ms, cache):
+        # The lifespan compiles the graphs and warms the clients, as it would at server startup
+        async with serve.lifespan(serve.app):
+            for name in scenarios:
+                runs = [await run_scenario(name, users, iterations, seed, profile, run) for run in range(repeats)]
+                errors = [error for run in runs for error in run["sample_errors"]]
+                runs.sort(key=lambda run: run["rps"])
+                # Errors count in every run, not only the reported one
+                results[name] = dict(runs[len(runs) // 2], runs_rps=[run["rps"] for run in runs],
+                                     errors=sum(run["errors"] for run in runs),
+                                     error_rate=max(run["error_rate"] for run in runs),
+                                     sample_errors=sorted(set(errors))[:5])
+    return {
+        "settings": settings,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count(), "calibration_ms": calibrate()},
+        "scenarios": results,
+    }
+
+
+def calibrate(rounds: int = 5) -> float:
+    """
+    Times a fixed pure-Python workload, which tells how fast this machine runs the app's own code compared with
+    the one the thresholds were measured on.
+    :return: The fastest of the rounds, in milliseconds
+    """
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        table = {}
+        for i in range(100_000):
+            table[i % 997] = f"{i}:{i * 7 % 13}".split(":")
+        sorted(table.items(), key=lambda item: item[1])
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2)
+
+
+def slowdown(report: dict, thresholds: dict) -> float:
+    """
+    Returns how much slower this machine is than the baseline one, at least 1: thresholds are loosened on slower
+    machines and never tightened on faster ones.
+    """
+    measured = report.get("environment", {}).get("calibration_ms")
+    baseline = thresholds.get("calibration_ms")
+    if not measured or not baseline:
+        return 1.0
+    return max(1.0, measured / baseline)
+
+
+def check_thresholds(report: dict, thresholds: dict) -> List[str]:
+    """
+    Compares a report with the thresholds file, scaling the throughput and latency limits by the slowdown of this
+    machine against the baseline's calibration.
+    :return: One message per violated threshold; empty when the run passes
+    """
+    violations = []
+    factor = slowdown(report, thresholds)
+    for name, limits in thresholds.get("scenarios", {}).items():
+        result = report["scenarios"].get(name)
+        if result is None:
+            continue
+        if "min_rps" in limits and result["rps"] < limits["min_rps"] / factor:
+            violations.append(f"{name}: {result['rps']} req/s is below the minimum of "
+                              f"{round(limits['min_rps'] / factor, 1)}")
+        if "max_p95_ms" in limits and result["latency_ms"]["p95"] > limits["max_p95_ms"] * factor:
+            violations.append(f"{name}: p95 of {result['latency_ms']['p95']} ms is above the maximum of "
+                              f"{round(limits['max_p95_ms'] * factor, 1)}")
+        if result["error_rate"] > limits.get("max_error_rate", 0):
+            violations.append(f"{name}: error rate {result['error_rate']} is above the maximum of "
+                              f"{limits.get('max_error_rate', 0)}")
+    return violations
+
+
+def thresholds_from(report: dict) -> dict:
+    """
+    Derives a thresholds file from a baseline run, leaving RPS_MARGIN and LATENCY_MARGIN of headroom for noise.
+    The run's calibration is kept, so other machines can scale the limits (see check_thresholds).
+    """
+    return {
+        "settings": report["settings"],
+        "calibration_ms": report.get("environment", {}).get("calibration_ms"),
+        "scenarios": {
+            name: {
+                "min_rps": round(result["rps"] * RPS_MARGIN, 1),
+                "max_p95_ms": round(max(result["latency_ms"]["p95"] * LATENCY_MARGIN,
+                                        result["latency_ms"]["p95"] + LATENCY_FLOOR_MS), 1),
+                "max_error_rate": 0,
+            }
+            for name, result in report["scenarios"].items()
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the serve.py load-test scenarios against stub backends.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=None, help="Concurrent virtual users per scenario")
+    parser.add_argument("--iterations", type=int, default=None, help="Flows each virtual user runs")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the question choices")
+    parser.add_argument("--repeats", type=int, default=None, help="Runs per scenario; the median one is reported")
+    parser.add_argument("--profile", help="config.yaml profile sent with every message")
+    parser.add_argument("--llm-ms", type=float, default=None, help="Stub latency of one LLM call")
+    parser.add_argument("--retrieval-ms", type=float, default=None, help="Stub latency of one retrieval call")
+    parser.add_argument("--cache", action="store_true", help="Keep the answer cache enabled")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--thresholds", help="Fail when the run is worse than the limits in this file")
+    parser.add_argument("--write-thresholds", help="Write thresholds derived from this run to this file")
+    args = parser.parse_args(argv)
+
+    # A thresholds file records the settings it was measured with; rerun with the same ones unless overridden
+    baseline = {}
+    if args.thresholds:
+        with open(args.thresholds, "rb") as f:
+            thresholds = orjson.loads(f.read())
+        baseline = thresholds.get("settings", {})
+    users = args.users or baseline.get("users", 16)
+    iterations = args.iterations or baseline.get("iterations", 5)
+    seed = args.seed if args.seed is not None else baseline.get("seed", 0)
+    llm_ms = args.llm_ms if args.llm_ms is not None else baseline.get("stub_llm_ms", STUB_LLM_MS)
+    retrieval_ms = (args.retrieval_ms if args.retrieval_ms is not None
+                    else baseline.get("stub_retrieval_ms", STUB_RETRIEVAL_MS))
+    profile = args.profile or baseline.get("profile")
+    cache = args.cache or baseline.get("result_cache", False)
+    repeats = args.repeats or baseline.get("repeats", 1)
+
+    report = asyncio.run(run_suite(args.scenarios, users, iterations, seed, profile, llm_ms, retrieval_ms, cache,
+                                   repeats))
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    if args.write_thresholds:
+        with open(args.write_thresholds, "wb") as f:
+            f.write(orjson.dumps(thresholds_from(report), option=orjson.OPT_INDENT_2) + b"\n")
+    sys.stdout.write(orjson.dumps(report["scenarios"], option=orjson.OPT_INDENT_2).decode() + "\n")
+    if args.thresholds:
+        violations = check_thresholds(report, thresholds)
+        for violation in violations:
+            sys.stderr.write(f"REGRESSION {violation}\n")
+        return 1 if violations else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Soak test for serve.py memory. Drives thousands of sessions (single questions, multi-turn sessions and
+clarification flows) through the ASGI app in-process with the stub backends of stub_backends.py, measuring the
+memory traced by tracemalloc after every batch. Once the session store and the answer cache are full, memory has
+to level off: the run fails when the allocations traced at the end exceed those of a snapshot taken halfway by more
+than --max-bytes-per-session for each session run in between, and prints the allocation sites that grew the most.
+An unbounded session store alone costs about 1 KB per session. Some clarification flows are abandoned after the
+question, and the checkpoints of their paused runs have to go with their evicted sessions: the run also fails when
+the checkpoint database holds a thread of a session that is no longer in the session store.
+
+Usage:
+    python tests/load-tests/soak_test.py --sessions 5000 --max-sessions 500 --output soak.json
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Optional, Set
+
+import httpx
+import orjson
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if __name__ == "__main__":
+    # Same setup as load_test.py run as a script, before its application imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(HERE)))
+    os.chdir(os.path.dirname(os.path.dirname(HERE)))
+
+from load_test import SCENARIOS, Recorder, stubbed_serve  # noqa: E402
+from stub_backends import AMBIGUOUS_QUESTIONS  # noqa: E402
+
+import serve  # noqa: E402
+from src.serving.memory import MemoryProfiler, rss_bytes  # noqa: E402
+from src.serving.sessions import SessionStore  # noqa: E402
+
+
+
+async def abandoned_clarification(client, rec: Recorder, rng: random.Random, session_id: str,
+                                  profile: Optional[str]):
+    # The user never answers, so the run stays paused until the session is evicted
+    body = await rec.chat(client, rng.choice(AMBIGUOUS_QUESTIONS), session_id, profile)
+    if body is None:
+        return
+    if not body["awaiting_clarification"]:
+        rec.errors.append("ambiguous question did not ask for clarification")
+        return
+    rec.flows += 1
+
+
+SOAK_SCENARIOS = dict(SCENARIOS, abandoned=abandoned_clarification)
+# Share of sessions of each scenario
+SESSION_MIX = (("chat", 0.45), ("multi_turn", 0.3), ("clarification", 0.15), ("abandoned", 0.1))
+
+
+def _checkpointed_sessions(path: str) -> Set[str]:
+    # Thread IDs are "<profile>/<session ID>" (see src/graph/checkpoint.py)
+    conn = sqlite3.connect(path)
+    try:
+        return {thread_id.split("/", 1)[1] for thread_id, in conn.execute("SELECT DISTINCT thread_id FROM checkpoints")}
+    finally:
+        conn.close()
+
+
+def _traced_bytes() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def soak(sessions: int, users: int, max_sessions: int, batch: int, seed: int = 0) -> dict:
+    """
+    Runs the sessions in batches and samples memory after each batch.
+    :param sessions: Sessions to run in total
+    :param users: Sessions in flight at a time
+    :param max_sessions: Capacity of the session store
+    :param batch: Sessions between memory samples
+    :param seed: Seed of the scenario and question choices
+    :return: Memory samples, the growth over the second half of the run with its top sites, and the errors
+    """
+    rng = random.Random(seed)
+    names = [name for name, _ in SESSION_MIX]
+    plan = rng.choices(names, weights=[share for _, share in SESSION_MIX], k=sessions)
+    rec = Recorder()
+    samples = []
+    profiler = None
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_db = os.path.join(tmp, "checkpoints.sqlite")
+        sessions_store = SessionStore(max_sessions=max_sessions, on_evict=serve.forget_session)
+        with stubbed_serve(0, 0, cache=True, sessions=sessions_store, checkpoint_db=checkpoint_db):
+            async with serve.lifespan(serve.app):
+                transport = httpx.ASGITransport(app=serve.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://soak", timeout=60) as client:
+                    started = time.perf_counter()
+                    for first in range(0, sessions, batch):
+                        pending = iter(range(first, min(first + batch, sessions)))
+
+                        async def user(index: int):
+                            user_rng = random.Random(f"{seed}/{index}")
+                            for number in pending:
+                                try:
+                                    await SOAK_SCENARIOS[plan[number]](client, rec, user_rng, f"soak-{number}", None)
+                                except Exception as e:
+                                    rec.errors.append(f"{type(e).__name__}: {e}")
+
+                        await asyncio.gather(*(user(first + i) for i in range(users)))
+                        # Samples are taken between batches, when no request is in flight
+                        done = min(first + batch, sessions)
+                        await asyncio.to_thread(serve.flush_forgotten_sessions)
+                        checkpointed = _checkpointed_sessions(checkpoint_db)
+                        stored = {session_id for session_id, _ in serve.chat_histories.items()}
+                        samples.append({"sessions": done, "traced_bytes": _traced_bytes(), "rss_bytes": rss_bytes(),
+                                        "stored_sessions": len(serve.chat_histories),
+                                        "checkpointed_sessions": len(checkpointed),
+                                        "orphaned_checkpoints": len(checkpointed - stored)})
+                        if profiler is None and done >= sessions // 2:
+                            # The baseline snapshot is taken halfway, once the session store and the cache are full
+                            # Allocations of the load-test harness itself (latencies kept per request) do not count
+                            profiler = MemoryProfiler(enabled=True, interval_seconds=3600,
+                                                      exclude=[os.path.join(HERE, "*")])
+                            profiler.snapshot()
+                    elapsed = time.perf_counter() - started
+                if profiler is not None:
+                    profiler.snapshot()
+                growth = profiler.report(top=10) if profiler is not None else {}
+                cache_entries = serve.result_cache.metrics()["entries"]
+                store = serve.chat_histories.metrics()
+
+    return {
+        "sessions": sessions,
+        "requests": len(rec.latencies),
+        "errors": len(rec.errors),
+        "sample_errors": sorted(set(rec.errors))[:5],
+        "seconds": round(elapsed, 1),
+        "session_store": store,
+        "result_cache_entries": cache_entries,
+        "growth_bytes": growth.get("growth_since_start_bytes", 0),
+        "samples": samples,
+        "growth_sites": growth.get("growth_since_start", []),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive many sessions through serve.py and check memory stays bounded.")
+    parser.add_argument("--sessions", type=int, default=3000, help="Sessions to run")
+    parser.add_argument("--users", type=int, default=16, help="Sessions in flight at a time")
+    parser.add_argument("--max-sessions", type=int, default=500, help="SESSION_MAX of the session store")
+    parser.add_argument("--batch", type=int, default=250, help="Sessions between memory samples")
+    parser.add_argument("--max-bytes-per-session", type=float, default=256,
+                        help="Allowed traced memory growth per session over the second half of the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    tracemalloc.start(1)
+    try:
+        report = asyncio.run(soak(args.sessions, args.users, args.max_sessions, args.batch, args.seed))
+    finally:
+        tracemalloc.stop()
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    for sample in report["samples"]:
+        sys.stdout.write(f"{sample['sessions']:>7} sessions  traced {sample['traced_bytes'] / 2**20:8.1f} MB  "
+                         f"rss {(sample['rss_bytes'] or 0) / 2**20:8.1f} MB  stored {sample['stored_sessions']}  "
+                         f"checkpointed {sample['checkpointed_sessions']}\n")
+    per_session = report["growth_bytes"] / (args.sessions - args.sessions // 2)
+    sys.stdout.write(f"{report['requests']} requests in {report['seconds']} s, {report['errors']} errors, "
+                     f"growth over the second half {report['growth_bytes'] / 2**20:.2f} MB "
+                     f"({per_session:.0f} B per session)\n")
+    failed = False
+    if report["errors"]:
+        sys.stderr.write(f"FAILED {report['errors']} errors: {report['sample_errors']}\n")
+        failed = True
+    orphaned = max(sample["orphaned_checkpoints"] for sample in report["samples"])
+    if orphaned:
+        sys.stderr.write(f"FAILED the checkpoint database kept the paused runs of {orphaned} evicted sessions\n")
+        failed = True
+    if per_session > args.max_bytes_per_session:
+        sys.stderr.write(f"FAILED memory grew by {per_session:.0f} B per session (limit {args.max_bytes_per_session} "
+                         f"B); top growth:\n")
+        for site in report["growth_sites"]:
+            sys.stderr.write(f"  {site['size_diff_bytes']:>12} B  {site['site']}\n")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Stub backends for load tests: deterministic answers with a fixed latency per call in place of OpenAI, Wikipedia
+and Tavily, so a load-test run measures serve.py and the graph rather than the external services.
+
+They can also back a real server, e.g. to point another load generator at it:
+    PYTHONPATH=tests/load-tests GRAPH_BACKENDS=stub_backends:stub_backends uvicorn serve:app
+"""
+import os
+import re
+import time
+
+from src.graph.backends import Backends
+from src.graph.routing import SourceRouter
+
+# Simulated latency of one LLM call and of one retrieval call, in milliseconds
+STUB_LLM_MS = float(os.getenv("STUB_LLM_MS", "20"))
+STUB_RETRIEVAL_MS = float(os.getenv("STUB_RETRIEVAL_MS", "40"))
+
+# Questions the stub ambiguity check flags; the clarification flow of the load test asks these
+AMBIGUOUS_QUESTIONS = ("Where is Tesla?", "How big is Mercury?", "When was Jaguar founded?")
+
+CLARIFICATION = "- Did you mean the company?\n- Or something else with that name?"
+
+
+class StubResponse:
+    __slots__ = ("content",)
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubLLM:
+    """
+    Chat model stub answering one node role.
+    """
+    def __init__(self, role: str, latency_ms: float = STUB_LLM_MS):
+        self.role = role
+        self.latency = latency_ms / 1000
+
+    def invoke(self, prompt: str) -> StubResponse:
+        time.sleep(self.latency)
+        return StubResponse(self.reply(prompt))
+
+    def reply(self, prompt: str) -> str:
+        if self.role == "detect_ambiguity":
+            return "yes" if any(f"Current question: {q}" in prompt for q in AMBIGUOUS_QUESTIONS) else "no"
+        if self.role == "clarify":
+            return CLARIFICATION
+        if self.role == "grade":
+            # Questions about populations fall back to web search
+            return "no" if "population" in prompt.lower() else "yes"
+        if self.role == "rerank":
+            return "0,1,2"
+        if self.role == "expand":
+            return "alternative query one\nalternative query two"
+        if self.role == "generate":
+            return "A short stub answer."
+        if self.role == "process_clarification":
+            original = re.search(r'Original question: "(.*)"', prompt)
+            return f"{original.group(1) if original else 'Unknown question'} (the company)"
+        # The transform role keeps the question as it is
+        return ""
+
+
+class StubWikipedia:
+    def __init__(self, latency_ms: float = STUB_RETRIEVAL_MS):
+        self.latency = latency_ms / 1000
+
+    def run(self, query: str):
+        time.sleep(self.latency)
+        return [f"Wikipedia article about {query}. " * 8, f"Related article on {query}. " * 8]
+
+
+class StubWebSearch:
+    def __init__(self, latency_ms: float = STUB_RETRIEVAL_MS):
+        self.latency = latency_ms / 1000
+
+    def invoke(self, query: str):
+        time.sleep(self.latency)
+        return [{"url": f"https://example.com/{i}", "content": f"Web result {i} for {query}. " * 8} for i in range(3)]
+
+
+class SilentLogger:
+    @staticmethod
+    def log_message(session_id, node, message):
+        pass
+
+
+def stub_backends(llm_ms: float = STUB_LLM_MS, retrieval_ms: float = STUB_RETRIEVAL_MS) -> Backends:
+    """
+    Builds a registry of stub backends.
+    :param llm_ms: Latency of every LLM call
+    :param retrieval_ms: Latency of every Wikipedia and web search call
+    :return: The registry
+    """
+    return Backends(
+        llms={role: StubLLM(role, llm_ms) for role in Backends.ROLES},
+        llm=StubLLM("default", llm_ms),
+        wikipedia=StubWikipedia(retrieval_ms),
+        web_search=StubWebSearch(retrieval_ms),
+        logger=SilentLogger,
+        # No exploration, so every run routes the same questions the same way
+        router=SourceRouter(explore_rate=0),
+    )
@@ -0,0 +1,48 @@
+# test_load_test.py
+import asyncio
+import os
+import subprocess
+import sys
+
+from load_test import ROOT, SCENARIOS, calibrate, check_thresholds, run_suite, thresholds_from
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_every_scenario_completes_its_flows_without_errors():
+    report = asyncio.run(run_suite(list(SCENARIOS), users=2, iterations=2, llm_ms=0, retrieval_ms=0))
+    for name, result in report["scenarios"].items():
+        assert result["errors"] == 0, (name, result["sample_errors"])
+        assert result["flows"] == 4
+        assert result["rps"] > 0 and result["latency_ms"]["p95"] is not None
+    assert report["scenarios"]["multi_turn"]["requests"] == 16
+    assert report["scenarios"]["clarification"]["requests"] == 8
+
+
+def test_thresholds_flag_throughput_latency_and_error_regressions():
+    baseline = {"settings": {}, "scenarios": {"chat": {"rps": 50.0, "error_rate": 0, "latency_ms": {"p95": 300.0}}}}
+    thresholds = thresholds_from(baseline)
+    assert thresholds["scenarios"]["chat"] == {"min_rps": 35.0, "max_p95_ms": 600.0, "max_error_rate": 0}
+    assert check_thresholds(baseline, thresholds) == []
+    slower = {"scenarios": {"chat": {"rps": 30.0, "error_rate": 0.1, "latency_ms": {"p95": 700.0}}}}
+    violations = check_thresholds(slower, thresholds)
+    assert len(violations) == 3 and all(v.startswith("chat:") for v in violations)
+
+
+def test_thresholds_scale_with_the_speed_of_the_machine():
+    baseline = {"settings": {}, "environment": {"calibration_ms": 10.0},
+                "scenarios": {"chat": {"rps": 50.0, "error_rate": 0, "latency_ms": {"p95": 300.0}}}}
+    thresholds = thresholds_from(baseline)
+    run = {"scenarios": {"chat": {"rps": 20.0, "error_rate": 0, "latency_ms": {"p95": 1000.0}}}}
+    # A machine twice as slow gets half the throughput and twice the latency limit
+    assert check_thresholds(dict(run, environment={"calibration_ms": 20.0}), thresholds) == []
+    assert len(check_thresholds(dict(run, environment={"calibration_ms": 10.0}), thresholds)) == 2
+    # A faster machine is held to the baseline's limits, not tighter ones
+    assert check_thresholds(dict(baseline, environment={"calibration_ms": 5.0}), thresholds) == []
+    assert calibrate(rounds=1) > 0
+
+
+def test_importing_the_load_test_leaves_the_process_alone():
+    code = "import os, sys; cwd, path = os.getcwd(), list(sys.path); import load_test; " \
+           "assert (os.getcwd(), sys.path) == (cwd, path)"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ, PYTHONPATH=HERE), check=True)
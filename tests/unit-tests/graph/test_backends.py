@@ -0,0 +1,138 @@
+# test_backends.py
+import pytest
+from langchain_core.documents import Document
+
+import src.graph.nodes as nodes
+from src.graph.backends import Backends, _build_llm, load_backends
+from src.graph.graph import build_workflow
+from src.graph.routing import SourceRouter
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    def __init__(self, content):
+        self.content = content
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(self.content)
+
+
+class FakeWikipedia:
+    def __init__(self, results):
+        self.results = results
+        self.queries = []
+
+    def run(self, query):
+        self.queries.append(query)
+        return self.results
+
+
+class FakeWebSearch:
+    def __init__(self, results):
+        self.results = results
+
+    def invoke(self, query):
+        return self.results
+
+
+class SilentLogger:
+    messages = []
+
+    @staticmethod
+    def log_message(session_id, node, message):
+        SilentLogger.messages.append((node, message))
+
+
+@pytest.fixture
+def base_state():
+    return {
+        "chat_history": [],
+        "original_question": "Where is Tesla HQ?",
+        "clarified_question": None,
+        "wikipedia_docs": [],
+        "web_docs": [],
+        "reranked_docs": [],
+        "final_answer": None,
+        "needs_clarification": False,
+        "session_id": "test-session",
+    }
+
+
+def make_backends(grade="yes", wiki_results=("Tesla HQ is in Austin",), web_results=(), reranker=None):
+    return Backends(
+        llms={
+            "detect_ambiguity": FakeLLM("no"),
+            "grade": FakeLLM(grade),
+            "rerank": FakeLLM("1,0"),
+            "generate": FakeLLM("Tesla HQ is in Austin (Wikipedia)"),
+        },
+        llm=FakeLLM("unused"),
+        wikipedia=FakeWikipedia(list(wiki_results)),
+        web_search=FakeWebSearch(list(web_results)),
+        reranker=reranker,
+        logger=SilentLogger,
+        # A router of its own, so routing outcomes learned in one test do not leak into the next
+        router=SourceRouter(explore_rate=0),
+    )
+
+
+def test_unknown_llm_role_is_rejected():
+    with pytest.raises(ValueError):
+        Backends(llms={"summarize": FakeLLM("x")})
+
+
+def test_llm_for_falls_back_to_default():
+    default = FakeLLM("default")
+    backends = Backends(llm=default, llms={"grade": FakeLLM("grade")})
+    assert backends.llm_for("transform") is default
+    assert backends.llm_for("grade") is not default
+
+
+def test_node_uses_injected_backends(base_state):
+    backends = make_backends()
+    result = nodes.retrieve_wikipedia(base_state, backends)
+    assert [doc.page_content for doc in result["wikipedia_docs"]] == ["Tesla HQ is in Austin"]
+    assert len(backends.wikipedia.queries) == 1
+
+
+def test_custom_reranker_replaces_llm_ranking(base_state):
+    backends = make_backends(reranker=lambda query, docs: list(reversed(docs)))
+    base_state["web_docs"] = [Document(page_content=f"Doc {i}") for i in range(4)]
+    result = nodes.rerank_documents(base_state, backends)
+    assert [doc.page_content for doc in result["reranked_docs"]] == ["Doc 3", "Doc 2", "Doc 1"]
+    assert backends.llm_for("rerank").prompts == []
+
+
+def test_full_workflow_with_wikipedia_answer(base_state):
+    backends = make_backends(grade="yes")
+    result = build_workflow(backends).compile().invoke(base_state)
+    assert result["final_answer"] == "Tesla HQ is in Austin (Wikipedia)"
+    assert result["web_docs"] == []
+
+
+def test_full_workflow_falls_back_to_web(base_state):
+    backends = make_backends(grade="no", web_results=[
+        {"content": "Web doc A", "url": "http://example.com/a"},
+        {"content": "Web doc B", "url": "http://example.com/b"},
+    ])
+    result = build_workflow(backends).compile().invoke(base_state)
+    assert [doc.page_content for doc in result["reranked_docs"]] == ["Web doc B", "Web doc A"]
+    assert result["final_answer"] is not None
+
+
+def test_load_backends_from_spec():
+    backends = load_backends(f"{__name__}:make_backends")
+    assert isinstance(backends, Backends)
+    with pytest.raises(ValueError):
+        load_backends("no_factory_given")
+
+
+def test_llm_client_leaves_retries_to_the_retry_policy(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    assert _build_llm("gpt-4o-mini")._client.max_retries == 0
@@ -0,0 +1,221 @@
+# test_checkpoint.py
+import importlib
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from langgraph.types import Command
+
+import serve
+import src.graph.checkpoint as checkpoint
+from src.graph.backends import Backends
+from src.graph.checkpoint import (history_input, interrupt_value, open_checkpointer, pending_clarification,
+                                  thread_config)
+from src.graph.config import GraphConfig
+from src.graph.entities import EntityIndex
+from src.graph.graph import build_workflow
+from src.graph.history import ChatHistory, Sender
+from src.serving.refresh import HotQuestions
+from src.serving.result_cache import ResultCache
+from src.serving.sessions import SessionStore
+from test_backends import FakeLLM, FakeWebSearch, FakeWikipedia, SilentLogger
+
+
+def ambiguous_backends():
+    return Backends(
+        llms={
+            "detect_ambiguity": FakeLLM("yes"),
+            "clarify": FakeLLM("- Tesla the company?\n- Nikola Tesla the inventor?"),
+            "process_clarification": FakeLLM("Where is the headquarters of Tesla, Inc.?"),
+            "transform": FakeLLM("Where is the headquarters of Tesla, Inc.?"),
+            "grade": FakeLLM("yes"),
+            "generate": FakeLLM("Tesla HQ is in Austin (Wikipedia)"),
+        },
+        wikipedia=FakeWikipedia(["Tesla HQ is in Austin"]),
+        web_search=FakeWebSearch([]),
+        logger=SilentLogger,
+        # An empty entity index keeps the clarification on the LLM path
+        entities=EntityIndex(),
+    )
+
+
+@pytest.fixture
+def base_state():
+    return {
+        "chat_history": [],
+        "original_question": "Where is Tesla?",
+        "clarified_question": None,
+        "wikipedia_docs": [],
+        "web_docs": [],
+        "reranked_docs": [],
+        "final_answer": None,
+        "needs_clarification": False,
+        "clarification_answer": None,
+        "session_id": "test-session",
+    }
+
+
+def test_open_checkpointer_can_be_disabled():
+    assert open_checkpointer("off") is None
+    assert open_checkpointer("") is None
+
+
+def test_clarification_pauses_and_resumes_with_state(base_state, tmp_path):
+    backends = ambiguous_backends()
+    graph = build_workflow(backends, resumable=True).compile(
+        checkpointer=open_checkpointer(str(tmp_path / "checkpoints.sqlite")))
+    config = thread_config("test-session")
+
+    paused = graph.invoke(base_state, config)
+    assert interrupt_value(paused) == {"clarification": "- Tesla the company?\n- Nikola Tesla the inventor?"}
+    assert paused["final_answer"] is None
+    assert pending_clarification(graph, "test-session").startswith("- Tesla the company?")
+
+    result = graph.invoke(Command(resume="The company"), config)
+    assert result["final_answer"] == "Tesla HQ is in Austin (Wikipedia)"
+    assert result["original_question"] == "Where is Tesla?"
+    assert '"The company"' in backends.llm_for("process_clarification").prompts[-1]
+    # Ambiguity detection and clarification ran once; the resumed run started at the paused node
+    assert len(backends.llm_for("detect_ambiguity").prompts) == 1
+    assert len(backends.llm_for("clarify").prompts) == 1
+    assert pending_clarification(graph, "test-session") is None
+
+
+def test_checkpoints_leave_out_the_chat_history(base_state):
+    backends = ambiguous_backends()
+    graph = build_workflow(backends, resumable=True).compile(checkpointer=open_checkpointer(":memory:"))
+    config = thread_config("test-session")
+    history = ChatHistory()
+    history.append(Sender.USER, "Who founded SpaceX?")
+    history.append(Sender.BOT, "Elon Musk")
+
+    graph.invoke(dict(base_state, chat_history=history_input(graph, history)), config)
+    assert "chat_history" not in graph.checkpointer.get_tuple(config).checkpoint["channel_values"]
+    history.append(Sender.USER, "Where is Tesla?")
+    graph.invoke(Command(resume="The company", update={"chat_history": history_input(graph, history)}), config)
+    # The resumed node reads the history it was given, not one restored from the checkpoint
+    assert "User: Where is Tesla?" in backends.llm_for("process_clarification").prompts[-1]
+    # Nothing is pickled
+    conn = graph.checkpointer.conn
+    types = {row[0] for row in conn.execute("SELECT type FROM checkpoints UNION SELECT type FROM writes")}
+    assert "pickle" not in types
+
+
+def test_checkpointing_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("CHECKPOINT_DB", raising=False)
+    try:
+        assert importlib.reload(checkpoint).open_checkpointer() is None
+    finally:
+        importlib.reload(checkpoint)
+
+
+def test_without_checkpointer_the_run_does_not_pause(base_state):
+    result = build_workflow(ambiguous_backends()).compile().invoke(base_state)
+    assert result["final_answer"] == "Tesla HQ is in Austin (Wikipedia)"
+
+
+def test_chat_resumes_paused_run(monkeypatch):
+    monkeypatch.setenv("WARM_UP_CLIENTS", "0")
+    monkeypatch.setattr(serve, "backends", ambiguous_backends())
+    monkeypatch.setattr(serve, "chain_apps", None)
+    monkeypatch.setattr(serve, "profile_backends", {})
+    monkeypatch.setattr(serve, "open_checkpointer", lambda: open_checkpointer(":memory:"))
+    monkeypatch.setattr(serve, "chat_histories", SessionStore())
+    monkeypatch.setattr(serve, "hot_questions", HotQuestions())
+    monkeypatch.setattr(serve, "result_cache", ResultCache())
+    with TestClient(serve.app) as client:
+        first = client.post("/chat", data={"user_message": "Where is Tesla?", "session_id": "s1"}).json()
+        assert first["awaiting_clarification"]
+        assert first["bot_message"].startswith("- Tesla the company?")
+        checkpointer = serve.get_chain_app().checkpointer
+        config = thread_config("s1", serve.graph_config.default_profile)
+        assert checkpointer.get_tuple(config) is not None
+        second = client.post("/chat", data={"user_message": "The company", "session_id": "s1"}).json()
+        # Only a paused run keeps its checkpoints
+        assert checkpointer.get_tuple(config) is None
+    assert not second["awaiting_clarification"]
+    assert second["bot_message"] == "Tesla HQ is in Austin (Wikipedia)"
+    assert second["turn_count"] == 4
+
+
+def test_evicted_session_loses_its_paused_run(monkeypatch):
+    monkeypatch.setenv("WARM_UP_CLIENTS", "0")
+    monkeypatch.setattr(serve, "backends", ambiguous_backends())
+    monkeypatch.setattr(serve, "chain_apps", None)
+    monkeypatch.setattr(serve, "profile_backends", {})
+    monkeypatch.setattr(serve, "open_checkpointer", lambda: open_checkpointer(":memory:"))
+    monkeypatch.setattr(serve, "chat_histories",
+                        SessionStore(max_sessions=1, idle_ttl_seconds=0, on_evict=serve.forget_session))
+    monkeypatch.setattr(serve, "hot_questions", HotQuestions())
+    monkeypatch.setattr(serve, "result_cache", ResultCache())
+    with TestClient(serve.app) as client:
+        assert client.post("/chat", data={"user_message": "Where is Tesla?", "session_id": "s1"}).json()[
+            "awaiting_clarification"]
+        checkpointer = serve.get_chain_app().checkpointer
+        config = thread_config("s1", serve.graph_config.default_profile)
+        assert checkpointer.get_tuple(config) is not None
+        # A second session evicts the first from the full store, and its paused run with it
+        client.post("/chat", data={"user_message": "Where is Tesla?", "session_id": "s2"})
+        serve.flush_forgotten_sessions()
+        assert checkpointer.get_tuple(config) is None
+        assert checkpointer.get_tuple(thread_config("s2", serve.graph_config.default_profile)) is not None
+
+
+class FailingLLM(FakeLLM):
+    def invoke(self, prompt):
+        raise RuntimeError("model unavailable")
+
+
+def serve_with_checkpoints(monkeypatch, backends, profiles=("balanced",)):
+    monkeypatch.setenv("WARM_UP_CLIENTS", "0")
+    monkeypatch.setattr(serve, "graph_config",
+                        GraphConfig.model_validate({"profiles": {name: {} for name in profiles}}))
+    monkeypatch.setattr(serve, "backends", backends)
+    monkeypatch.setattr(serve, "chain_apps", None)
+    monkeypatch.setattr(serve, "profile_backends", {})
+    monkeypatch.setattr(serve, "open_checkpointer", lambda: open_checkpointer(":memory:"))
+    monkeypatch.setattr(serve, "chat_histories", SessionStore())
+    monkeypatch.setattr(serve, "hot_questions", HotQuestions())
+    monkeypatch.setattr(serve, "result_cache", ResultCache())
+    return TestClient(serve.app)
+
+
+def test_failed_websocket_run_leaves_no_checkpoints(monkeypatch):
+    backends = ambiguous_backends()
+    backends.llms["detect_ambiguity"] = FakeLLM("no")
+    backends.llms["generate"] = FailingLLM("")
+    with serve_with_checkpoints(monkeypatch, backends) as client:
+        with pytest.raises(RuntimeError):
+            with client.websocket_connect("/ws/s1") as websocket:
+                websocket.send_json({"message": "Where is Tesla?"})
+                while True:
+                    websocket.receive_json()
+        checkpointer = serve.get_chain_app().checkpointer
+        assert checkpointer.get_tuple(thread_config("s1", "balanced")) is None
+
+
+def test_reply_under_another_profile_resumes_the_paused_run(monkeypatch):
+    with serve_with_checkpoints(monkeypatch, ambiguous_backends(), profiles=("balanced", "fast")) as client:
+        first = client.post("/chat", data={"user_message": "Where is Tesla?", "session_id": "s1",
+                                           "profile": "balanced"}).json()
+        assert first["awaiting_clarification"]
+        second = client.post("/chat", data={"user_message": "The company", "session_id": "s1",
+                                            "profile": "fast"}).json()
+        assert second["profile"] == "balanced"
+        assert second["bot_message"] == "Tesla HQ is in Austin (Wikipedia)"
+        for profile in ("balanced", "fast"):
+            assert serve.get_chain_app(profile).checkpointer.get_tuple(thread_config("s1", profile)) is None
+
+
+def test_evicted_checkpoints_are_deleted_off_the_request_thread(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(serve, "chain_apps", {"balanced": object(), "fast": object()})
+    monkeypatch.setattr(serve, "delete_thread",
+                        lambda graph, session_id, profile: deleted.append((session_id, profile,
+                                                                           threading.current_thread().name)))
+    store = SessionStore(max_sessions=1, idle_ttl_seconds=0, on_evict=serve.forget_session)
+    store.setdefault("s1", ChatHistory())
+    store.setdefault("s2", ChatHistory())
+    serve.flush_forgotten_sessions()
+    assert sorted((session_id, profile) for session_id, profile, _ in deleted) == [("s1", "balanced"), ("s1", "fast")]
+    assert all(name.startswith("checkpoint-cleanup") for _, _, name in deleted)
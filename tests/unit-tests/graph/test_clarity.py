@@ -0,0 +1,71 @@
+# test_clarity.py
+import pytest
+
+import src.graph.nodes as nodes
+from src.graph.backends import Backends
+from src.graph.clarity import ClarityClassifier
+from src.graph.entities import ENTITY_INDEX_PATH, EntityIndex
+from test_backends import FakeLLM, SilentLogger
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    classifier = ClarityClassifier()
+    classifier.warm_up()
+    return classifier
+
+
+@pytest.mark.parametrize("question", [
+    "What is the capital of Germany?",
+    "How many people live in Canada?",
+    "What is the population of Berlin?",
+])
+def test_clear_questions_skip_the_llm(classifier, question):
+    assert classifier.is_clear(question)
+
+
+@pytest.mark.parametrize("question", [
+    "Where is Tesla?",                          # too short
+    "When was he born in Germany?",             # refers back to the conversation
+    "how does photosynthesis work in plants?",  # names no entity
+    "Tell me about Mercury in detail",          # the model is not confident
+])
+def test_unclear_questions_take_the_llm_path(classifier, question):
+    assert not classifier.is_clear(question)
+
+
+def test_metrics_count_the_llm_path():
+    classifier = ClarityClassifier()
+    classifier.is_clear("What is the capital of Germany?")
+    classifier.is_clear("What about it?")
+    assert classifier.metrics() == {"checked": 2, "bypassed": 1, "llm_path": 1, "llm_path_rate": 0.5}
+
+
+def test_detect_ambiguity_bypasses_llm_for_clear_question(classifier):
+    llm = FakeLLM("yes")
+    backends = Backends(llms={"detect_ambiguity": llm}, logger=SilentLogger, clarity=classifier,
+                        entities=EntityIndex())
+    state = {"chat_history": [], "original_question": "What is the capital of Germany?", "session_id": "s"}
+    assert nodes.detect_ambiguity(state, backends) == {"needs_clarification": False}
+    assert llm.prompts == []
+
+    state["original_question"] = "Where is Tesla?"
+    assert nodes.detect_ambiguity(state, backends) == {"needs_clarification": True}
+    assert len(llm.prompts) == 1
+
+
+@pytest.mark.parametrize("question", [
+    "Where is the headquarters of Midas located?",
+    "When was Mercury first discovered?",
+    "What is the population of Georgia?",
+    "Who is the current CEO of Jaguar?",
+])
+def test_known_ambiguous_entities_reach_clarification(classifier, question):
+    detect, clarify = FakeLLM("yes"), FakeLLM("unused")
+    backends = Backends(llms={"detect_ambiguity": detect, "clarify": clarify}, logger=SilentLogger,
+                        clarity=classifier, entities=EntityIndex(path=ENTITY_INDEX_PATH))
+    state = {"chat_history": [], "original_question": question, "session_id": "s"}
+    assert nodes.detect_ambiguity(state, backends) == {"needs_clarification": True}
+    assert len(detect.prompts) == 1
+    clarification = nodes.clarify_question(state, backends)["clarified_question"]
+    assert clarification.startswith("Which ") and clarify.prompts == []
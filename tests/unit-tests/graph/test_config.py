@@ -0,0 +1,107 @@
+# test_config.py
+import pytest
+from langchain_core.documents import Document
+
+import src.graph.backends as backends_module
+import src.graph.nodes as nodes
+from src.graph.backends import Backends
+from src.graph.config import DEFAULT_PROFILE, ConfigError, GraphConfig, GraphProfile, load_config
+from src.graph.graph import build_workflow
+from test_backends import FakeLLM, FakeWebSearch, FakeWikipedia, SilentLogger, make_backends
+
+
+def state(question="Where is Tesla HQ?"):
+    return {
+        "chat_history": [],
+        "original_question": question,
+        "clarified_question": None,
+        "query_variants": [],
+        "wikipedia_docs": [],
+        "wikipedia_sufficient": None,
+        "web_docs": [],
+        "reranked_docs": [],
+        "final_answer": None,
+        "needs_clarification": False,
+        "clarification_answer": None,
+        "session_id": "test-session",
+    }
+
+
+def test_repository_config_is_valid():
+    config = load_config("config.yaml")
+    assert set(config.profiles) == {"fast", "balanced", "thorough"}
+    assert config.profile().name == "balanced"
+    assert config.profile("fast").nodes.grade is False
+    assert config.profile("thorough").nodes.query_variants == 3
+
+
+def test_missing_or_empty_file_gives_builtin_profile(tmp_path):
+    assert load_config(str(tmp_path / "missing.yaml")).profile() == DEFAULT_PROFILE
+    empty = tmp_path / "empty.yaml"
+    empty.write_text("")
+    assert list(load_config(str(empty)).profiles) == ["balanced"]
+
+
+@pytest.mark.parametrize("text", [
+    "profiles:\n  fast:\n    nodes:\n      grading: false\n",
+    "profiles:\n  fast:\n    models:\n      roles:\n        summarize: gpt-4o-mini\n",
+    "profiles:\n  fast:\n    retrieval:\n      web_k: 0\n",
+    "default_profile: turbo\n",
+    "ingestion:\n  chunk_size: 100\n  chunk_overlap: 100\n",
+    "profiles: [",
+])
+def test_invalid_config_is_rejected(tmp_path, text):
+    path = tmp_path / "config.yaml"
+    path.write_text(text)
+    with pytest.raises(ConfigError):
+        load_config(str(path))
+
+
+def test_unknown_profile_names_the_available_ones():
+    config = GraphConfig.model_validate({"profiles": {"balanced": {}, "fast": {}}})
+    with pytest.raises(ConfigError, match="balanced, fast"):
+        config.profile("turbo")
+
+
+def test_fast_profile_skips_optional_nodes():
+    fast = load_config("config.yaml").profile("fast")
+    graph = build_workflow(make_backends(), profile=fast).compile()
+    assert set(graph.get_graph().nodes) - {"__start__", "__end__"} == {"retrieve_wikipedia", "generate_answer"}
+    assert graph.invoke(state())["final_answer"] == "Tesla HQ is in Austin (Wikipedia)"
+
+
+def test_without_grading_web_search_runs_only_when_wikipedia_is_empty():
+    profile = GraphProfile(nodes={"detect_ambiguity": False, "grade": False, "rerank": False})
+    backends = make_backends(wiki_results=(), web_results=[{"content": "Austin, Texas", "url": "http://a"}])
+    result = build_workflow(backends, profile=profile).compile().invoke(state())
+    assert [doc.page_content for doc in result["web_docs"]] == ["Austin, Texas"]
+    assert "grade_wikipedia" not in build_workflow(backends, profile=profile).compile().get_graph().nodes
+
+
+def test_profile_limits_reach_the_nodes():
+    profile = GraphProfile(retrieval={"passages_per_source": 1}, limits={"rerank_top_k": 1})
+    backends = make_backends(wiki_results=["Tesla HQ is in Austin", "Tesla builds cars in Fremont"])
+    docs = nodes.retrieve_wikipedia(state(), backends=backends, profile=profile)["wikipedia_docs"]
+    assert len(docs) == 1
+    web_docs = [Document(page_content=f"Doc {i}") for i in range(4)]
+    reranked = nodes.rerank_documents(dict(state(), web_docs=web_docs), backends=backends,
+                                      profile=profile)["reranked_docs"]
+    assert len(reranked) == 1
+
+
+def test_profile_picks_models_and_retriever_limits_of_shared_clients(monkeypatch):
+    built = []
+    monkeypatch.setattr(backends_module, "_clients", {})
+    monkeypatch.setitem(backends_module._CLIENT_FACTORIES, "llm", lambda model="default": built.append(model) or model)
+    monkeypatch.setitem(backends_module._CLIENT_FACTORIES, "wikipedia", lambda top_k_results=2: top_k_results)
+    profile = GraphProfile(models={"default": "big", "roles": {"grade": "small"}}, retrieval={"wikipedia_top_k": 5})
+    registry = Backends(logger=SilentLogger).with_profile(profile)
+    assert registry.llm_for("grade") == "small"
+    assert registry.llm_for("generate") == "big"
+    assert registry.llm_for("grade") == "small" and built == ["small", "big"]
+    assert registry.wikipedia == 5
+    # Backends passed in explicitly are kept whatever the profile says
+    injected = Backends(llms={"grade": FakeLLM("yes")}, wikipedia=FakeWikipedia([]), web_search=FakeWebSearch([]),
+                        logger=SilentLogger).with_profile(profile)
+    assert isinstance(injected.llm_for("grade"), FakeLLM)
+    assert isinstance(injected.wikipedia, FakeWikipedia)
@@ -0,0 +1,54 @@
+# test_context_packing.py
+from langchain_core.documents import Document
+
+from src.graph.context_packing import pack_context, score_passages
+from src.graph.history import ChatHistory, Sender
+from src.graph.tokens import count_tokens, truncate_tokens
+
+TESLA = "Tesla, Inc. is an American electric vehicle company headquartered in Austin, Texas."
+MIDAS = "Midas was a king of Phrygia whose touch turned everything into gold."
+
+
+def doc(text, source="Wikipedia"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_truncate_tokens():
+    assert truncate_tokens(TESLA, 1000) == TESLA
+    assert count_tokens(truncate_tokens(TESLA, 5)) <= 5
+    assert truncate_tokens(TESLA, 0) == ""
+
+
+def test_relevant_passages_score_higher():
+    scores = score_passages("Where is Tesla headquartered?", [doc(MIDAS), doc(TESLA)])
+    assert scores[1] > scores[0]
+
+
+def test_overlapping_passages_are_deduplicated_across_sources():
+    copied = doc("From the web: " + TESLA, source="http://example.com")
+    packed = pack_context("Where is Tesla headquartered?", [doc(TESLA), copied, doc(MIDAS)], ChatHistory())
+    assert [d.page_content for d in packed.passages] == [TESLA, MIDAS]
+    assert packed.dropped == 1
+
+
+def test_budget_keeps_best_passage_in_retrieval_order():
+    budget = count_tokens(TESLA) + 2
+    packed = pack_context("Where is Tesla headquartered?", [doc(MIDAS), doc(TESLA)], ChatHistory(), budget=budget)
+    assert [d.page_content for d in packed.passages] == [TESLA]
+    assert packed.tokens <= budget
+
+
+def test_history_is_trimmed_before_evidence():
+    history = ChatHistory()
+    for i in range(20):
+        history.append(Sender.USER if i % 2 == 0 else Sender.BOT, f"earlier message number {i}")
+    budget = count_tokens(TESLA) + history[-1].token_count * 2
+    packed = pack_context("Where is Tesla headquartered?", [doc(TESLA)], history, budget=budget)
+    assert [d.page_content for d in packed.passages] == [TESLA]
+    assert packed.conversation == "User: earlier message number 18\nBot: earlier message number 19"
+    assert packed.tokens <= budget
+
+
+def test_long_documents_are_cut_to_passage_limit():
+    packed = pack_context("Tesla", [doc(TESLA * 50)], ChatHistory(), max_passage_tokens=20)
+    assert count_tokens(packed.content) <= 20
@@ -0,0 +1,122 @@
+# test_deadline.py
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import src.graph.nodes as nodes
+from src.graph.backends import Backends
+from src.graph.deadline import (
+    RESERVE_SECONDS,
+    budget_low,
+    call_timeout,
+    new_deadline,
+    remaining_seconds,
+    run_all_with_timeout,
+    run_with_timeout,
+    with_deadline,
+)
+from src.graph.entities import EntityIndex
+from src.graph.graph import build_workflow
+from src.graph.rate_limit import DeadlineExceeded, current_deadline
+from test_backends import FakeWebSearch, FakeWikipedia, SilentLogger
+
+
+class TimedOutLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        raise DeadlineExceeded("Retry budget spent")
+
+
+def test_no_deadline_means_unbounded():
+    state = {"session_id": "test-session"}
+    assert remaining_seconds(state) is None
+    assert budget_low(state) is False
+    assert call_timeout(state, 0.5) is None
+
+
+def test_budget_low_near_deadline():
+    assert budget_low({"deadline": new_deadline(RESERVE_SECONDS / 2)}) is True
+    assert budget_low({"deadline": new_deadline(RESERVE_SECONDS + 30)}) is False
+
+
+def test_call_timeout_is_proportional_to_spendable_budget():
+    timeout = call_timeout({"deadline": new_deadline(RESERVE_SECONDS + 10)}, 0.5)
+    assert timeout == pytest.approx(5.0, abs=0.1)
+
+
+def test_run_with_timeout_returns_result():
+    assert run_with_timeout(lambda x: x * 2, 21, timeout=1.0) == 42
+
+
+def test_run_with_timeout_raises_on_slow_call():
+    with pytest.raises(DeadlineExceeded):
+        run_with_timeout(time.sleep, 0.5, timeout=0.05)
+
+
+def test_run_all_with_timeout_runs_concurrently():
+    def fail():
+        raise ValueError("boom")
+
+    started = time.monotonic()
+    outcomes = run_all_with_timeout([lambda: time.sleep(0.2) or "a", lambda: time.sleep(0.2) or "b", fail,
+                                     lambda: time.sleep(2)], timeout=0.5)
+    assert time.monotonic() - started < 1.0
+    assert outcomes[:2] == ["a", "b"]
+    assert isinstance(outcomes[2], ValueError)
+    assert isinstance(outcomes[3], DeadlineExceeded)
+
+
+def test_with_deadline_sets_scope_for_node():
+    seen = {}
+
+    @with_deadline
+    def node(state):
+        seen["deadline"] = current_deadline()
+        seen["worker_deadline"] = run_with_timeout(current_deadline, timeout=1.0)
+        seen["long_call_deadline"] = run_with_timeout(current_deadline, timeout=60.0)
+        return {}
+
+    node({"deadline": new_deadline(20)})
+    assert seen["deadline"] == pytest.approx(time.monotonic() + 20, abs=1.0)
+    # The worker runs under the call's own timeout, never past the run deadline
+    assert seen["worker_deadline"] == pytest.approx(time.monotonic() + 1, abs=0.5)
+    assert seen["long_call_deadline"] == seen["deadline"]
+    assert current_deadline() is None
+
+
+@pytest.fixture
+def timed_out_backends():
+    return Backends(llm=TimedOutLLM(), wikipedia=FakeWikipedia(["Tesla HQ is in Austin"]),
+                    web_search=FakeWebSearch([]), logger=SilentLogger, entities=EntityIndex())
+
+
+@pytest.mark.parametrize("node, extra, expected", [
+    (nodes.detect_ambiguity, {}, {"needs_clarification": False}),
+    (nodes.clarify_question, {}, {"clarified_question": None, "needs_clarification": False}),
+    (nodes.process_clarification, {"clarified_question": "Which Tesla?"},
+     {"clarified_question": "Where is Tesla?", "needs_clarification": False}),
+    (nodes.process_clarification, {"clarification_answer": "the company"},
+     {"clarified_question": "Where is Tesla? (the company)", "needs_clarification": False}),
+    (nodes.transform_query, {}, {}),
+    (nodes.expand_query, {}, {"query_variants": ["Where is Tesla?"]}),
+    (nodes.grade_wikipedia, {"wikipedia_docs": [Document(page_content="Tesla HQ is in Austin")]},
+     {"wikipedia_sufficient": True}),
+])
+def test_llm_nodes_fall_back_when_the_deadline_is_hit(timed_out_backends, node, extra, expected):
+    state = {"chat_history": [], "original_question": "Where is Tesla?", "session_id": "test-session",
+             "deadline": new_deadline(RESERVE_SECONDS + 30), **extra}
+    assert node(state, timed_out_backends) == expected
+    assert timed_out_backends.llm.calls == 1
+
+
+def test_workflow_answers_when_every_llm_call_hits_the_deadline(timed_out_backends):
+    state = {"chat_history": [], "original_question": "Where is Tesla?", "clarified_question": None,
+             "wikipedia_docs": [], "web_docs": [], "reranked_docs": [], "final_answer": None,
+             "needs_clarification": False, "session_id": "test-session",
+             "deadline": new_deadline(RESERVE_SECONDS + 30)}
+    result = build_workflow(timed_out_backends, query_variants=3).compile().invoke(state)
+    assert result["final_answer"].startswith("Tesla HQ is in Austin")
@@ -0,0 +1,119 @@
+# test_entities.py
+import bz2
+
+import src.graph.nodes as nodes
+from src.graph.backends import Backends
+from src.graph.clarity import ClarityClassifier
+from src.graph.entities import ENTITY_INDEX_PATH, EntityIndex, build_entities, iter_dump_pages, save_entities
+from src.graph.history import ChatHistory, Sender
+from test_backends import FakeLLM, SilentLogger
+
+TESLA_PAGE = """'''Tesla''' most commonly refers to:
+* [[Nikola Tesla]] (1856–1943), Serbian-American inventor
+* [[Tesla, Inc.]], an American electric vehicle company
+
+'''Tesla''' may also refer to:
+== Science ==
+* [[Tesla (unit)]], the [[SI]] unit of magnetic flux density{{citation needed}}
+** [[Tesla coil]], a resonant transformer
+* ''[[Tesla (2020 film)|Tesla]]'' (2020), a biographical film
+== See also ==
+* [[Tesla coil]]
+{{disambiguation}}
+"""
+
+DUMP = f"""<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+  <page><title>Tesla (disambiguation)</title><ns>0</ns><revision><text>{TESLA_PAGE}</text></revision></page>
+  <page><title>Nikola Tesla</title><ns>0</ns><revision><text>An inventor.</text></revision></page>
+  <page><title>Template:Tesla</title><ns>10</ns><revision><text>{{{{disambiguation}}}}</text></revision></page>
+</mediawiki>
+"""
+
+
+def test_build_from_dump(tmp_path):
+    path = tmp_path / "pages.xml.bz2"
+    path.write_bytes(bz2.compress(DUMP.encode()))
+    entities = build_entities(iter_dump_pages(str(path)))
+    assert entities == {"tesla": [
+        ("Nikola Tesla", "(1856–1943), Serbian-American inventor"),
+        ("Tesla, Inc.", "an American electric vehicle company"),
+        ("Tesla (unit)", "the SI unit of magnetic flux density"),
+        ("Tesla (2020 film)", "(2020), a biographical film"),
+    ]}
+    assert build_entities(iter_dump_pages(str(path)), names=["Midas"]) == {}
+
+    save_entities(entities, str(tmp_path / "entities.json"))
+    index = EntityIndex(path=str(tmp_path / "entities.json"))
+    assert [title for title, _ in index.candidates("TESLA")][:2] == ["Nikola Tesla", "Tesla, Inc."]
+
+
+def test_find_matches_the_longest_known_name():
+    index = EntityIndex({"Jordan": [("Jordan", "country"), ("Jordan River", "river")],
+                         "Michael Jordan": [("Michael Jordan", "basketball player"),
+                                            ("Michael B. Jordan", "actor")],
+                         "Mercury": [("Mercury (planet)", "planet"), ("Mercury (element)", "element")]})
+    assert index.find("Who is michael jordan?")[0] == "michael jordan"
+    assert index.find("Where is Jordan?")[1][0] == ("Jordan", "country")
+    # Two different entities are left to the LLM, and so are questions without one
+    assert index.find("Is Mercury bigger than Jordan?") is None
+    assert index.find("What is the capital of France?") is None
+
+
+def test_clarification_lists_the_meanings():
+    index = EntityIndex({"Tesla": [("Nikola Tesla", "inventor"), ("Tesla, Inc.", "car maker"), ("Tesla (unit)", "")]},
+                        max_options=2)
+    assert index.clarification("Where is Tesla?") == (
+        'Which "Tesla" do you mean?\n'
+        "- Nikola Tesla: inventor\n"
+        "- Tesla, Inc.: car maker\n"
+        "- Something else (please describe it)"
+    )
+    assert index.clarification("What about it?") is None
+    assert index.metrics() == {"entities": 1, "lookups": 2, "answered_locally": 1, "llm_path": 1}
+
+
+def test_meaning_settled_by_the_question_or_the_conversation_is_not_asked():
+    index = EntityIndex(path=ENTITY_INDEX_PATH)
+    for question in ("What was Apple Inc. revenue last year?", "How hot is the planet Mercury?",
+                     "When did Freddie Mercury die?", "Which country borders Georgia to the south?"):
+        assert index.clarification(question) is None, question
+    assert index.clarification("Where is Tesla?", "User: I'm reading about Tesla, Inc. stock") is None
+    # Naming several meanings, as an earlier clarification question does, settles nothing
+    asked = index.clarification("Where is Tesla?")
+    assert index.clarification("Where is Tesla?", asked) == asked
+    assert index.clarification("Where is Tesla?", "User: What is the capital of France?") == asked
+
+
+def test_shipped_index_knows_common_ambiguous_entities():
+    index = EntityIndex(path=ENTITY_INDEX_PATH)
+    for question in ("Where is Tesla?", "Tell me about Mercury", "What is Java?", "Tell me about Jaguar"):
+        assert index.find(question) is not None
+
+
+def test_clarify_question_skips_the_llm_for_known_entities():
+    llm = FakeLLM("- Did you mean the company?\n- Or the inventor?")
+    index = EntityIndex({"Tesla": [("Nikola Tesla", "inventor"), ("Tesla, Inc.", "car maker")]})
+    backends = Backends(llms={"clarify": llm}, logger=SilentLogger, entities=index)
+    state = {"chat_history": [], "original_question": "Where is Tesla?", "session_id": "s"}
+    result = nodes.clarify_question(state, backends)
+    assert result["needs_clarification"] and "- Tesla, Inc.: car maker" in result["clarified_question"]
+    assert llm.prompts == []
+
+    state["original_question"] = "Where is Midas?"
+    assert nodes.clarify_question(state, backends)["clarified_question"] == llm.content
+    assert len(llm.prompts) == 1
+
+
+def test_ambiguity_check_uses_the_conversation_to_settle_the_meaning():
+    index = EntityIndex({"Tesla": [("Nikola Tesla", "inventor"), ("Tesla, Inc.", "car maker")]})
+    llm = FakeLLM("yes")
+    backends = Backends(llms={"detect_ambiguity": llm}, logger=SilentLogger, entities=index,
+                        clarity=ClarityClassifier(threshold=0.0))
+    history = ChatHistory()
+    history.append(Sender.USER, "How many cars did Tesla, Inc. sell?")
+    history.append(Sender.BOT, "About 1.8 million.")
+    state = {"chat_history": history, "original_question": "Where is Tesla based?", "session_id": "s"}
+    # The earlier turn settled which Tesla, so the local check may answer and no options are listed
+    assert nodes.detect_ambiguity(state, backends) == {"needs_clarification": False}
+    assert llm.prompts == []
+    assert index.clarification(state["original_question"], nodes._entity_context(state)) is None
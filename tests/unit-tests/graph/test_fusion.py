@@ -0,0 +1,99 @@
+# test_fusion.py
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import src.graph.nodes as nodes
+from src.graph.backends import Backends
+from src.graph.fusion import content_hash, parse_variants, reciprocal_rank_fusion
+from src.graph.graph import build_workflow
+from test_backends import FakeLLM, FakeWebSearch, SilentLogger
+
+
+class SlowWikipedia:
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.queries = []
+
+    def run(self, query):
+        self.queries.append(query)
+        time.sleep(self.delay)
+        if "broken" in query:
+            raise ConnectionError("lookup failed")
+        return [f"Page: Tesla\nSummary: Tesla HQ is in Austin. Looked up for {query.split(':')[-1]}",
+                "Page: Tesla, Inc.\nSummary: Tesla, Inc. is an American automaker."]
+
+
+class FakeLocal:
+    def invoke(self, query):
+        return [Document(page_content="Internal note: Tesla Austin Gigafactory", metadata={"source": "notes.pdf"})]
+
+
+def doc(text):
+    return Document(page_content=text)
+
+
+@pytest.fixture
+def state():
+    return {
+        "chat_history": [],
+        "original_question": "Where is Tesla HQ?",
+        "clarified_question": None,
+        "query_variants": ["Where is Tesla HQ?", "Tesla headquarters location", "broken variant"],
+        "session_id": "test-session",
+    }
+
+
+def test_parse_variants_strips_markers_and_duplicates():
+    text = "1. Tesla headquarters location\n- where is tesla hq\n\n* \"Tesla Inc head office\"\nExtra"
+    assert parse_variants(text, "Where is Tesla HQ?", 3) == [
+        "Where is Tesla HQ?", "Tesla headquarters location", "Tesla Inc head office"]
+
+
+def test_rrf_rewards_documents_found_by_several_lookups():
+    fused = reciprocal_rank_fusion([[doc("A"), doc("B")], [doc("C"), doc("b ")], [doc("B"), doc("A")]])
+    assert [d.page_content for d in fused] == ["B", "A", "C"]
+    assert len({content_hash(d) for d in fused}) == 3
+
+
+def test_variants_are_retrieved_concurrently_and_fused(state):
+    wikipedia = SlowWikipedia()
+    backends = Backends(wikipedia=wikipedia, local=FakeLocal(), logger=SilentLogger)
+    started = time.monotonic()
+    result = nodes.retrieve_wikipedia(state, backends)
+    assert time.monotonic() - started < 0.5
+    assert len(wikipedia.queries) == 3
+    sources = {d.metadata["source"] for d in result["wikipedia_docs"]}
+    assert sources == {"Wikipedia", "notes.pdf"}
+    # The shared page is kept once; the failing variant is logged and skipped
+    assert sum("American automaker" in d.page_content for d in result["wikipedia_docs"]) == 1
+    assert any("1 of 6 lookup(s) failed" in message for _, message in SilentLogger.messages)
+
+
+def test_expand_query_generates_variants_in_one_call(state):
+    llm = FakeLLM("Tesla headquarters location\nTesla Inc head office\nTesla main office")
+    backends = Backends(llms={"expand": llm}, logger=SilentLogger)
+    result = nodes.expand_query(state, backends, variants=3)
+    assert result["query_variants"] == ["Where is Tesla HQ?", "Tesla headquarters location", "Tesla Inc head office"]
+    assert len(llm.prompts) == 1
+
+
+def test_multi_query_workflow(state):
+    wikipedia = SlowWikipedia(delay=0)
+    backends = Backends(
+        llms={
+            "detect_ambiguity": FakeLLM("no"),
+            "expand": FakeLLM("Tesla headquarters location"),
+            "grade": FakeLLM("yes"),
+            "generate": FakeLLM("Tesla HQ is in Austin (Wikipedia)"),
+        },
+        wikipedia=wikipedia,
+        web_search=FakeWebSearch([]),
+        logger=SilentLogger,
+    )
+    del state["query_variants"]
+    result = build_workflow(backends, query_variants=2).compile().invoke(state)
+    assert result["query_variants"] == ["Where is Tesla HQ?", "Tesla headquarters location"]
+    assert len(wikipedia.queries) == 2
+    assert result["final_answer"] == "Tesla HQ is in Austin (Wikipedia)"
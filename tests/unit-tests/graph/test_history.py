@@ -0,0 +1,59 @@
+# test_history.py
+import pytest
+
+from src.graph.history import ChatHistory, Sender, Turn, conversation_text
+from src.graph.tokens import count_tokens
+
+
+def test_turn_uses_slots_and_shared_sender():
+    first = Turn("User", "Where is Tesla?")
+    second = Turn(Sender.USER, "And Midas?")
+    assert not hasattr(first, "__dict__")
+    assert first.sender is second.sender is Sender.USER
+
+
+def test_turn_token_count_is_cached(monkeypatch):
+    turn = Turn(Sender.BOT, "Tesla HQ is in Austin")
+    expected = count_tokens("Bot: Tesla HQ is in Austin")
+    assert turn.token_count == expected
+    monkeypatch.setattr("src.graph.history.count_tokens", lambda text: pytest.fail("recounted"))
+    assert turn.token_count == expected
+
+
+def test_turn_round_trips_through_dict():
+    turn = Turn(Sender.USER, "hello", timestamp=123.0)
+    assert turn.to_dict() == {"sender": "User", "message": "hello", "timestamp": 123.0}
+    assert Turn.from_dict(turn.to_dict()) == turn
+
+
+def test_tail_respects_token_budget():
+    history = ChatHistory()
+    for i in range(10):
+        history.append(Sender.USER if i % 2 == 0 else Sender.BOT, f"message number {i}")
+    per_turn = history[0].token_count
+    tail = history.tail(max_tokens=per_turn * 3)
+    assert [turn.message for turn in tail] == ["message number 7", "message number 8", "message number 9"]
+    assert [turn.message for turn in history.tail(max_turns=2)] == ["message number 8", "message number 9"]
+
+
+def test_render_keeps_most_recent_turns():
+    history = ChatHistory()
+    history.append(Sender.USER, "old question " * 50)
+    history.append(Sender.USER, "Where is Tesla?")
+    history.append(Sender.BOT, "Which Tesla do you mean?")
+    assert history.render(max_tokens=20) == "User: Where is Tesla?\nBot: Which Tesla do you mean?"
+
+
+def test_coerce_accepts_legacy_dicts():
+    history = ChatHistory.coerce([{"sender": "User", "message": "hi"}, {"sender": "Bot", "message": "hello"}])
+    assert len(history) == 2
+    assert history[1].sender is Sender.BOT
+    assert ChatHistory.coerce(history) is history
+    assert len(ChatHistory.coerce(None)) == 0
+
+
+def test_conversation_text_from_state():
+    history = ChatHistory()
+    history.append(Sender.USER, "Where is Tesla?")
+    assert conversation_text({"chat_history": history}) == "User: Where is Tesla?"
+    assert conversation_text({}) == ""
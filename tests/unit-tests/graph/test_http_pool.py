@@ -0,0 +1,103 @@
+# test_http_pool.py
+import json
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.graph.deadline import run_all_with_timeout, run_with_timeout
+from src.graph.http_pool import PooledHttpClient, route_requests
+from src.graph.nodes import _wikipedia_documents
+from src.graph.rate_limit import DeadlineExceeded, deadline_scope
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_connections_are_reused(server):
+    client = PooledHttpClient(pool_size=2, timeout=5, http2=False)
+    for i in range(5):
+        assert client.get(f"{server}/item/{i}") == {"path": f"/item/{i}"}
+    metrics = client.metrics()
+    assert metrics["requests_total"] == 5
+    assert metrics["connections_opened"] == 1
+    assert metrics["connections_reused"] == 4
+    client.close()
+
+
+def test_timeout_is_cut_to_the_deadline():
+    client = PooledHttpClient(pool_size=1, timeout=10, http2=False)
+    assert client._timeout(None) == 10
+    with deadline_scope(time.monotonic() + 2):
+        assert 0 < client._timeout(None) <= 2
+        assert client._timeout(1) == 1
+    with deadline_scope(time.monotonic() - 1):
+        with pytest.raises(DeadlineExceeded):
+            client.get("http://127.0.0.1:9/unreachable")
+    assert client.metrics()["requests_total"] == 0
+    client.close()
+
+
+def test_run_with_timeout_bounds_the_pooled_request(server):
+    client = PooledHttpClient(pool_size=1, timeout=10, http2=False)
+    seen = []
+    original = client._client.request
+
+    def spy(method, url, **kwargs):
+        seen.append(kwargs["timeout"])
+        return original(method, url, **kwargs)
+    client._client.request = spy
+    assert run_with_timeout(client.get, f"{server}/item/1", timeout=0.5) == {"path": "/item/1"}
+    assert run_all_with_timeout([lambda: client.get(f"{server}/item/2")], timeout=0.5) == [{"path": "/item/2"}]
+    assert len(seen) == 2 and all(0 < t <= 0.5 for t in seen)
+    client.close()
+
+
+def test_library_requests_calls_go_over_the_pool(server):
+    module = types.ModuleType("fake_tool_module")
+    module.requests = None
+    sys.modules["fake_tool_module"] = module
+    client = PooledHttpClient(pool_size=1, timeout=5, http2=False)
+    try:
+        route_requests("fake_tool_module", client)
+        response = module.requests.get(f"{server}/item/1", params={"q": "x"})
+        response.raise_for_status()
+        assert response.json() == {"path": "/item/1?q=x"}
+        assert client.metrics()["requests_total"] == 1
+    finally:
+        del sys.modules["fake_tool_module"]
+        client.close()
+
+
+def test_wikipedia_wrapper_output_is_split_per_page():
+    joined = "Page: Nikola Tesla\nSummary: An inventor.\n\nPage: Tesla, Inc.\nSummary: An automaker."
+    docs = _wikipedia_documents(joined)
+    assert [d.page_content for d in docs] == [
+        "Page: Nikola Tesla\nSummary: An inventor.",
+        "Page: Tesla, Inc.\nSummary: An automaker.",
+    ]
+    assert _wikipedia_documents("No good Wikipedia Search Result was found") == []
@@ -0,0 +1,47 @@
+# test_lazy_imports.py
+import subprocess
+import sys
+
+from src.serving.startup import StartupProfiler, parse_importtime
+
+
+def imported_modules_after(statement):
+    code = f"import sys; {statement}; print('\\n'.join(sys.modules))"
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return set(completed.stdout.split())
+
+
+def test_importing_nodes_does_not_load_openai():
+    modules = imported_modules_after("import src.graph.nodes")
+    assert "langchain_openai" not in modules
+    assert "openai" not in modules
+
+
+def test_importing_serve_does_not_compile_graph():
+    modules = imported_modules_after("import serve")
+    assert "langgraph.graph" not in modules
+    assert "langchain_openai" not in modules
+
+
+def test_parse_importtime():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:       300 |        420 | json\n"
+    )
+    assert parse_importtime(output) == [("json.decoder", 120, 120), ("json", 300, 420)]
+
+
+def test_startup_profiler_records_phases():
+    profiler = StartupProfiler()
+    with profiler.phase("compile_graph"):
+        pass
+    report = profiler.report()
+    assert "compile_graph" in report["phases_ms"]
+    assert report["since_start_ms"] >= report["phases_ms"]["compile_graph"]
+
+
+def test_importing_ingestion_does_not_load_graph_config():
+    modules = imported_modules_after("import src.ingestion.ingestion")
+    assert "src.graph.config" not in modules
+    assert "src.graph.backends" not in modules
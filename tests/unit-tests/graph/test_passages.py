@@ -0,0 +1,39 @@
+# test_passages.py
+from langchain_core.documents import Document
+
+from src.graph.passages import best_passages, rank_passages, split_passages
+from src.graph.tokens import count_tokens
+
+PAGE = "\n\n".join([
+    "Tesla, Inc. is an American electric vehicle and clean energy company. " * 12,
+    "The company moved its headquarters from Palo Alto to Austin, Texas in 2021. " * 12,
+    "Tesla sells solar panels and battery storage products. " * 12,
+])
+
+
+def test_split_passages_respects_chunk_size_and_metadata():
+    passages = split_passages([Document(page_content=PAGE, metadata={"source": "Wikipedia"})])
+    assert len(passages) >= 3
+    assert all(count_tokens(p.page_content) <= 250 for p in passages)
+    assert all(p.metadata == {"source": "Wikipedia"} for p in passages)
+
+
+def test_rank_passages_puts_best_match_first():
+    passages = [Document(page_content=text) for text in (
+        "Tesla sells solar panels.",
+        "Tesla moved its headquarters to Austin, Texas.",
+        "Nikola Tesla was an inventor.",
+    )]
+    ranked = rank_passages("Where are the Tesla headquarters?", passages, k=2)
+    assert ranked[0].page_content == "Tesla moved its headquarters to Austin, Texas."
+    assert len(ranked) == 2
+
+
+def test_rank_passages_keeps_order_without_signal():
+    passages = [Document(page_content=f"Doc {name}") for name in "ABC"]
+    assert [p.page_content for p in rank_passages("the", passages, k=3)] == ["Doc A", "Doc B", "Doc C"]
+
+
+def test_best_passages_keeps_relevant_part_of_long_page():
+    best = best_passages("Where is the headquarters?", [Document(page_content=PAGE)], k=1)
+    assert "headquarters" in best[0].page_content
@@ -0,0 +1,112 @@
+# test_rate_limit.py
+import time
+
+import pytest
+
+import src.graph.rate_limit as rate_limit
+from src.graph.rate_limit import (
+    DeadlineExceeded,
+    RateLimitedClient,
+    RateLimiter,
+    RetryPolicy,
+    TokenBucket,
+    call_with_retry,
+    deadline_scope,
+    is_retryable,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_token_bucket_waits_once_burst_is_spent():
+    bucket = TokenBucket(per_minute=60, burst=2)
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_refuses_wait_past_deadline():
+    bucket = TokenBucket(per_minute=60, burst=1)
+    bucket.reserve(1)
+    with pytest.raises(DeadlineExceeded):
+        bucket.reserve(1, deadline=time.monotonic() + 0.1)
+
+
+def test_is_retryable_status_codes():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ValueError())
+
+
+def test_call_with_retry_recovers_from_rate_limit(no_sleep):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise StatusError(429)
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=4, base_delay=0.1, max_delay=1.0, max_elapsed=None)
+    assert call_with_retry(flaky, policy=policy) == "ok"
+    assert len(calls) == 3
+    assert len(no_sleep) == 2
+    assert all(0 <= delay <= 1.0 for delay in no_sleep)
+
+
+def test_call_with_retry_does_not_retry_client_errors():
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        call_with_retry(bad_request, policy=RetryPolicy(max_attempts=4))
+    assert len(calls) == 1
+
+
+def test_call_with_retry_respects_request_deadline():
+    def always_failing():
+        raise StatusError(500)
+
+    policy = RetryPolicy(max_attempts=10, base_delay=5.0, max_delay=5.0, max_elapsed=None)
+    policy.backoff = lambda attempt: 5.0
+    with deadline_scope(time.monotonic() + 1.0):
+        with pytest.raises(DeadlineExceeded):
+            call_with_retry(always_failing, policy=policy)
+
+
+def test_rate_limited_client_delegates():
+    class Client:
+        name = "dummy"
+
+        def invoke(self, prompt):
+            return prompt.upper()
+
+    client = RateLimitedClient(Client(), RateLimiter("test", requests_per_minute=600, tokens_per_minute=6000),
+                               token_estimator=lambda prompt: 10)
+    assert client.invoke("hello") == "HELLO"
+    assert client.name == "dummy"
+
+
+def test_limiter_refunds_the_request_when_the_token_wait_is_too_long():
+    limiter = RateLimiter("test", requests_per_minute=60, tokens_per_minute=60)
+    limiter.tokens.reserve(60)
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(tokens=30, deadline=time.monotonic() + 0.1)
+    # The request slot taken before the token bucket gave up is back
+    assert limiter.requests.reserve(60) == pytest.approx(0, abs=0.05)
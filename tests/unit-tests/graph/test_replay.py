@@ -0,0 +1,141 @@
+# test_replay.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import serve
+from src.graph.backends import Backends
+from src.graph.recording import Recorder, load_traces
+from src.graph.replay import ReplayMiss, TraceCalls, replay, replay_trace
+from src.graph.routing import SourceRouter
+from src.serving.refresh import HotQuestions
+from src.serving.result_cache import ResultCache
+from src.serving.sessions import SessionStore
+from test_backends import FakeWikipedia, make_backends
+
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.jsonl.gz")
+    monkeypatch.setenv("WARM_UP_CLIENTS", "0")
+    monkeypatch.setattr(serve, "backends", make_backends(grade="no", web_results=[
+        {"content": "Tesla moved its HQ to Austin", "url": "http://example.com/a"},
+        {"content": "Tesla builds cars", "url": "http://example.com/b"},
+    ]))
+    monkeypatch.setattr(serve, "chain_apps", None)
+    monkeypatch.setattr(serve, "profile_backends", {})
+    monkeypatch.setattr(serve, "open_checkpointer", lambda: None)
+    monkeypatch.setattr(serve, "chat_histories", SessionStore())
+    monkeypatch.setattr(serve, "hot_questions", HotQuestions())
+    monkeypatch.setattr(serve, "result_cache", ResultCache())
+    monkeypatch.setattr(serve, "recorder", Recorder(path))
+    with TestClient(serve.app) as client:
+        for message in ("Where is Tesla HQ?", "Where is Tesla HQ?", "And who founded Tesla?"):
+            assert client.post("/chat", data={"user_message": message, "session_id": "s1"}).status_code == 200
+    return path
+
+
+def test_record_mode_writes_inputs_calls_and_timings(recording):
+    traces = list(load_traces(recording))
+    assert len(traces) == 3
+    first = traces[0]
+    assert first["inputs"]["user_message"] == "Where is Tesla HQ?"
+    assert first["result"]["final_answer"] == "Tesla HQ is in Austin (Wikipedia)"
+    assert first["result"]["first_source"] == "wikipedia"
+    kinds = {(call["kind"], call["name"]) for call in first["calls"]}
+    assert {("retrieval", "wikipedia"), ("llm", "grade"), ("retrieval", "web_search"), ("llm", "generate")} <= kinds
+    assert all(call["seconds"] >= 0 and call["offset"] >= 0 for call in first["calls"])
+    # The retry was answered from the result cache; the follow-up carries the earlier turns
+    assert traces[1]["result"]["cached"] and traces[1]["calls"] == []
+    assert len(traces[2]["inputs"]["chat_history"]) == 4
+
+
+def test_replay_reproduces_recorded_answers(recording):
+    report = replay(recording, latency_scale=0)
+    summary = report["summary"]
+    assert summary["replayed"] == 2 and summary["skipped"] == 1
+    assert summary["answer_match_rate"] == 1.0
+    assert summary["missed_calls"] == 0 and summary["errors"] == 0
+
+
+def test_replay_pins_the_recorded_first_source(recording):
+    # A router that has since learned to send every question to web search first
+    web_first = Backends(router=SourceRouter(threshold=1.01, explore_rate=0))
+    report = replay(recording, latency_scale=0, base=web_first)
+    assert report["summary"]["missed_calls"] == 0 and report["summary"]["errors"] == 0
+    assert report["summary"]["answer_match_rate"] == 1.0
+    # The recorded runs started from Wikipedia; the live router was never asked
+    assert web_first.router.metrics()["skipped_wikipedia_legs"] == 0
+
+
+class GatedWikipedia(FakeWikipedia):
+    """
+    Holds each lookup until a second one arrives (or a second passes), so two runs are in flight together.
+    """
+    def __init__(self, results):
+        super().__init__(results)
+        self.both_arrived = threading.Barrier(2, timeout=1.0)
+
+    def run(self, query):
+        try:
+            self.both_arrived.wait()
+        except threading.BrokenBarrierError:
+            pass
+        return super().run(query)
+
+
+def test_concurrent_identical_requests_are_each_replayable(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.jsonl.gz")
+    backends = make_backends()
+    backends._wikipedia = GatedWikipedia(["Tesla HQ is in Austin"])
+    monkeypatch.setenv("WARM_UP_CLIENTS", "0")
+    monkeypatch.setattr(serve, "backends", backends)
+    monkeypatch.setattr(serve, "chain_apps", None)
+    monkeypatch.setattr(serve, "profile_backends", {})
+    monkeypatch.setattr(serve, "open_checkpointer", lambda: None)
+    monkeypatch.setattr(serve, "chat_histories", SessionStore())
+    monkeypatch.setattr(serve, "hot_questions", HotQuestions())
+    monkeypatch.setattr(serve, "result_cache", ResultCache())
+    monkeypatch.setattr(serve, "recorder", Recorder(path))
+    with TestClient(serve.app) as client:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            responses = list(pool.map(
+                lambda session_id: client.post("/chat", data={"user_message": "Where is Tesla HQ?",
+                                                              "session_id": session_id}),
+                ["s1", "s2"]))
+    assert all(response.status_code == 200 for response in responses)
+    print("DEBUG", {k: (v.retrieval_flight.metrics(), v.answer_flight.metrics()) for k, v in serve.profile_backends.items()})
+    print("DEBUG", [[(c["kind"], c["name"]) for c in t["calls"]] for t in load_traces(path)])
+
+    traces = list(load_traces(path))
+    assert len(traces) == 2
+    for trace in traces:
+        assert ("retrieval", "wikipedia") in {(call["kind"], call["name"]) for call in trace["calls"]}
+        assert ("llm", "generate") in {(call["kind"], call["name"]) for call in trace["calls"]}
+    report = replay(path, latency_scale=0)
+    assert report["summary"]["replayed"] == 2
+    assert report["summary"]["missed_calls"] == 0 and report["summary"]["errors"] == 0
+    assert report["summary"]["answer_match_rate"] == 1.0
+
+
+def test_replay_scales_recorded_latency(recording):
+    trace = next(load_traces(recording))
+    for call in trace["calls"]:
+        call["seconds"] = 0.05
+    result = replay_trace(trace, latency_scale=2.0)
+    assert result["replayed_seconds"] >= 0.1 * len(trace["calls"]) * 0.9
+    assert result["answer_matches"]
+
+
+def test_trace_calls_fall_back_to_recorded_order():
+    calls = TraceCalls([
+        {"kind": "llm", "name": "grade", "input": "old prompt A", "output": "yes", "error": None, "seconds": 0},
+        {"kind": "llm", "name": "grade", "input": "prompt B", "output": "no", "error": None, "seconds": 0},
+    ])
+    assert calls.take("llm", "grade", "prompt B")["output"] == "no"
+    assert calls.take("llm", "grade", "new prompt A")["output"] == "yes"
+    assert calls.inexact == 1
+    with pytest.raises(ReplayMiss):
+        calls.take("llm", "grade", "prompt B")
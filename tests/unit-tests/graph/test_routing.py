@@ -0,0 +1,103 @@
+# test_routing.py
+import datetime
+import random
+
+from src.graph.graph import build_workflow
+from src.graph.routing import SourceRouter, query_features
+from test_backends import make_backends
+
+
+def state(question):
+    return {
+        "chat_history": [],
+        "original_question": question,
+        "clarified_question": None,
+        "query_variants": [],
+        "wikipedia_docs": [],
+        "wikipedia_sufficient": None,
+        "web_docs": [],
+        "reranked_docs": [],
+        "final_answer": None,
+        "needs_clarification": False,
+        "clarification_answer": None,
+        "first_source": None,
+        "routed_at": None,
+        "session_id": "test-session",
+    }
+
+
+def test_query_features():
+    today = datetime.date(2026, 10, 19)
+    features = query_features("Who won the league match yesterday?", today)
+    assert (features.recent, features.kind, features.topic) == (True, "who", "sports")
+    assert query_features("What was the GDP of France in 2025?", today).recent
+    assert not query_features("What was the GDP of France in 1990?", today).recent
+    timeless = query_features("Where is the Eiffel Tower?", today)
+    assert timeless.pattern == "timeless|where|general"
+    assert not query_features("Is this building tall?", today).recent
+
+
+def test_timeless_questions_with_ambiguous_recency_words():
+    today = datetime.date(2026, 10, 19)
+    for question in ("Where do penguins live?", "What is an electric current?", "How does the Model T engine work?",
+                     "How do glaciers move now and then?"):
+        features = query_features(question, today)
+        assert not features.recent, question
+        assert features.topic == "general", question
+    assert query_features("Who is the current president of France?", today).recent
+    assert query_features("What is the score right now?", today).recent
+
+
+def test_recent_questions_go_to_web_first():
+    router = SourceRouter(explore_rate=0)
+    assert router.route("What is the latest news about Tesla today?") == "web"
+    assert router.route("Where is the Eiffel Tower?") == "wikipedia"
+
+
+def test_router_learns_from_grading_outcomes():
+    router = SourceRouter(explore_rate=0)
+    question = "What is the price of bitcoin?"
+    assert router.route(question) == "wikipedia"
+    for _ in range(3):
+        router.record(question, sufficient=False, leg_seconds=2.0)
+    assert router.route("What is the price of gold?") == "web"
+    # Outcomes of other patterns do not move this one
+    assert router.route("Where is the Eiffel Tower?") == "wikipedia"
+    metrics = router.metrics()
+    assert metrics["wasted_wikipedia_legs"] == 3 and metrics["wasted_leg_rate"] == 1.0
+    assert metrics["skipped_wikipedia_legs"] == 1
+    assert metrics["estimated_seconds_saved"] == 2.0
+
+
+def test_exploration_keeps_sampling_wikipedia():
+    router = SourceRouter(explore_rate=0.5, rng=random.Random(0))
+    sources = [router.route("Who won the game tonight?") for _ in range(100)]
+    assert 30 < sources.count("wikipedia") < 70
+    assert router.metrics()["explored"] == sources.count("wikipedia")
+
+
+def test_stats_survive_a_restart(tmp_path):
+    path = str(tmp_path / "routing.json")
+    router = SourceRouter(explore_rate=0, path=path)
+    for _ in range(3):
+        router.record("What is the price of bitcoin?", sufficient=False, leg_seconds=1.0)
+    router.save()
+    restored = SourceRouter(explore_rate=0, path=path)
+    assert restored.route("What is the price of bitcoin?") == "web"
+
+
+def test_graph_skips_wikipedia_leg_for_web_first_questions():
+    backends = make_backends(web_results=[{"content": "Tesla stock closed at 250 dollars today", "url": "http://a"}])
+    result = build_workflow(backends).compile().invoke(state("What is the latest Tesla stock price today?"))
+    assert result["first_source"] == "web"
+    assert backends.wikipedia.queries == []
+    assert backends.llms["grade"].prompts == []
+    assert result["web_docs"][0].page_content == "Tesla stock closed at 250 dollars today"
+
+
+def test_graph_teaches_router_with_grading_outcome():
+    backends = make_backends(grade="no")
+    result = build_workflow(backends).compile().invoke(state("Where is Tesla HQ?"))
+    assert result["first_source"] == "wikipedia" and result["wikipedia_sufficient"] is False
+    metrics = backends.router.metrics()
+    assert metrics["graded_wikipedia_legs"] == 1 and metrics["wasted_wikipedia_legs"] == 1
@@ -0,0 +1,137 @@
+# test_singleflight.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.graph.rate_limit import DeadlineExceeded, deadline_scope
+from src.graph.singleflight import SingleFlight, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  Where is   Tesla HQ? ") == "where is tesla hq"
+    assert normalize_query("where is tesla hq") == normalize_query("Where is Tesla HQ?")
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def slow_lookup():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return ["result"]
+
+    def caller(_):
+        return flight.do("tesla", slow_lookup)
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        first = pool.submit(caller, 0)
+        started.wait()
+        others = [pool.submit(caller, i) for i in range(1, 5)]
+        results = [first.result()] + [f.result() for f in others]
+
+    assert len(calls) == 1
+    assert all(result == ["result"] for result, _ in results)
+    assert sum(shared for _, shared in results) == 4
+    assert flight.metrics() == {"executed_total": 1, "coalesced_total": 4, "follower_timeouts_total": 0,
+                                "in_flight": 0}
+
+
+def test_sequential_calls_are_not_shared():
+    flight = SingleFlight("test")
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+
+
+def test_disabled_flight_runs_every_call():
+    flight = SingleFlight("test", enabled=False)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        started.set()
+        release.wait(1.0)
+        return ["result"]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(flight.do, "tesla", lookup)
+        started.wait()
+        second = pool.submit(flight.do, "tesla", lookup)
+        while len(calls) < 2 and not second.done():
+            time.sleep(0.01)
+        release.set()
+        assert first.result() == second.result() == (["result"], False)
+    assert len(calls) == 2
+    assert flight.metrics()["executed_total"] == 2 and flight.metrics()["coalesced_total"] == 0
+
+
+def test_error_is_propagated_to_followers():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", failing)
+        started.wait()
+        follower = pool.submit(flight.do, "key", failing)
+        with pytest.raises(RuntimeError):
+            leader.result()
+        with pytest.raises(RuntimeError):
+            follower.result()
+
+
+def test_follower_stops_waiting_at_its_own_deadline():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    def follower():
+        with deadline_scope(time.monotonic() + 0.05):
+            return flight.do("key", slow)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", slow)
+        started.wait()
+        waited = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            pool.submit(follower).result()
+        assert time.monotonic() - waited < 1
+        release.set()
+        assert leader.result() == ("late", False)
+    assert flight.metrics()["follower_timeouts_total"] == 1
+
+
+def test_follower_with_time_left_retries_after_leader_deadline():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    def leader_call():
+        started.set()
+        time.sleep(0.05)
+        raise DeadlineExceeded("leader budget spent")
+
+    def follower():
+        with deadline_scope(time.monotonic() + 5):
+            return flight.do("key", lambda: "own result")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", leader_call)
+        started.wait()
+        shared = pool.submit(follower)
+        with pytest.raises(DeadlineExceeded):
+            leader.result()
+        assert shared.result() == ("own result", False)
@@ -0,0 +1,35 @@
+# test_ingestion_settings.py
+import pytest
+
+from src.graph.config import load_config
+from src.ingestion.settings import CHUNK_SIZE, load_ingestion_settings
+
+
+def test_settings_come_from_the_ingestion_section(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("ingestion:\n  chunk_size: 120\n  chunk_overlap: 10\nprofiles:\n  balanced: {}\n")
+    settings = load_ingestion_settings(str(path))
+    assert (settings.chunk_size, settings.chunk_overlap) == (120, 10)
+    assert load_config(str(path)).ingestion == settings
+
+
+def test_settings_are_read_once(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("ingestion:\n  chunk_size: 120\n")
+    first = load_ingestion_settings(str(path))
+    path.write_text("ingestion:\n  chunk_size: 60\n")
+    assert load_ingestion_settings(str(path)) is first
+
+
+def test_missing_file_or_section_uses_defaults(tmp_path):
+    assert load_ingestion_settings(str(tmp_path / "missing.yaml")).chunk_size == CHUNK_SIZE
+    path = tmp_path / "config.yaml"
+    path.write_text("default_profile: balanced\n")
+    assert load_ingestion_settings(str(path)).chunk_size == CHUNK_SIZE
+
+
+def test_invalid_section_is_rejected(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("ingestion:\n  chunk_size: 100\n  chunk_overlap: 100\n")
+    with pytest.raises(ValueError, match="chunk_overlap"):
+        load_ingestion_settings(str(path))
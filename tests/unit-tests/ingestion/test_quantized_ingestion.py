@@ -0,0 +1,98 @@
+# test_quantized_ingestion.py
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.ingestion.quantized_index import QuantizedIndex, open_index, quantize
+from src.ingestion.quantized_ingestion import QuantizedIngestion
+
+
+def random_vectors(n=500, dim=64, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def exact_top_k(vectors, query, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(unit @ (query / np.linalg.norm(query))))[:k])
+
+
+def test_quantize_round_trips_within_one_step():
+    vectors = random_vectors(20)
+    codes, scales = quantize(vectors)
+    assert codes.dtype == np.int8
+    assert np.all(np.abs(codes * scales[:, None] - vectors) <= scales[:, None] / 2 + 1e-6)
+
+
+def test_search_matches_exact_search(tmp_path):
+    vectors = random_vectors()
+    index = QuantizedIndex.build(str(tmp_path / "index"), vectors, [{"page_content": str(i)} for i in range(500)])
+    for query in random_vectors(10, seed=1):
+        hits = index.search(query, k=5, shortlist=50)
+        assert [position for position, _ in hits] == exact_top_k(vectors, query, 5)
+        assert hits[0][1] >= hits[-1][1]
+
+
+def test_index_files_are_memory_mapped_read_only(tmp_path):
+    index = QuantizedIndex.build(str(tmp_path / "index"), random_vectors(10), [{"page_content": "x"}] * 10)
+    for array in (index.codes, index.scales, index.vectors):
+        assert isinstance(array, np.memmap)
+        assert not array.flags.writeable
+    assert index.payload(3) == {"page_content": "x"}
+
+
+def test_rebuild_replaces_index(tmp_path):
+    path = str(tmp_path / "index")
+    QuantizedIndex.build(path, random_vectors(10), [{"page_content": "old"}] * 10)
+    index = QuantizedIndex.build(path, random_vectors(3), [{"page_content": "new"}] * 3)
+    assert len(QuantizedIndex(path)) == 3
+    assert index.payload(0)["page_content"] == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["index"]
+
+
+def test_rebuild_that_dies_mid_swap_keeps_the_old_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    QuantizedIndex.build(path, random_vectors(10), [{"page_content": "old"}] * 10)
+    replace = os.replace
+    calls = []
+
+    def dies_on_second_rename(src, dst):
+        calls.append(src)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", dies_on_second_rename)
+    with pytest.raises(KeyboardInterrupt):
+        QuantizedIndex.build(path, random_vectors(3), [{"page_content": "new"}] * 3)
+    monkeypatch.setattr(os, "replace", replace)
+    assert not os.path.exists(path)
+    index = open_index(path)
+    assert len(index) == 10 and index.payload(0)["page_content"] == "old"
+
+
+def test_ingestion_retrieves_inserted_documents(tmp_path):
+    docs = [Document(page_content=f"Article {i} of the tax law", metadata={"page": i}) for i in range(30)]
+    ingestion = QuantizedIngestion(embeddings=DeterministicFakeEmbedding(size=32), index_dir=str(tmp_path / "q"))
+    retriever = ingestion.insert_documents(docs)
+    # The fake embedding is a hash of the text, so the exact text is the only perfect match
+    assert retriever.invoke("Article 7 of the tax law")[0] == docs[7]
+    reopened = QuantizedIngestion(embeddings=DeterministicFakeEmbedding(size=32), index_dir=str(tmp_path / "q"))
+    assert reopened.retrieve_documents("Article 12 of the tax law")[0].metadata == {"page": 12}
+
+
+def test_from_chroma_converts_collection(tmp_path):
+    import chromadb
+
+    embeddings = DeterministicFakeEmbedding(size=16)
+    texts = [f"Paragraph {i}" for i in range(8)]
+    collection = chromadb.PersistentClient(path=str(tmp_path / "chroma")).create_collection("rag-chroma")
+    collection.add(ids=[str(i) for i in range(8)], documents=texts, embeddings=embeddings.embed_documents(texts),
+                   metadatas=[{"page": i} for i in range(8)])
+    ingestion = QuantizedIngestion.from_chroma(embeddings, persist_directory=str(tmp_path / "chroma"),
+                                               index_dir=str(tmp_path / "q"))
+    assert len(ingestion.index) == 8
+    assert ingestion.retrieve_documents("Paragraph 5")[0] == Document(page_content="Paragraph 5",
+                                                                      metadata={"page": 5})
@@ -0,0 +1,49 @@
+# test_memory.py
+import tracemalloc
+
+from src.graph.history import ChatHistory, Sender
+from src.serving.memory import MemoryProfiler, deep_sizeof, session_memory
+
+
+def history_with(turns):
+    history = ChatHistory()
+    for i in range(turns):
+        history.append(Sender.USER, f"message number {i} " * 10)
+    return history
+
+
+def test_deep_sizeof_follows_slots_and_containers():
+    small, large = history_with(1), history_with(20)
+    assert deep_sizeof(large) > deep_sizeof(small) > deep_sizeof(ChatHistory())
+    shared = "x" * 1000
+    assert deep_sizeof([shared, shared]) < deep_sizeof([shared, "y" * 1000])
+
+
+def test_session_memory_lists_largest_sessions():
+    report = session_memory([("a", history_with(1)), ("b", history_with(10))], top=1)
+    assert report["count"] == 2
+    assert report["largest"] == [{"session_id": "b", "turns": 10, "bytes": deep_sizeof(history_with(10))}]
+    assert report["total_bytes"] > report["largest"][0]["bytes"]
+
+
+def test_disabled_profiler_reports_rss_only():
+    profiler = MemoryProfiler(enabled=False)
+    profiler.start()
+    assert set(profiler.report()) == {"enabled", "rss_bytes"}
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiler_reports_growth_since_baseline():
+    profiler = MemoryProfiler(enabled=True, interval_seconds=3600)
+    profiler.start()
+    try:
+        retained = [bytearray(10_000) for _ in range(100)]
+        profiler.snapshot()
+        report = profiler.report(top=5)
+    finally:
+        profiler.stop()
+    assert not tracemalloc.is_tracing()
+    assert report["snapshots"] == 2 and report["traced_bytes"] > 0
+    assert any(site["site"].rsplit(":", 1)[0].endswith("test_memory.py") and site["size_diff_bytes"] >= 1_000_000
+               for site in report["growth_since_start"])
+    assert len(retained) == 100
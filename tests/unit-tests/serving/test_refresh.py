@@ -0,0 +1,104 @@
+# test_refresh.py
+import asyncio
+
+from src.graph.history import ChatHistory
+from src.serving.refresh import HotQuestions, RefreshScheduler, load_seed_questions
+from src.serving.result_cache import ResultCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def fake_clock(monkeypatch, *modules):
+    now = [1000.0]
+    for module in modules:
+        monkeypatch.setattr(f"{module}.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_hot_questions_rank_decayed_counts(monkeypatch):
+    now = fake_clock(monkeypatch, "src.serving.refresh")
+    hot = HotQuestions(top_n=2, min_count=2, half_life_seconds=100)
+    for _ in range(3):
+        hot.record("Where is Tesla HQ?", "balanced")
+    hot.record("where is tesla hq", "balanced")
+    hot.record("Who founded Midas?", "balanced")
+    hot.record("Who founded Midas?", "balanced")
+    hot.record("Where is Tesla HQ?", "fast")
+    assert [(q, p) for q, p, _ in hot.top()] == [("where is tesla hq", "balanced"), ("Who founded Midas?", "balanced")]
+    # Two half-lives later both have decayed below min_count
+    now[0] += 200
+    assert hot.top() == []
+    hot.record("Where is Tesla HQ?", "balanced")
+    assert [round(c, 2) for _, _, c in hot.top()] == [2.0]
+
+
+def test_hot_questions_stay_bounded():
+    hot = HotQuestions(top_n=1, min_count=1, max_tracked=10)
+    for _ in range(5):
+        hot.record("Where is Tesla HQ?", "balanced")
+    for i in range(50):
+        hot.record(f"question {i}", "balanced")
+    assert hot.metrics()["tracked"] <= 10
+    assert hot.top()[0][0] == "Where is Tesla HQ?"
+
+
+def test_seed_file(tmp_path):
+    path = tmp_path / "hot.txt"
+    path.write_text("# hot entities\nWhere is Tesla HQ?\n\nfast: Who founded Midas?\nNote: this is a question\n")
+    assert load_seed_questions(str(path), "balanced", ["balanced", "fast"]) == [
+        ("Where is Tesla HQ?", "balanced"), ("Who founded Midas?", "fast"), ("Note: this is a question", "balanced")]
+    assert load_seed_questions(str(tmp_path / "missing.txt"), "balanced") == []
+
+
+def make_scheduler(cache, answers, capacity=lambda: True):
+    refreshed = []
+
+    async def refresh(question, profile):
+        refreshed.append((question, profile))
+        return cache.put(cache.key(question, ChatHistory(), namespace=profile), question,
+                         {"final_answer": answers.get(question)})
+
+    hot = HotQuestions(top_n=5, min_count=1)
+    return RefreshScheduler(hot, cache, refresh, capacity, ahead_seconds=60), refreshed
+
+
+def test_refreshes_missing_and_expiring_answers_only(monkeypatch):
+    now = fake_clock(monkeypatch, "src.serving.refresh", "src.serving.result_cache")
+    cache = ResultCache(ttl_seconds=600)
+    scheduler, refreshed = make_scheduler(cache, {"Where is Tesla HQ?": "Austin"})
+    scheduler.hot.seed([("Where is Tesla HQ?", "balanced")])
+    assert run(scheduler.run_once()) == 1
+    assert cache.get(cache.key("Where is Tesla HQ?", ChatHistory(), namespace="balanced"))["final_answer"] == "Austin"
+    # Fresh answers are left alone until they are about to expire
+    now[0] += 500
+    assert run(scheduler.run_once()) == 0
+    now[0] += 50
+    assert run(scheduler.run_once()) == 1
+    assert len(refreshed) == 2
+    assert scheduler.metrics()["refreshed"] == 2
+
+
+def test_uncacheable_questions_back_off_for_a_ttl(monkeypatch):
+    now = fake_clock(monkeypatch, "src.serving.refresh", "src.serving.result_cache")
+    cache = ResultCache(ttl_seconds=600)
+    scheduler, refreshed = make_scheduler(cache, {})
+    scheduler.hot.seed([("Tell me about Midas", "balanced")])
+    run(scheduler.run_once())
+    run(scheduler.run_once())
+    assert len(refreshed) == 1 and scheduler.metrics()["uncacheable"] == 1
+    now[0] += 601
+    run(scheduler.run_once())
+    assert len(refreshed) == 2
+
+
+def test_refresh_waits_for_spare_capacity():
+    cache = ResultCache()
+    busy = [True]
+    scheduler, refreshed = make_scheduler(cache, {"Where is Tesla HQ?": "Austin"}, capacity=lambda: not busy[0])
+    scheduler.hot.seed([("Where is Tesla HQ?", "balanced")])
+    assert run(scheduler.run_once()) == 0 and refreshed == []
+    assert scheduler.metrics()["deferred_for_capacity"] == 1
+    busy[0] = False
+    assert run(scheduler.run_once()) == 1
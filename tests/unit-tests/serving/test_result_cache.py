@@ -0,0 +1,68 @@
+# test_result_cache.py
+from src.graph.history import ChatHistory, Sender
+from src.serving.result_cache import ResultCache
+
+RESULT = {"final_answer": "Austin", "wikipedia_docs": [], "session_id": "ignored"}
+
+
+def history_of(*messages):
+    history = ChatHistory()
+    for i, message in enumerate(messages):
+        history.append(Sender.USER if i % 2 == 0 else Sender.BOT, message)
+    return history
+
+
+def test_key_depends_on_normalized_question_and_context():
+    cache = ResultCache()
+    empty = ChatHistory()
+    assert cache.key("Where is Tesla?", empty) == cache.key("  where is TESLA ", empty)
+    assert cache.key("Where is Tesla?", empty) != cache.key("Where is Midas?", empty)
+    assert cache.key("Where is it?", history_of("Tesla?", "Which one?")) != cache.key("Where is it?", empty)
+
+
+def test_key_only_uses_recent_turns():
+    cache = ResultCache(history_turns=2)
+    old = history_of("a", "b", "c", "d")
+    other = history_of("x", "y", "c", "d")
+    assert cache.key("q", old) == cache.key("q", other)
+
+
+def test_retry_keys_on_context_before_first_ask():
+    cache = ResultCache()
+    before = history_of("Hi", "Hello")
+    after = history_of("Hi", "Hello", "Where is Tesla?", "Austin")
+    assert cache.key("Where is Tesla?", after) == cache.key("Where is Tesla?", before)
+
+
+def test_put_get_keeps_only_answer_fields():
+    cache = ResultCache()
+    assert cache.put("k", "q", RESULT)
+    assert cache.get("k") == {"final_answer": "Austin", "wikipedia_docs": []}
+    assert cache.metrics()["hits"] == 1
+
+
+def test_paused_or_empty_results_are_not_cached():
+    cache = ResultCache()
+    assert not cache.put("k", "q", {"final_answer": None})
+    assert not cache.put("k", "q", {"final_answer": "x", "__interrupt__": ["paused"]})
+    assert cache.get("k") is None
+
+
+def test_ttl_and_lru_bounds(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.serving.result_cache.time.monotonic", lambda: now[0])
+    cache = ResultCache(max_entries=2, ttl_seconds=10)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, RESULT)
+    assert cache.get("a") is None and cache.metrics()["evictions"] == 1
+    now[0] += 11
+    assert cache.get("b") is None and cache.metrics()["expirations"] == 1
+
+
+def test_purge_by_question():
+    cache = ResultCache()
+    cache.put("k1", "Where is Tesla?", RESULT)
+    cache.put("k2", "where is tesla", RESULT)
+    cache.put("k3", "Where is Midas?", RESULT)
+    assert cache.purge("WHERE IS TESLA?") == 2
+    assert cache.purge() == 1
@@ -0,0 +1,190 @@
+# test_serve.py
+import pytest
+from fastapi.testclient import TestClient
+
+import serve
+from src.graph.config import GraphConfig
+from src.serving.refresh import HotQuestions
+from src.serving.result_cache import ResultCache
+from src.serving.sessions import SessionStore
+
+
+class FakeChunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeChain:
+    def __init__(self):
+        self.invocations = 0
+
+    def invoke(self, state, config=None):
+        self.invocations += 1
+        return {"final_answer": f"Answer to {state['original_question']}"}
+
+    def stream(self, state, config=None, stream_mode=None):
+        yield "updates", {"retrieve_wikipedia": {"wikipedia_docs": []}}
+        for word in ["Answer ", "to ", state["original_question"]]:
+            yield "messages", (FakeChunk(word), {"langgraph_node": "generate_answer"})
+        yield "messages", (FakeChunk("yes"), {"langgraph_node": "grade_wikipedia"})
+        yield "updates", {"generate_answer": {"final_answer": f"Answer to {state['original_question']}"}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("WARM_UP_CLIENTS", "0")
+    monkeypatch.setattr(serve, "graph_config", GraphConfig.model_validate({"profiles": {"balanced": {}, "fast": {}}}))
+    monkeypatch.setattr(serve, "chain_apps", {"balanced": FakeChain(), "fast": FakeChain()})
+    monkeypatch.setattr(serve, "chat_histories", SessionStore())
+    monkeypatch.setattr(serve, "hot_questions", HotQuestions())
+    monkeypatch.setattr(serve, "result_cache", ResultCache())
+    with TestClient(serve.app) as test_client:
+        yield test_client
+
+
+def chat(client, message, session_id="test-session", **extra):
+    response = client.post("/chat", data={"user_message": message, "session_id": session_id, **extra})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_chat_returns_only_new_turns(client):
+    chat(client, "Where is Tesla?")
+    body = chat(client, "And Midas?")
+    assert body["bot_message"] == "Answer to And Midas?"
+    assert [turn["index"] for turn in body["new_turns"]] == [2, 3]
+    assert [turn["sender"] for turn in body["new_turns"]] == ["User", "Bot"]
+    assert body["turn_count"] == 4
+    assert "chat_history" not in body
+
+
+def test_chat_full_history_on_request(client):
+    chat(client, "Where is Tesla?")
+    body = chat(client, "And Midas?", full_history="true")
+    assert len(body["chat_history"]) == 4
+
+
+def test_history_pagination(client):
+    for i in range(5):
+        chat(client, f"question {i}")
+    page = client.get("/history", params={"session_id": "test-session", "limit": 4}).json()
+    assert [turn["index"] for turn in page["turns"]] == [6, 7, 8, 9]
+    assert page["next_before"] == 6
+    older = client.get("/history", params={"session_id": "test-session", "limit": 4,
+                                           "before": page["next_before"]}).json()
+    assert [turn["index"] for turn in older["turns"]] == [2, 3, 4, 5]
+    oldest = client.get("/history", params={"session_id": "test-session", "limit": 4,
+                                            "before": older["next_before"]}).json()
+    assert [turn["index"] for turn in oldest["turns"]] == [0, 1]
+    assert oldest["next_before"] is None
+
+
+def test_history_of_unknown_session_is_empty(client):
+    body = client.get("/history", params={"session_id": "missing"}).json()
+    assert body["turns"] == [] and body["turn_count"] == 0
+
+
+def receive_until_answer(websocket):
+    frames = []
+    while True:
+        frame = websocket.receive_json()
+        frames.append(frame)
+        if frame["type"] in ("answer", "error"):
+            return frames
+
+
+def test_websocket_streams_progress_tokens_and_answer(client):
+    with client.websocket_connect("/ws/ws-session") as websocket:
+        websocket.send_json({"message": "Where is Tesla?"})
+        frames = receive_until_answer(websocket)
+        websocket.send_json({"message": "And Midas?"})
+        second = receive_until_answer(websocket)
+
+    assert [f["node"] for f in frames if f["type"] == "progress"] == ["retrieve_wikipedia", "generate_answer"]
+    assert "".join(f["content"] for f in frames if f["type"] == "token") == "Answer to Where is Tesla?"
+    assert frames[-1]["bot_message"] == "Answer to Where is Tesla?"
+    assert [turn["index"] for turn in second[-1]["new_turns"]] == [2, 3]
+    assert len(serve.chat_histories["ws-session"]) == 4
+
+
+def test_websocket_rejoins_the_store_after_its_session_is_evicted(client, monkeypatch):
+    monkeypatch.setattr(serve, "chat_histories", SessionStore(max_sessions=1))
+    with client.websocket_connect("/ws/ws-session") as websocket:
+        websocket.send_json({"message": "Where is Tesla?"})
+        receive_until_answer(websocket)
+        # Another session takes the only slot while this connection is idle
+        chat(client, "Hello", session_id="other-session")
+        assert "ws-session" not in serve.chat_histories
+        websocket.send_json({"message": "And Midas?"})
+        receive_until_answer(websocket)
+
+    assert "ws-session" in serve.chat_histories
+    assert len(serve.chat_histories["ws-session"]) == 2
+
+
+def test_websocket_rejects_empty_message(client):
+    with client.websocket_connect("/ws/ws-session") as websocket:
+        websocket.send_json({"message": "   "})
+        assert websocket.receive_json() == {"type": "error", "detail": "Empty message"}
+
+
+def test_retried_question_is_answered_from_cache(client):
+    first = chat(client, "Where is Tesla?")
+    retry = chat(client, "where is tesla")
+    assert not first["cached"] and retry["cached"]
+    assert retry["bot_message"] == "Answer to Where is Tesla?"
+    assert serve.chain_apps["balanced"].invocations == 1
+    # The same question in a new session with the same (empty) context shares the entry
+    assert chat(client, "Where is Tesla?", session_id="other-session")["cached"]
+
+
+def test_chat_runs_requested_profile(client):
+    body = chat(client, "Where is Tesla?", profile="fast")
+    assert body["profile"] == "fast" and not body["cached"]
+    assert serve.chain_apps["fast"].invocations == 1 and serve.chain_apps["balanced"].invocations == 0
+    # Profiles keep their own cached answers
+    assert not chat(client, "Where is Tesla?")["cached"]
+    assert chat(client, "Where is Tesla?", session_id="other", profile="fast")["cached"]
+
+
+def test_chat_rejects_unknown_profile(client):
+    response = client.post("/chat", data={"user_message": "Hi", "session_id": "s", "profile": "turbo"})
+    assert response.status_code == 400
+    assert "balanced, fast" in response.json()["detail"]
+
+
+def test_admin_cache_purge_requires_token(client, monkeypatch):
+    chat(client, "Where is Tesla?")
+    monkeypatch.setattr(serve, "ADMIN_TOKEN", "secret")
+    assert client.delete("/admin/cache").status_code == 403
+    assert client.delete("/admin/cache", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.delete("/admin/cache", headers={"X-Admin-Token": "secret"})
+    assert response.json() == {"purged": 1}
+    assert not chat(client, "Where is Tesla?")["cached"]
+
+
+def test_debug_memory_reports_sessions(client, monkeypatch):
+    chat(client, "Where is Tesla?", session_id="s1")
+    chat(client, "And Midas?", session_id="s2")
+    assert client.get("/debug/memory").status_code == 403
+    monkeypatch.setattr(serve, "ADMIN_TOKEN", "secret")
+    report = client.get("/debug/memory", params={"top": 1}, headers={"X-Admin-Token": "secret"}).json()
+    assert report["sessions"]["count"] == 2 and len(report["sessions"]["largest"]) == 1
+    assert report["sessions"]["store"]["sessions"] == 2
+    assert "rss_bytes" in report and report["result_cache_entries"] == 2
+
+
+def test_hot_first_questions_are_refreshed_into_the_cache(client):
+    # Counts decay from the first ask on, so it takes a fourth ask to reach the minimum count of 3
+    for session_id in ("s1", "s2", "s3", "s4"):
+        chat(client, "Where is Tesla?", session_id=session_id)
+    # Follow-up questions depend on their conversation and are not tracked
+    chat(client, "And Midas?", session_id="s1")
+    assert [question for question, _, _ in serve.hot_questions.top()] == ["Where is Tesla?"]
+    serve.result_cache.purge()
+    assert client.portal.call(serve.refresher.run_once) == 1
+    chain = serve.chain_apps["balanced"]
+    invocations = chain.invocations
+    assert chat(client, "Where is Tesla?", session_id="s5")["cached"]
+    assert chain.invocations == invocations
+    assert client.get("/metrics").json()["refresh"]["refreshed"] == 1
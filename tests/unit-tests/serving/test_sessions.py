@@ -0,0 +1,55 @@
+# test_sessions.py
+from src.graph.history import ChatHistory, Sender
+from src.serving.sessions import SessionStore
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2, idle_ttl_seconds=0)
+    store["a"] = ChatHistory()
+    store.setdefault("b", ChatHistory()).append(Sender.USER, "hi")
+    # Reading "a" makes "b" the least recently used
+    assert store.get("a") is not None
+    store["c"] = ChatHistory()
+    assert "b" not in store and "a" in store and "c" in store
+    assert store.get("b") is None
+    assert store.metrics()["evicted"] == 1
+
+
+def test_idle_sessions_expire(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("src.serving.sessions.time.monotonic", lambda: now[0])
+    store = SessionStore(max_sessions=10, idle_ttl_seconds=60)
+    store["old"] = ChatHistory()
+    now[0] = 50
+    store["new"] = ChatHistory()
+    now[0] = 100
+    history = store.setdefault("new", ChatHistory())
+    assert len(store) == 1 and "old" not in store
+    assert store["new"] is history
+    assert store.metrics()["expired"] == 1
+
+
+def test_setdefault_keeps_existing_history():
+    store = SessionStore()
+    history = store.setdefault("s", ChatHistory())
+    history.append(Sender.USER, "hi")
+    assert store.setdefault("s", ChatHistory()) is history
+    assert [session_id for session_id, _ in store.items()] == ["s"]
+
+
+def test_dropped_sessions_are_reported_outside_the_lock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("src.serving.sessions.time.monotonic", lambda: now[0])
+    dropped = []
+
+    def on_evict(session_id):
+        # The store is usable from the callback, so the lock has been released
+        dropped.append((session_id, len(store)))
+
+    store = SessionStore(max_sessions=2, idle_ttl_seconds=60, on_evict=on_evict)
+    store["a"] = ChatHistory()
+    store["b"] = ChatHistory()
+    store["c"] = ChatHistory()
+    now[0] = 100
+    store.get("d")
+    assert dropped == [("a", 2), ("b", 0), ("c", 0)]
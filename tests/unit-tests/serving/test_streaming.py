@@ -0,0 +1,51 @@
+# test_streaming.py
+import asyncio
+import threading
+import time
+from contextlib import aclosing
+
+import pytest
+
+from src.serving.streaming import stream_in_thread
+
+
+def test_items_and_errors_are_forwarded():
+    def numbers():
+        yield 1
+        yield 2
+        raise ValueError("boom")
+
+    async def consume(seen):
+        async for item in stream_in_thread(numbers):
+            seen.append(item)
+
+    seen = []
+    with pytest.raises(ValueError):
+        asyncio.run(consume(seen))
+    assert seen == [1, 2]
+
+
+def test_closing_early_stops_the_worker_and_waits_for_it():
+    events = []
+
+    def steps():
+        try:
+            for step in range(100):
+                events.append(("step", step, threading.current_thread().name))
+                time.sleep(0.01)
+                yield step
+        finally:
+            events.append(("closed",))
+
+    async def consume_one():
+        async with aclosing(stream_in_thread(steps)) as stream:
+            async for _ in stream:
+                break
+        # The worker has finished by the time the iterator is closed
+        return list(events)
+
+    seen = asyncio.run(consume_one())
+    assert seen[-1] == ("closed",)
+    assert len(seen) < 10
+    # The worker runs on the shared threadpool rather than a thread of its own
+    assert not seen[0][2].startswith("graph-stream")